@@ -9,29 +9,72 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 
 
 import os
-from apps.chatbot.output.routing import websocket_urlpatterns
-from apps.chatbot.output.realtime_message_queue import RealtimeMessageQueryJobTask
-from apps.chatbot.chat.chat_history_queue import ChatHistoryMessageQueryJobTask
-from apps.chatbot.insight.insight_message_queue import InsightMessageQueryJobTask
-from apps.chatbot.insight.bilibili.bili_live_client import bili_live_client_main
-from apps.chatbot.schedule.Idle_schedule import run_idle_action_job,idle_action_job
+from apps.chatbot.utils.startup_profiler import StartupProfiler
 from channels.auth import AuthMiddlewareStack
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.security.websocket import AllowedHostsOriginValidator
 from django.core.asgi import get_asgi_application
-from django.urls import path
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'VirtualWife.settings')
 
-bili_live_client_main()
-# run_idle_action_job(15, idle_action_job)
-RealtimeMessageQueryJobTask.start()
-ChatHistoryMessageQueryJobTask.start()
-InsightMessageQueryJobTask.start()
+startup_profiler = StartupProfiler()
 
 # Initialize Django ASGI application early to ensure the AppRegistry
 # is populated before importing code that may import ORM models.
-django_asgi_app = get_asgi_application()
+with startup_profiler.phase("django"):
+    django_asgi_app = get_asgi_application()
+
+# 加载系统配置，大语言模型和长期记忆等重量级模块会懒加载到第一次使用
+with startup_profiler.phase("sys_config"):
+    from apps.chatbot.config import singleton_sys_config
+
+with startup_profiler.phase("job_queues"):
+    from apps.chatbot.output.realtime_message_queue import RealtimeMessageQueryJobTask
+    from apps.chatbot.chat.chat_history_queue import ChatHistoryMessageQueryJobTask
+    from apps.chatbot.insight.insight_message_queue import InsightMessageQueryJobTask
+    from apps.chatbot.memory.local.tag_extraction_queue import TagExtractionJobTask
+    RealtimeMessageQueryJobTask.start()
+    ChatHistoryMessageQueryJobTask.start()
+    InsightMessageQueryJobTask.start()
+    TagExtractionJobTask.start()
+
+with startup_profiler.phase("scheduler"):
+    # 所有周期任务共用一个调度线程
+    from apps.chatbot.schedule.scheduler import singleton_job_scheduler
+    singleton_job_scheduler.start()
+
+    # 定期清理过期的短期记忆并合并WAL文件，MEMORY_RETENTION_MAX_ROWS=0 时只合并不清理
+    from apps.chatbot.schedule.memory_retention import MemoryRetentionJobTask
+    MemoryRetentionJobTask.start(interval=float(os.environ.get("MEMORY_RETENTION_INTERVAL", "3600")),
+                                 max_rows=int(os.environ.get("MEMORY_RETENTION_MAX_ROWS", "2000")))
+
+    # 定期清理过期的大语言模型响应缓存
+    from apps.chatbot.llms.llm_response_cache import LlmCacheEvictionJobTask
+    LlmCacheEvictionJobTask.start(interval=float(os.environ.get("LLM_CACHE_EVICT_INTERVAL", "600")))
+
+    # 根据新增的长期记忆定期生成反思，未开启反思或长期记忆时任务直接返回
+    from apps.chatbot.reflection.reflection_generation import ReflectionJobTask
+    ReflectionJobTask.start(interval=float(os.environ.get("REFLECTION_INTERVAL", "1800")))
+
+    # 闲置动作，IDLE_ACTION_INTERVAL=0 时关闭
+    idle_action_interval = float(os.environ.get("IDLE_ACTION_INTERVAL", "0"))
+    if idle_action_interval > 0:
+        from apps.chatbot.schedule.Idle_schedule import IdleActionJobTask
+        IdleActionJobTask.start(interval=idle_action_interval, jitter=idle_action_interval * 0.2)
+
+with startup_profiler.phase("bilibili"):
+    from apps.chatbot.insight.bilibili.bili_live_client import bili_live_client_main
+    bili_live_client_main()
+
+with startup_profiler.phase("routing"):
+    from apps.chatbot.output.routing import websocket_urlpatterns
+
+startup_profiler.report()
+
+# 服务启动后在后台预热懒加载的模块，STARTUP_WARMUP=false 可关闭
+if os.environ.get("STARTUP_WARMUP", "true").lower() == "true":
+    from apps.chatbot.schedule.warmup import WarmupJobTask
+    WarmupJobTask.start(delay=float(os.environ.get("STARTUP_WARMUP_DELAY", "3")))
 
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
@@ -39,5 +82,3 @@ application = ProtocolTypeRouter({
             AuthMiddlewareStack(URLRouter(websocket_urlpatterns))
         ),
 })
-
-
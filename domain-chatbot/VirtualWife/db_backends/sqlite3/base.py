@@ -0,0 +1,27 @@
+"""
+SQLite backend that applies connection PRAGMAs.
+
+Every new connection runs the PRAGMAs from the optional ``PRAGMAS`` key of
+the database settings, merged over ``DEFAULT_PRAGMAS``.
+"""
+
+from django.db.backends.sqlite3 import base
+
+# WAL模式下读写互不阻塞，synchronous=NORMAL在WAL模式下不会损坏数据库
+DEFAULT_PRAGMAS = {
+    "journal_mode": "wal",
+    "synchronous": "normal",
+    "busy_timeout": 5000,
+    "mmap_size": 128 * 1024 * 1024,
+    "temp_store": "memory",
+}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        pragmas = {**DEFAULT_PRAGMAS, **self.settings_dict.get("PRAGMAS", {})}
+        for name, value in pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        return conn
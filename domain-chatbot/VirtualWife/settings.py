@@ -94,8 +94,14 @@ WSGI_APPLICATION = 'VirtualWife.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # 在sqlite3的基础上为每个连接设置PRAGMA，见 VirtualWife/db_backends/sqlite3/base.py
+        'ENGINE': 'VirtualWife.db_backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db', 'db.sqlite3'),  # 指定数据库文件在 db 子目录下
+        # 默认值见 DEFAULT_PRAGMAS，这里只覆盖通过环境变量指定的项
+        'PRAGMAS': {name: int(os.environ[env]) for name, env in (
+            ('busy_timeout', 'SQLITE_BUSY_TIMEOUT'),
+            ('mmap_size', 'SQLITE_MMAP_SIZE'),
+        ) if os.environ.get(env)},
     }
 }
 
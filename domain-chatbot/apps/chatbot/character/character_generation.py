@@ -1,5 +1,7 @@
 
 
+import string
+import threading
 from django.shortcuts import get_object_or_404
 from ..models import CustomRoleModel
 # from .character_template_en import EnglishCharacterTemplate
@@ -9,6 +11,35 @@ from .character import Character
 from .sys.aili_zh import aili_zh
 
 
+class CompiledPrompt():
+    '''预编译的角色prompt
+
+    角色定义部分在编译时已经填充，只保留每轮对话需要填充的变量（you_name、long_history、current_time、
+    examples_of_dialogue），每轮对话只需要按顺序拼接片段，不需要重新解析整个模版。
+    对话样例在运行时填充，方便按token预算裁剪
+    '''
+    segments: list[tuple[str, str]]
+
+    def __init__(self, template: str) -> None:
+        self.segments = [(literal_text, field_name)
+                         for literal_text, field_name, _, _ in string.Formatter().parse(template)]
+
+    def format(self, **kwargs) -> str:
+        parts = []
+        for literal_text, field_name in self.segments:
+            parts.append(literal_text)
+            if field_name is not None:
+                parts.append(str(kwargs[field_name]))
+        return "".join(parts)
+
+
+def format_examples_of_dialogue(examples_of_dialogue: str, role_name: str, you_name: str) -> str:
+    '''对话样例中的{role_name}、{you_name}替换为实际名称，其他花括号原样保留'''
+    if not examples_of_dialogue:
+        return ""
+    return examples_of_dialogue.replace("{role_name}", role_name).replace("{you_name}", you_name)
+
+
 class CharacterGeneration():
 
     character_template_dict: dict[str, BaseCharacterTemplate] = {}
@@ -19,6 +50,51 @@ class CharacterGeneration():
         # self.character_template_dict["en"] = EnglishCharacterTemplate()
         self.character_template_dict["zh"] = ChineseCharacterTemplate()
 
+        # 角色prompt缓存：role_id => (版本号, 角色定义, 预编译prompt)
+        self._prompt_cache: dict[int, tuple[tuple[int, int], Character, CompiledPrompt]] = {}
+        self._versions: dict[int, int] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get_character_prompt(self, role_id: int) -> tuple[Character, CompiledPrompt]:
+        '''获取角色定义对象和预编译的角色prompt，角色未修改时不会访问数据库'''
+        role_id = int(role_id)
+        version = self._get_version(role_id)
+        cached = self._prompt_cache.get(role_id)
+        if cached is not None and cached[0] == version:
+            return cached[1], cached[2]
+
+        character = self.get_character(role_id)
+        # 对话样例保留为占位符，由PromptAssembler按token预算填充
+        template_character = Character(
+            role_name=character.role_name,
+            persona=character.persona,
+            personality=character.personality,
+            scenario=character.scenario,
+            examples_of_dialogue="{examples_of_dialogue}",
+            custom_role_template_type=character.custom_role_template_type
+        )
+        compiled_prompt = CompiledPrompt(self.output_prompt(template_character))
+        with self._lock:
+            # 构建期间角色被修改过则不写入缓存
+            if self._get_version(role_id) == version:
+                self._prompt_cache[role_id] = (version, character, compiled_prompt)
+        return character, compiled_prompt
+
+    def invalidate(self, role_id: int = None) -> None:
+        '''角色被新增、修改、删除后使缓存失效，role_id为空时清空全部缓存'''
+        with self._lock:
+            if role_id is None:
+                self._generation += 1
+                self._prompt_cache.clear()
+            else:
+                role_id = int(role_id)
+                self._versions[role_id] = self._versions.get(role_id, 0) + 1
+                self._prompt_cache.pop(role_id, None)
+
+    def _get_version(self, role_id: int) -> tuple[int, int]:
+        return (self._generation, self._versions.get(role_id, 0))
+
     def get_character(self, role_id: int) -> Character:
         '''获取角色定义对象'''
         character = None
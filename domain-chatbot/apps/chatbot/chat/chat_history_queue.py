@@ -2,14 +2,19 @@
 import logging
 import queue
 import threading
+import time
 import traceback
 from ..config import singleton_sys_config
+from ..utils.tracing import singleton_tracer
 
 logger = logging.getLogger(__name__)
 
 # 创建一个线程安全的优先级队列
 chat_history_queue = queue.SimpleQueue()
 
+# 单个事务最多写入的对话数
+BATCH_SIZE = 32
+
 
 class ChatHistoryMessage():
     '''定义聊天历史消息队列'''
@@ -17,12 +22,16 @@ class ChatHistoryMessage():
     role_message: str
     you_name: str
     you_message: str
+    # 所属对话的追踪id
+    turn_id: str
 
-    def __init__(self, role_name: str, role_message: str, you_name: str, you_message: str) -> None:
+    def __init__(self, role_name: str, role_message: str, you_name: str, you_message: str, turn_id: str = None) -> None:
         self.role_name = role_name
         self.role_message = role_message
         self.you_name = you_name
         self.you_message = you_message
+        self.turn_id = turn_id
+        self.enqueue_time = time.perf_counter()
 
     def to_dict(self):
         return {
@@ -41,13 +50,35 @@ def put_message(message: ChatHistoryMessage):
 def send_message():
     global chat_history_queue
     while True:
+        messages = []
         try:
-            message = chat_history_queue.get()
-            if (message != None and message != ''):
-                singleton_sys_config.memory_storage_driver.save(
-                    message.you_name, message.you_message, message.role_name, message.role_message)
+            messages = [chat_history_queue.get()]
+            # 取出队列中已有的消息，合并到一个事务中写入
+            while len(messages) < BATCH_SIZE:
+                try:
+                    messages.append(chat_history_queue.get_nowait())
+                except queue.Empty:
+                    break
+            messages = [message for message in messages if message != None and message != '']
+            for message in messages:
+                singleton_tracer.record("history.queue_wait", time.perf_counter() - message.enqueue_time,
+                                        turn_id=message.turn_id)
+            histories = [{
+                "you_name": message.you_name,
+                "query_text": message.you_message,
+                "role_name": message.role_name,
+                "answer_text": message.role_message
+            } for message in messages]
+            if len(histories) > 0:
+                with singleton_tracer.span("history.save", batch_size=len(histories),
+                                           turn_ids=[message.turn_id for message in messages]):
+                    failed = singleton_sys_config.runtime().memory_storage_driver.save_batch(histories)
+                if len(failed) > 0:
+                    logger.error(f"save chat history failed # turn_ids:{[messages[i].turn_id for i in failed]} #")
         except Exception as e:
             traceback.print_exc()
+            logger.error(f"save chat history error # turn_ids:{[message.turn_id for message in messages]} # %s"
+                         % str(e))
 
 
 def conversation_end_callback(role_name: str,  role_message: str, you_name: str, you_message: str):
@@ -55,7 +86,8 @@ def conversation_end_callback(role_name: str,  role_message: str, you_name: str,
         role_name=role_name,
         role_message=role_message,
         you_name=you_name,
-        you_message=you_message
+        you_message=you_message,
+        turn_id=singleton_tracer.current_turn_id()
     ))
 
 
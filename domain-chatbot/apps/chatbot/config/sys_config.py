@@ -1,6 +1,10 @@
+import contextvars
+import copy
 import json
 import logging
 import os
+import threading
+from contextlib import contextmanager
 from ..llms.llm_model_strategy import LlmModelDriver
 from ..models import CustomRoleModel, SysConfigModel
 from ..character.sys.aili_zh import aili_zh
@@ -27,25 +31,117 @@ def lazy_memory_storage(sys_config_json: any, sys_cofnig: any):
     return MemoryStorageDriver(memory_storage_config=memory_storage_config, sys_config=sys_cofnig)
 
 
-class SysConfig():
+class RuntimeConfig():
+    '''load()构建的运行时配置，创建后不可修改
+
+    load()每次构建一个新对象并整体替换，一轮对话或一次任务开始时获取一次，之后全部从这个对象读取，
+    不会读到新旧两份配置各一半的状态
+    '''
 
+    character: int
+    yourName: str
     llm_model_driver: LlmModelDriver
     conversation_llm_model_driver_type: str
+    prompt_token_budget: int = 1536
     enable_summary: bool
     enable_longMemory: bool
+    enable_short_memory_relevance: bool = False
+    enable_keyword_memory: bool = False
     summary_llm_model_driver_type: str
     enable_reflection: bool
     reflection_llm_model_driver_type: str
     memory_storage_driver: any
-    character: int
-    your_name: str
-    room_id: str
     local_memory_num: int = 5
+    # 构建这份配置的系统配置，重新加载时用于比较哪些模块需要重建
+    sys_config_json: any
+
+    def __init__(self, **fields) -> None:
+        for name, value in fields.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name: str, value: any) -> None:
+        raise AttributeError("RuntimeConfig is immutable")
+
+
+# 当前对话使用的运行时配置，use_runtime()中设置，流式回调中也能取到
+current_runtime_config: contextvars.ContextVar[RuntimeConfig] = contextvars.ContextVar(
+    "current_runtime_config", default=None)
+
+
+class SysConfig():
 
     def __init__(self) -> None:
+        # 配置快照：get() 从内存读取，save() 后更新，version在每次更新后递增
+        self._snapshot = None
+        self._version = 0
+        self._snapshot_lock = threading.Lock()
+        # SYS_CONFIG_WATCH_FILE=true 时以sys_config.json为准：读取时写回数据库，保存时同时写入文件，
+        # 文件被修改后重新加载快照并调用load()重建发生变化的模块
+        self._watch_file = os.environ.get("SYS_CONFIG_WATCH_FILE", "false").lower() == "true"
+        self._file_mtime = None
+        # 当前的运行时配置，load()构建完成后一次赋值替换
+        self._runtime: RuntimeConfig = None
+        # 串行化重新加载，并发的load()不会基于同一份旧配置构建而丢失其中一次的结果
+        # load()读取配置时可能因为文件变化再次触发load()，使用可重入锁
+        self._reload_lock = threading.RLock()
         self.load()
 
+    def runtime(self) -> RuntimeConfig:
+        '''获取运行时配置，在use_runtime()中时返回本轮对话开始时的配置'''
+        runtime_config = current_runtime_config.get()
+        if runtime_config is not None:
+            return runtime_config
+        if self._watch_file:
+            # 文件被修改时由snapshot()触发重新加载
+            self.snapshot()
+        return self._runtime
+
+    @contextmanager
+    def use_runtime(self):
+        '''固定一轮对话或一次任务使用的运行时配置，期间重新加载配置不影响已经开始的对话'''
+        token = current_runtime_config.set(self.runtime())
+        try:
+            yield current_runtime_config.get()
+        finally:
+            current_runtime_config.reset(token)
+
+    @property
+    def version(self) -> int:
+        '''配置版本号，配置更新后递增，热点代码可以据此判断是否需要刷新本地缓存'''
+        return self._version
+
     def get(self):
+        '''获取配置的副本，调用方可以任意修改'''
+        return copy.deepcopy(self.snapshot())
+
+    def snapshot(self):
+        '''获取配置快照，不复制，调用方不能修改返回的对象'''
+        snapshot = self._snapshot
+        if snapshot is not None and not self._file_changed():
+            return snapshot
+        reload = False
+        with self._snapshot_lock:
+            if self._snapshot is None or self._file_changed():
+                file_mtime = self._get_file_mtime()
+                sys_config_json, cacheable = self._read()
+                if not cacheable:
+                    # 数据库不可用时返回文件中的配置但不缓存，下次重新读取
+                    return sys_config_json
+                # 第一次加载由构造函数调用load()，文件修改后的重新加载在这里触发
+                reload = self._snapshot is not None
+                self._file_mtime = file_mtime
+                self._set_snapshot(sys_config_json)
+            snapshot = self._snapshot
+        if reload:
+            logger.info("=> sys_config.json changed, reload SysConfig")
+            self.load()
+        return snapshot
+
+    def _file_changed(self) -> bool:
+        return self._watch_file and self._get_file_mtime() != self._file_mtime
+
+    def _read(self) -> tuple[any, bool]:
+        '''读取配置，返回 (配置, 是否可以缓存)，数据库读取失败时返回文件中的配置且不可缓存'''
         sys_config_obj = None
         sys_config_json = "{}"
         with open(config_path, 'r') as f:
@@ -60,40 +156,79 @@ class SysConfig():
                     config=json.dumps(sys_config_json)
                 )
                 sys_config_model.save()
+            elif self._watch_file:
+                # 监听文件时以文件为准，文件内容写回数据库
+                if json.loads(sys_config_obj.config) != sys_config_json:
+                    logger.debug("=> write sys_config.json through to db")
+                    sys_config_obj.config = json.dumps(sys_config_json)
+                    sys_config_obj.save()
             else:
                 sys_config_json = json.loads(sys_config_obj.config)
         except Exception as e:
-            logger.debug("=> load sys config error: %s" % str(e))
-        return sys_config_json
+            logger.warning("=> load sys config error: %s" % str(e))
+            return sys_config_json, False
+        return sys_config_json, True
+
+    def _set_snapshot(self, sys_config_json: any):
+        self._snapshot = sys_config_json
+        self._version += 1
+
+    def _get_file_mtime(self):
+        try:
+            return os.stat(config_path).st_mtime_ns
+        except OSError:
+            return None
 
     def save(self, sys_config_json: any):
         sys_config_obj = SysConfigModel.objects.get(code=sys_code)
         sys_config_obj.config = json.dumps(sys_config_json)
         sys_config_obj.save()
+        with self._snapshot_lock:
+            if self._watch_file:
+                # 同时写入文件，文件修改时间更新后不会再触发重新加载
+                with open(config_path, 'w', encoding='utf-8') as f:
+                    json.dump(sys_config_json, f, ensure_ascii=False)
+                self._file_mtime = self._get_file_mtime()
+            self._set_snapshot(copy.deepcopy(sys_config_json))
 
     def load(self):
+        '''加载配置，与上一次加载的配置比较，只重建发生变化的模块
+
+        新模块全部构建完成后构建新的RuntimeConfig并一次替换，对话和任务通过use_runtime()固定使用同一份配置
+        '''
+        with self._reload_lock:
+            self._load()
 
+    def _load(self):
         logger.debug(
             "======================== Load SysConfig ========================")
 
         sys_config_json = self.get()
+        old_runtime = self._runtime
+        old_config_json = old_runtime.sys_config_json if old_runtime is not None else None
+
+        def changed(*keys) -> bool:
+            if old_config_json is None:
+                return True
+            return any(old_config_json.get(key) != sys_config_json.get(key) for key in keys)
 
         # 初始化默认角色
-        try:
-            result = CustomRoleModel.objects.all()
-            if len(result) == 0:
-                logger.debug("=> load default character")
-                custom_role = CustomRoleModel(
-                    role_name=aili_zh.role_name,
-                    persona=aili_zh.persona,
-                    personality=aili_zh.personality,
-                    scenario=aili_zh.scenario,
-                    examples_of_dialogue=aili_zh.examples_of_dialogue,
-                    custom_role_template_type=aili_zh.custom_role_template_type
-                )
-                custom_role.save()
-        except Exception as e:
-            logger.debug("=> load default character ERROR: %s" % str(e))
+        if old_config_json is None:
+            try:
+                result = CustomRoleModel.objects.all()
+                if len(result) == 0:
+                    logger.debug("=> load default character")
+                    custom_role = CustomRoleModel(
+                        role_name=aili_zh.role_name,
+                        persona=aili_zh.persona,
+                        personality=aili_zh.personality,
+                        scenario=aili_zh.scenario,
+                        examples_of_dialogue=aili_zh.examples_of_dialogue,
+                        custom_role_template_type=aili_zh.custom_role_template_type
+                    )
+                    custom_role.save()
+            except Exception as e:
+                logger.debug("=> load default character ERROR: %s" % str(e))
 
         # 加载角色配置
         character = sys_config_json["characterConfig"]["character"]
@@ -101,66 +236,100 @@ class SysConfig():
         logger.debug("=> character Config")
         logger.debug(f"character:{character}")
         logger.debug(f"yourName:{yourName}")
-        self.character = character
-        self.yourName = yourName
-
-        # 加载大语言模型配置
-        os.environ['OPENAI_API_KEY'] = sys_config_json["languageModelConfig"]["openai"]["OPENAI_API_KEY"]
-        os.environ['OPENAI_BASE_URL'] = sys_config_json["languageModelConfig"]["openai"]["OPENAI_BASE_URL"]
-        os.environ['TEXT_GENERATION_API_URL'] = sys_config_json["languageModelConfig"]["textGeneration"]["TEXT_GENERATION_API_URL"]
-        os.environ['TEXT_GENERATION_WEB_SOCKET_URL'] = sys_config_json["languageModelConfig"]["textGeneration"].get(
-            "TEXT_GENERATION_WEB_SOCKET_URL", "ws://127.0.0.1:5005/api/v1/stream")
-
-        # 是否开启proxy
-        enableProxy = sys_config_json["enableProxy"]
-        logger.debug("=> Proxy Config ")
-        logger.debug(f"enableProxy:{enableProxy}")
-        if enableProxy:
-            os.environ['HTTP_PROXY'] = sys_config_json["httpProxy"]
-            os.environ['HTTPS_PROXY'] = sys_config_json["httpsProxy"]
-            os.environ['SOCKS5_PROXY'] = sys_config_json["socks5Proxy"]
-            logger.debug(f"=> HTTP_PROXY:" + os.environ['HTTP_PROXY'])
-            logger.debug(f"=> HTTPS_PROXY:"+os.environ['HTTPS_PROXY'])
-            logger.debug(f"=> SOCKS5_PROXY:"+os.environ['SOCKS5_PROXY'])
-        else:
-            os.environ['HTTP_PROXY'] = ""
-            os.environ['HTTPS_PROXY'] = ""
-            os.environ['SOCKS5_PROXY'] = ""
+
+        # 大语言模型配置或代理配置变化时才重建大语言模型驱动
+        llm_model_driver = old_runtime.llm_model_driver if old_runtime is not None else None
+        if changed("languageModelConfig", "enableProxy", "httpProxy", "httpsProxy", "socks5Proxy"):
+            # 加载大语言模型配置，直接传入驱动，不修改进程的环境变量
+            language_model_config = copy.deepcopy(sys_config_json["languageModelConfig"])
+            language_model_config["textGeneration"].setdefault(
+                "TEXT_GENERATION_WEB_SOCKET_URL", "ws://127.0.0.1:5005/api/v1/stream")
+
+            # 是否开启proxy
+            enableProxy = sys_config_json["enableProxy"]
+            logger.debug("=> Proxy Config ")
+            logger.debug(f"enableProxy:{enableProxy}")
+            proxies = {}
+            if enableProxy:
+                proxies = {
+                    "http": sys_config_json["httpProxy"],
+                    "https": sys_config_json["httpsProxy"],
+                    "socks5": sys_config_json["socks5Proxy"]
+                }
+                logger.debug(f"=> HTTP_PROXY:" + proxies["http"])
+                logger.debug(f"=> HTTPS_PROXY:" + proxies["https"])
+                logger.debug(f"=> SOCKS5_PROXY:" + proxies["socks5"])
+
+            logger.debug("=> Reload LlmModelDriver")
+            llm_model_driver = LlmModelDriver(language_model_config=language_model_config, proxies=proxies)
 
         # 加载对话模块配置
         logger.debug("=> Chat Config")
-        self.llm_model_driver = LlmModelDriver()
-        self.conversation_llm_model_driver_type = sys_config_json[
+        conversation_llm_model_driver_type = sys_config_json[
             "conversationConfig"]["languageModel"]
         logger.debug(f"conversation_llm_model_driver_type:" +
-                     self.conversation_llm_model_driver_type)
+                     conversation_llm_model_driver_type)
+        prompt_token_budget = int(sys_config_json["conversationConfig"].get(
+            "promptTokenBudget", RuntimeConfig.prompt_token_budget))
+        logger.debug(f"prompt_token_budget:{prompt_token_budget}")
 
         # 是否开启记忆摘要
         logger.debug("=> Memory Config")
-        self.enable_summary = sys_config_json["memoryStorageConfig"]["enableSummary"]
-        self.enable_longMemory = sys_config_json["memoryStorageConfig"]["enableLongMemory"]
-        logger.debug("=> enable_longMemory："+str(self.enable_longMemory))
-        logger.debug("=> enable_summary："+str(self.enable_summary))
-        if (self.enable_summary):
-            self.summary_llm_model_driver_type = sys_config_json[
-                "memoryStorageConfig"]["languageModelForSummary"]
+        memory_storage_config_json = sys_config_json["memoryStorageConfig"]
+        enable_summary = memory_storage_config_json["enableSummary"]
+        enable_longMemory = memory_storage_config_json["enableLongMemory"]
+        enable_short_memory_relevance = memory_storage_config_json.get(
+            "enableShortMemoryRelevance", RuntimeConfig.enable_short_memory_relevance)
+        enable_keyword_memory = memory_storage_config_json.get(
+            "enableKeywordMemory", RuntimeConfig.enable_keyword_memory)
+        logger.debug("=> enable_longMemory："+str(enable_longMemory))
+        logger.debug("=> enable_keyword_memory："+str(enable_keyword_memory))
+        logger.debug("=> enable_short_memory_relevance："+str(enable_short_memory_relevance))
+        logger.debug("=> enable_summary："+str(enable_summary))
+        summary_llm_model_driver_type = old_runtime.summary_llm_model_driver_type if old_runtime is not None else None
+        if (enable_summary):
+            summary_llm_model_driver_type = memory_storage_config_json["languageModelForSummary"]
             logger.debug("=> summary_llm_model_driver_type：" +
-                         self.summary_llm_model_driver_type)
+                         summary_llm_model_driver_type)
 
-        self.enable_reflection = sys_config_json["memoryStorageConfig"]["enableReflection"]
-        logger.debug("=> enableReflection："+str(self.enable_reflection))
-        if (self.enable_reflection):
-            self.reflection_llm_model_driver_type = sys_config_json[
-                "memoryStorageConfig"]["languageModelForReflection"]
-            logger.debug("=> reflection_llm_model_driver_type" +
-                         self.summary_llm_model_driver_type)
+        enable_reflection = memory_storage_config_json["enableReflection"]
+        logger.debug("=> enableReflection："+str(enable_reflection))
+        reflection_llm_model_driver_type = old_runtime.reflection_llm_model_driver_type \
+            if old_runtime is not None else None
+        if (enable_reflection):
+            reflection_llm_model_driver_type = memory_storage_config_json["languageModelForReflection"]
+            logger.debug("=> reflection_llm_model_driver_type：" +
+                         reflection_llm_model_driver_type)
 
-        # 懒加载记忆模块
-        try:
-            self.memory_storage_driver = lazy_memory_storage(
-                sys_config_json=sys_config_json, sys_cofnig=self)
-        except Exception as e:
-            logger.error("init memory_storage error: %s" % str(e))
+        # 向量数据库配置或长期记忆开关变化时才重建记忆模块，记忆模块本身是懒加载的
+        memory_storage_driver = old_runtime.memory_storage_driver if old_runtime is not None else None
+        old_memory_storage_config_json = old_config_json["memoryStorageConfig"] if old_config_json is not None else {}
+        if (memory_storage_driver is None
+                or old_memory_storage_config_json.get("milvusMemory") != memory_storage_config_json.get("milvusMemory")
+                or old_memory_storage_config_json.get("enableLongMemory") != enable_longMemory):
+            try:
+                memory_storage_driver = lazy_memory_storage(
+                    sys_config_json=sys_config_json, sys_cofnig=self)
+            except Exception as e:
+                logger.error("init memory_storage error: %s" % str(e))
+
+        # 新模块构建完成后一次赋值替换，读取方要么看到完整的旧配置，要么看到完整的新配置
+        self._runtime = RuntimeConfig(
+            character=character,
+            yourName=yourName,
+            llm_model_driver=llm_model_driver,
+            conversation_llm_model_driver_type=conversation_llm_model_driver_type,
+            prompt_token_budget=prompt_token_budget,
+            enable_summary=enable_summary,
+            enable_longMemory=enable_longMemory,
+            enable_short_memory_relevance=enable_short_memory_relevance,
+            enable_keyword_memory=enable_keyword_memory,
+            summary_llm_model_driver_type=summary_llm_model_driver_type,
+            enable_reflection=enable_reflection,
+            reflection_llm_model_driver_type=reflection_llm_model_driver_type,
+            memory_storage_driver=memory_storage_driver,
+            sys_config_json=sys_config_json
+        )
 
         logger.info("=> Load SysConfig Success")
 
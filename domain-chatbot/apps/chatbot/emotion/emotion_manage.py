@@ -64,7 +64,7 @@ class EmotionRecognition():
         prompt = self.input_prompt.format(
             input=f"{you_name}说{query}")+self.output_prompt
         result = self.llm_model_driver.chat(
-            prompt=prompt, type=self.llm_model_driver_type, role_name="", you_name="", query="", short_history=[], long_history="")
+            prompt=prompt, type=self.llm_model_driver_type, role_name="", you_name="", query="", short_history=[], long_history="", cache=True)
         logger.debug(f"=> recognition:{result}")
         start_idx = result.find('{')
         end_idx = result.rfind('}')
@@ -163,7 +163,7 @@ class GenerationEmote():
     def generation_emote(self, query: str) -> str:
         prompt = self.input_prompt + self.output_prompt
         result = self.llm_model_driver.chat(
-            prompt=prompt, type=self.llm_model_driver_type, role_name="", you_name="", query=f"text:{query}", short_history=[], long_history="")
+            prompt=prompt, type=self.llm_model_driver_type, role_name="", you_name="", query=f"text:{query}", short_history=[], long_history="", cache=True)
         logger.debug(f"=> emote:{result}")
         emote = "neutral"
         try:
@@ -2,57 +2,113 @@ import asyncio
 import os
 import threading
 
+import aiohttp
+
 from dotenv import load_dotenv
 from .sdk.handlers import BaseHandler
 from .sdk.client import BLiveClient
 from .sdk.models import (EntryEffectMessage, HeartbeatMessage, DanmakuMessage, GiftMessage, GuardBuyMessage,
                          SuperChatMessage, LikeInfoV3ClickMessage, InteractWordMessage)
-from ..insight_message_queue import InsightMessage, put_message
+from ..insight_message_queue import InsightMessage, get_aggregator_stats, put_message, remove_queue
 import logging
 logger = logging.getLogger(__name__)
 
 load_dotenv()
 
 
-class BiliLiveClient():
+class BiliLiveRoomManager():
+    '''B站直播间管理，所有直播间共用一个事件循环线程和一个aiohttp会话，支持在运行时增删直播间'''
 
-    client: BLiveClient
-    room_id: str
     uid: int = 0
     cookie_str: str
 
     def __init__(self) -> None:
         logger.debug(
-            "====================== init BLiveClient ====================== ")
-        self.room_id = os.environ['B_STATION_ID']
-        uid = os.environ['B_UID']
+            "====================== init BiliLiveRoomManager ====================== ")
+        uid = os.environ.get('B_UID')
         if uid:
             self.uid = int(uid)
-        self.cookie_str = os.environ['B_COOKIE']
-        logger.debug(f"=> room_id:{ self.room_id}")
+        self.cookie_str = os.environ.get('B_COOKIE', '')
+        self._loop: asyncio.AbstractEventLoop = None
+        self._session: aiohttp.ClientSession = None
+        self._clients: dict[int, BLiveClient] = {}
+        self._lock = threading.Lock()
         logger.debug(f"=> uid:{self.uid}")
         logger.debug(f"=> cookie_str:{self.cookie_str}")
-        logger.info("=> Init BLiveClient Success")
-
-    async def start(self):
-        self.client = BLiveClient(
-            room_id=self.room_id, uid=self.uid, ssl=True, cookie_str=self.cookie_str)
-        handler = BiliHandler(room_id=self.room_id)
-        self.client.add_handler(handler)
-        self.client.start()
-        logger.info("=> Start BLiveClient Success")
-        enable = True
-        while (enable):
-            await asyncio.sleep(60)
-
-    async def stop(self):
-        self.client.join()
-        self.client.stop_and_close()
-        logger.info("=> Stop BLiveClient Success")
+        logger.info("=> Init BiliLiveRoomManager Success")
+
+    def start(self) -> None:
+        '''启动事件循环线程'''
+        with self._lock:
+            if self._loop is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            background_thread = threading.Thread(target=self._loop.run_forever, name="bili_live_room_manager")
+            # 将后台线程设置为守护线程，以便在主线程结束时自动退出
+            background_thread.daemon = True
+            background_thread.start()
+        self._run(self._create_session())
+
+    def add_room(self, room_id: int) -> bool:
+        '''添加直播间，已经在监听的直播间返回False'''
+        return self._run(self._add_room(int(room_id)))
+
+    def remove_room(self, room_id: int) -> bool:
+        '''移除直播间，不在监听的直播间返回False'''
+        return self._run(self._remove_room(int(room_id)))
+
+    def rooms(self) -> list[dict]:
+        return [{
+            "room_id": room_id,
+            "real_room_id": client.room_id,
+            "is_running": client.is_running,
+            "parse_stats": client.parse_stats.snapshot(),
+            "insight_stats": get_aggregator_stats(str(room_id))
+        } for room_id, client in list(self._clients.items())]
+
+    def _run(self, coroutine, timeout: float = 30):
+        if self._loop is None:
+            self.start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result(timeout)
+
+    async def _create_session(self):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10),
+                                                  headers={'Cookie': self.cookie_str})
+
+    async def _add_room(self, room_id: int) -> bool:
+        if room_id in self._clients:
+            return False
+        client = BLiveClient(room_id=room_id, uid=self.uid, session=self._session, ssl=True)
+        client.add_handler(BiliHandler(room_id=str(room_id)))
+        client.start()
+        self._clients[room_id] = client
+        logger.info(f"=> Start BLiveClient Success # room_id:{room_id} #")
+        return True
+
+    async def _remove_room(self, room_id: int) -> bool:
+        client = self._clients.pop(room_id, None)
+        if client is None:
+            return False
+        await client.stop_and_close()
+        remove_queue(str(room_id))
+        logger.info(f"=> Stop BLiveClient Success # room_id:{room_id} #")
+        return True
 
 
 class BiliHandler(BaseHandler):
 
+    # 只解析用到的字段，弹幕等消息收到的是轻量消息
+    message_fields = {
+        '_on_danmaku': ('uname', 'msg'),
+        '_on_gift': ('uname', 'gift_name', 'num'),
+        '_on_buy_guard': ('username', 'gift_name'),
+        '_on_super_chat': ('price', 'uname', 'message'),
+        '_on_like_click': ('uname',),
+        '_on_interact_word': ('uname',),
+        '_on_entry_effect': ('copy_writing',),
+    }
+
     room_id: str
 
     def __init__(self, room_id: str) -> None:
@@ -69,17 +125,17 @@ class BiliHandler(BaseHandler):
 
     async def _on_danmaku(self, client: BLiveClient, message: DanmakuMessage):
         put_message(InsightMessage(
-            type="danmaku", user_name=message.uname, content=message.msg, emote="neutral", action=""))
+            type="danmaku", user_name=message.uname, content=message.msg, emote="neutral", action="", room_id=self.room_id, category="chat"))
 
     async def _on_gift(self, client: BLiveClient, message: GiftMessage):
         message_str = f'{message.uname}赠送{message.gift_name}x{message.num}'
         put_message(InsightMessage(
-            type="danmaku", user_name=message.uname, content=message_str, emote="happy", action=""))
+            type="danmaku", user_name=message.uname, content=message_str, emote="happy", action="", room_id=self.room_id, category="gift"))
 
     async def _on_buy_guard(self, client: BLiveClient, message: GuardBuyMessage):
         message_str = f'{message.username}购买{message.gift_name}'
         put_message(InsightMessage(
-            type="danmaku", user_name=message.gift_name, content=message_str, emote="happy", action=""))
+            type="danmaku", user_name=message.gift_name, content=message_str, emote="happy", action="", room_id=self.room_id, category="gift"))
 
     async def _on_super_chat(self, client: BLiveClient, message: SuperChatMessage):
         logger.debug(
@@ -88,7 +144,7 @@ class BiliHandler(BaseHandler):
     async def _on_like_click(self, client: BLiveClient, message: LikeInfoV3ClickMessage):
         message_str = f'{message.uname}偷偷摸了摸爱莉的头'
         put_message(InsightMessage(
-            type="danmaku", user_name=message.uname, content=message_str, emote="happy", action="excited"))
+            type="danmaku", user_name=message.uname, content=message_str, emote="happy", action="excited", room_id=self.room_id, category="like"))
 
     async def _on_interact_word(self, client: BLiveClient, message: InteractWordMessage):
         """
@@ -96,7 +152,7 @@ class BiliHandler(BaseHandler):
         """
         message_str = f'{message.uname}进入了直播间，欢迎欢迎'
         put_message(InsightMessage(
-            type="danmaku", user_name=user_name, content=message_str, emote="happy", action="standing_greeting"))
+            type="danmaku", user_name=message.uname, content=message_str, emote="happy", action="standing_greeting", room_id=self.room_id, category="entry"))
         
     async def _on_entry_effect(self, client: BLiveClient, message: EntryEffectMessage):
         """
@@ -106,23 +162,19 @@ class BiliHandler(BaseHandler):
         message_str = message_str.replace("<%","")
         message_str = message_str.replace("%>","")
         put_message(InsightMessage(
-            type="danmaku", user_name="system", content=message_str, emote="happy", action="standing_greeting"))
+            type="danmaku", user_name="system", content=message_str, emote="happy", action="standing_greeting", room_id=self.room_id, category="entry"))
+
 
-enable_bili_live = False
+bili_live_room_manager = BiliLiveRoomManager()
 
 
 def bili_live_client_main():
-    global enable_bili_live
-    if enable_bili_live == False:
-        background_thread = threading.Thread(target=start_bili_live_client)
-        # 将后台线程设置为守护线程，以便在主线程结束时自动退出
-        background_thread.daemon = True
-        # 启动后台线程
-        background_thread.start()
-        enable_bili_live = True
-        logger.info("=> Start BiliLiveClient Success")
-
-
-def start_bili_live_client():
-    client = BiliLiveClient()
-    asyncio.run(client.start())
+    '''启动直播间监听，B_STATION_ID可以配置多个直播间，用英文逗号分隔'''
+    room_ids = [room_id.strip() for room_id in os.environ.get('B_STATION_ID', '').split(',') if room_id.strip()]
+    bili_live_room_manager.start()
+    for room_id in room_ids:
+        try:
+            bili_live_room_manager.add_room(int(room_id))
+        except Exception as e:
+            logger.error(f"add live room error # room_id:{room_id} # %s" % str(e))
+    logger.info("=> Start BiliLiveClient Success")
@@ -1,11 +1,17 @@
 # -*- coding: utf-8 -*-
 import asyncio
+import collections
+import concurrent.futures
 import enum
 import http
 import json
 import logging
+import os
+import re
 import ssl as ssl_
 import struct
+import time
+import zlib
 from typing import *
 
 import aiohttp
@@ -14,6 +20,11 @@ import http.cookiejar
 
 from . import handlers
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 __all__ = (
     'BLiveClient',
 )
@@ -28,6 +39,25 @@ DEFAULT_DANMAKU_SERVER_LIST = [
 
 HEADER_STRUCT = struct.Struct('>I2H2I')
 
+PARSE_INLINE_MAX_SIZE = 512
+"""小于这个大小的消息直接在事件循环里解析，避免线程切换的开销"""
+PARSE_EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+    max_workers=int(os.environ.get('BLIVEDM_PARSE_WORKERS', '2')), thread_name_prefix='blivedm_parse'
+)
+"""解压和解析消息的线程池，所有客户端共用"""
+CMD_PEEK_PATTERN = re.compile(rb'\s*\{\s*"cmd"\s*:\s*"([^":]*)')
+"""在完整解析前从消息开头取出cmd，B站的业务消息cmd都在第一个字段"""
+CMD_PEEK_SIZE = 64
+
+
+def json_loads(data: Union[bytes, memoryview]):
+    """
+    反序列化JSON，安装了orjson时使用orjson，可以直接解析memoryview
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(bytes(data))
+
 
 class HeaderTuple(NamedTuple):
     pack_len: int
@@ -76,6 +106,47 @@ class AuthReplyCode(enum.IntEnum):
     TOKEN_ERROR = -101
 
 
+class ParseStats:
+    """
+    消息解析耗时统计，包括在线程池中排队的时间
+
+    :param window: 用于计算分位数的最近消息数
+    """
+
+    def __init__(self, window=1000):
+        self.count = 0
+        """解析的消息数"""
+        self.command_count = 0
+        """解析出的业务消息数"""
+        self.total_time = 0.0
+        """解析总耗时（秒）"""
+        self.max_time = 0.0
+        """单条消息最大解析耗时（秒）"""
+        self._recent = collections.deque(maxlen=window)
+
+    def record(self, seconds: float, command_count: int):
+        self.count += 1
+        self.command_count += command_count
+        self.total_time += seconds
+        if seconds > self.max_time:
+            self.max_time = seconds
+        self._recent.append(seconds)
+
+    def snapshot(self) -> dict:
+        """
+        统计结果，耗时单位为毫秒
+        """
+        recent = sorted(self._recent)
+        return {
+            'count': self.count,
+            'command_count': self.command_count,
+            'avg_ms': self.total_time / self.count * 1000 if self.count else 0.0,
+            'p50_ms': recent[len(recent) // 2] * 1000 if recent else 0.0,
+            'p95_ms': recent[int(len(recent) * 0.95)] * 1000 if recent else 0.0,
+            'max_ms': self.max_time * 1000,
+        }
+
+
 class InitError(Exception):
     """初始化失败"""
 
@@ -123,6 +194,8 @@ class BLiveClient:
 
         self._handlers: List[handlers.HandlerInterface] = []
         """消息处理器，可动态增删"""
+        self._accepted_cmds: Optional[FrozenSet[str]] = frozenset()
+        """所有处理器会处理的cmd，其他消息在完整解析前跳过，None表示不跳过"""
 
         # 在调用init_room后初始化的字段
         self._room_id = None
@@ -147,6 +220,9 @@ class BLiveClient:
         self._heartbeat_timer_handle: Optional[asyncio.TimerHandle] = None
         """发心跳包定时器的handle"""
 
+        self.parse_stats = ParseStats()
+        """消息解析耗时统计"""
+
     @property
     def is_running(self) -> bool:
         """
@@ -185,6 +261,7 @@ class BLiveClient:
         """
         if handler not in self._handlers:
             self._handlers.append(handler)
+            self._update_accepted_cmds()
 
     def remove_handler(self, handler: 'handlers.HandlerInterface'):
         """
@@ -196,6 +273,19 @@ class BLiveClient:
             self._handlers.remove(handler)
         except ValueError:
             pass
+        self._update_accepted_cmds()
+
+    def _update_accepted_cmds(self):
+        accepted_cmds = set()
+        for handler in self._handlers:
+            handled_cmds = getattr(handler, 'handled_cmds', None)
+            if handled_cmds is None:
+                # 有处理器处理所有cmd时不能跳过
+                self._accepted_cmds = None
+                return
+            accepted_cmds.update(handled_cmds)
+        # 解析线程只读这个字段，整体替换不需要加锁
+        self._accepted_cmds = frozenset(accepted_cmds)
 
     def start(self):
         """
@@ -507,90 +597,105 @@ class BLiveClient:
 
     async def _parse_ws_message(self, data: bytes):
         """
-        解析WebSocket消息
+        解析WebSocket消息，较大的消息在线程池中解压和反序列化，解析完成后在事件循环中处理
 
         :param data: WebSocket消息数据
         """
-        offset = 0
-        try:
-            header = HeaderTuple(*HEADER_STRUCT.unpack_from(data, offset))
-        except struct.error:
-            logger.exception('=> room=%d parsing header failed, offset=%d, data=%s', self.room_id, offset, data)
-            return
+        start_time = time.perf_counter()
+        if len(data) > PARSE_INLINE_MAX_SIZE:
+            results = await asyncio.get_running_loop().run_in_executor(PARSE_EXECUTOR, self._decode_ws_message, data)
+        else:
+            results = self._decode_ws_message(data)
+        self.parse_stats.record(time.perf_counter() - start_time, len(results))
+
+        for operation, body in results:
+            if operation == Operation.AUTH_REPLY:
+                # 认证响应
+                if body['code'] != AuthReplyCode.OK:
+                    raise AuthError(f"auth reply error, code={body['code']}, body={body}")
+                await self._websocket.send_bytes(self._make_packet({}, Operation.HEARTBEAT))
+            else:
+                await self._handle_command(body)
 
-        if header.operation in (Operation.SEND_MSG_REPLY, Operation.AUTH_REPLY):
-            # 业务消息，可能有多个包一起发，需要分包
-            while True:
-                body = data[offset + header.raw_header_size: offset + header.pack_len]
-                await self._parse_business_message(header, body)
+    def _decode_ws_message(self, data: bytes) -> List[Tuple[int, dict]]:
+        """
+        解压并反序列化WebSocket消息，可能在线程池中执行，不能访问事件循环
 
-                offset += header.pack_len
-                if offset >= len(data):
-                    break
+        :param data: WebSocket消息数据
+        :return: [(操作码, 包体JSON数据), ...]
+        """
+        results = []
+        self._decode_packets(memoryview(data), results)
+        return results
 
-                try:
-                    header = HeaderTuple(*HEADER_STRUCT.unpack_from(data, offset))
-                except struct.error:
-                    logger.exception('room=%d parsing header failed, offset=%d, data=%s', self.room_id, offset, data)
-                    break
-
-        elif header.operation == Operation.HEARTBEAT_REPLY:
-            # 服务器心跳包，前4字节是人气值，后面是客户端发的心跳包内容
-            # pack_len不包括客户端发的心跳包内容，不知道是不是服务器BUG
-            body = data[offset + header.raw_header_size: offset + header.raw_header_size + 4]
-            popularity = int.from_bytes(body, 'big')
-            # 自己造个消息当成业务消息处理
-            body = {
-                'cmd': '_HEARTBEAT',
-                'data': {
-                    'popularity': popularity
-                }
-            }
-            await self._handle_command(body)
+    def _decode_packets(self, data: memoryview, results: List[Tuple[int, dict]]):
+        """
+        分包并解析，使用memoryview切片避免复制数据
+
+        :param data: 一个或多个包的数据
+        :param results: 解析结果
+        """
+        offset = 0
+        while offset < len(data):
+            try:
+                header = HeaderTuple(*HEADER_STRUCT.unpack_from(data, offset))
+            except struct.error:
+                logger.exception('room=%s parsing header failed, offset=%d', self.room_id, offset)
+                return
+            if header.pack_len < header.raw_header_size:
+                logger.warning('room=%s invalid header=%s', self.room_id, header)
+                return
+
+            if header.operation == Operation.HEARTBEAT_REPLY:
+                # 服务器心跳包，前4字节是人气值，后面是客户端发的心跳包内容
+                # pack_len不包括客户端发的心跳包内容，不知道是不是服务器BUG
+                body = data[offset + header.raw_header_size: offset + header.raw_header_size + 4]
+                popularity = int.from_bytes(body, 'big')
+                # 自己造个消息当成业务消息处理
+                results.append((Operation.SEND_MSG_REPLY, {
+                    'cmd': '_HEARTBEAT',
+                    'data': {
+                        'popularity': popularity
+                    }
+                }))
+                return
 
-        else:
-            # 未知消息
             body = data[offset + header.raw_header_size: offset + header.pack_len]
-            logger.warning('=> room=%d unknown message operation=%d, header=%s, body=%s', self.room_id,
-                           header.operation, header, body)
-
-    async def _parse_business_message(self, header: HeaderTuple, body: bytes):
-        """
-        解析业务消息
-        """
-        if header.operation == Operation.SEND_MSG_REPLY:
-            # 业务消息
-            if header.ver == ProtoVer.BROTLI:
-                # 压缩过的先解压，为了避免阻塞网络线程，放在其他线程执行
-                body = await asyncio.get_running_loop().run_in_executor(None, brotli.decompress, body)
-                await self._parse_ws_message(body)
-            elif header.ver == ProtoVer.NORMAL:
-                # 没压缩过的直接反序列化，因为有万恶的GIL，这里不能并行避免阻塞
-                if len(body) != 0:
-                    try:
-                        body = json.loads(body.decode('utf-8'))
-                        await self._handle_command(body)
-                    except asyncio.CancelledError:
-                        raise
-                    except Exception:
-                        logger.error('room=%d, body=%s', self.room_id, body)
-                        raise
+            if header.operation == Operation.SEND_MSG_REPLY:
+                self._decode_business_message(header, body, results)
+            elif header.operation == Operation.AUTH_REPLY:
+                results.append((Operation.AUTH_REPLY, json_loads(body)))
             else:
-                # 未知格式
-                logger.warning('room=%d unknown protocol version=%d, header=%s, body=%s', self.room_id,
-                               header.ver, header, body)
-
-        elif header.operation == Operation.AUTH_REPLY:
-            # 认证响应
-            body = json.loads(body.decode('utf-8'))
-            if body['code'] != AuthReplyCode.OK:
-                raise AuthError(f"auth reply error, code={body['code']}, body={body}")
-            await self._websocket.send_bytes(self._make_packet({}, Operation.HEARTBEAT))
-
+                # 未知消息
+                logger.warning('room=%s unknown message operation=%d, header=%s, body=%s', self.room_id,
+                               header.operation, header, bytes(body))
+            offset += header.pack_len
+
+    def _decode_business_message(self, header: HeaderTuple, body: memoryview, results: List[Tuple[int, dict]]):
+        """
+        解析业务消息，压缩过的先解压再分包
+        """
+        if header.ver == ProtoVer.BROTLI:
+            self._decode_packets(memoryview(brotli.decompress(body)), results)
+        elif header.ver == ProtoVer.DEFLATE:
+            self._decode_packets(memoryview(zlib.decompress(body)), results)
+        elif header.ver == ProtoVer.NORMAL:
+            if len(body) != 0:
+                accepted_cmds = self._accepted_cmds
+                if accepted_cmds is not None:
+                    match = CMD_PEEK_PATTERN.match(body[:CMD_PEEK_SIZE])
+                    if match is not None and match.group(1).decode('utf-8', 'replace') not in accepted_cmds:
+                        # 没有处理器处理的消息不需要反序列化
+                        return
+                try:
+                    results.append((Operation.SEND_MSG_REPLY, json_loads(body)))
+                except Exception:  # noqa
+                    # 单条消息解析失败不影响同一个包里的其他消息
+                    logger.exception('room=%s, body=%s', self.room_id, bytes(body))
         else:
-            # 未知消息
-            logger.warning('room=%d unknown message operation=%d, header=%s, body=%s', self.room_id,
-                           header.operation, header, body)
+            # 未知格式
+            logger.warning('room=%s unknown protocol version=%d, header=%s, body=%s', self.room_id,
+                           header.ver, header, bytes(body))
 
     async def _handle_command(self, command: dict):
         """
@@ -47,44 +47,59 @@ class HandlerInterface:
     直播消息处理器接口
     """
 
+    handled_cmds: Optional[FrozenSet[str]] = None
+    """处理器会处理的cmd，客户端会在完整解析前跳过所有处理器都不处理的消息，None表示处理所有cmd"""
+
     async def handle(self, client: client_.BLiveClient, command: dict):
         raise NotImplementedError
 
 
+_CMD_MESSAGE_TYPES: Dict[str, Tuple[str, type, str]] = {
+    # 收到心跳包，这是blivedm自造的消息，原本的心跳包格式不一样
+    '_HEARTBEAT': ('_on_heartbeat', models.HeartbeatMessage, 'data'),
+    # 收到弹幕
+    # go-common\app\service\live\live-dm\service\v1\send.go
+    'DANMU_MSG': ('_on_danmaku', models.DanmakuMessage, 'info'),
+    # 有人送礼
+    'SEND_GIFT': ('_on_gift', models.GiftMessage, 'data'),
+    # 有人上舰
+    'GUARD_BUY': ('_on_buy_guard', models.GuardBuyMessage, 'data'),
+    # 醒目留言
+    'SUPER_CHAT_MESSAGE': ('_on_super_chat', models.SuperChatMessage, 'data'),
+    # 删除醒目留言
+    'SUPER_CHAT_MESSAGE_DELETE': ('_on_super_chat_delete', models.SuperChatDeleteMessage, 'data'),
+    # 给主播点赞
+    'LIKE_INFO_V3_CLICK': ('_on_like_click', models.LikeInfoV3ClickMessage, 'data'),
+    # 欢迎加入房间
+    'WELCOME': ('_on_welcome', models.LikeInfoV3ClickMessage, 'data'),
+    # 舰长、高能榜、老爷进入直播间
+    'ENTRY_EFFECT_MUST_RECEIVE': ('_on_entry_effect', models.EntryEffectMessage, 'data'),
+    # 用户进入直播间，用户关注直播间
+    'INTERACT_WORD': ('_on_interact_word', models.InteractWordMessage, 'data'),
+}
+"""cmd -> (处理方法名, 消息类型, 消息数据的key)"""
+
+KNOWN_CMDS = frozenset(_CMD_MESSAGE_TYPES) | frozenset(IGNORED_CMDS)
+"""已知的cmd，其他cmd第一次出现时打日志"""
+
+
+def _make_callback(method_name: str, parse: Callable[[Any], Any], data_key: str):
+    def callback(self: 'BaseHandler', client: client_.BLiveClient, command: dict):
+        return getattr(self, method_name)(client, parse(command[data_key]))
+    return callback
+
+
 class BaseHandler(HandlerInterface):
     """
     一个简单的消息处理器实现，带消息分发和消息类型转换。继承并重写_on_xxx方法即可实现自己的处理器
-    """
-
-    def __heartbeat_callback(self, client: client_.BLiveClient, command: dict):
-        return self._on_heartbeat(client, models.HeartbeatMessage.from_command(command['data']))
-
-    def __danmu_msg_callback(self, client: client_.BLiveClient, command: dict):
-        return self._on_danmaku(client, models.DanmakuMessage.from_command(command['info']))
-
-    def __send_gift_callback(self, client: client_.BLiveClient, command: dict):
-        return self._on_gift(client, models.GiftMessage.from_command(command['data']))
-
-    def __guard_buy_callback(self, client: client_.BLiveClient, command: dict):
-        return self._on_buy_guard(client, models.GuardBuyMessage.from_command(command['data']))
 
-    def __super_chat_message_callback(self, client: client_.BLiveClient, command: dict):
-        return self._on_super_chat(client, models.SuperChatMessage.from_command(command['data']))
-
-    def __super_chat_message_delete_callback(self, client: client_.BLiveClient, command: dict):
-        return self._on_super_chat_delete(client, models.SuperChatDeleteMessage.from_command(command['data']))
-    
-    def __like_info_v3_click_callback(self, client: client_.BLiveClient, command: dict):
-        return self._on_like_click(client, models.LikeInfoV3ClickMessage.from_command(command['data']))
-    
-    def __welcome_callback(self, client: client_.BLiveClient, command: dict):
-        return self._on_welcome(client, models.LikeInfoV3ClickMessage.from_command(command['data']))
-    
-    def __entry_effect_callback(self, client: client_.BLiveClient, command: dict):
-        return self._on_entry_effect(client, models.EntryEffectMessage.from_command(command['data']))
+    子类定义时会预先计算cmd -> 处理回调的分发表，只包含子类重写了的_on_xxx方法。
+    子类可以在message_fields中声明_on_xxx方法需要的字段，这些方法收到的是只包含这些字段的轻量消息
+    （models.LiteMessage），没有声明的方法收到完整的消息类
+    """
 
-    def __interact_word_callback(self, client: client_.BLiveClient, command: dict):
-        return self._on_interact_word(client, models.InteractWordMessage.from_command(command['data']))
+    message_fields: Dict[str, Tuple[str, ...]] = {}
+    """_on_xxx方法名 -> 需要的字段"""
 
     _CMD_CALLBACK_DICT: Dict[
         str,
@@ -92,34 +107,29 @@ class BaseHandler(HandlerInterface):
             ['BaseHandler', client_.BLiveClient, dict],
             Awaitable
         ]]
-    ] = {
-        # 收到心跳包，这是blivedm自造的消息，原本的心跳包格式不一样
-        '_HEARTBEAT': __heartbeat_callback,
-        # 收到弹幕
-        # go-common\app\service\live\live-dm\service\v1\send.go
-        'DANMU_MSG': __danmu_msg_callback,
-        # 有人送礼
-        'SEND_GIFT': __send_gift_callback,
-        # 有人上舰
-        'GUARD_BUY': __guard_buy_callback,
-        # 醒目留言
-        'SUPER_CHAT_MESSAGE': __super_chat_message_callback,
-        # 删除醒目留言
-        'SUPER_CHAT_MESSAGE_DELETE': __super_chat_message_delete_callback,
-         # 删除醒目留言
-        'LIKE_INFO_V3_CLICK': __like_info_v3_click_callback,
-         # 欢迎加入房间
-        'WELCOME': __welcome_callback,
-         # 舰长、高能榜、老爷进入直播间
-        'ENTRY_EFFECT_MUST_RECEIVE': __entry_effect_callback,
-         # 用户进入直播间，用户关注直播间
-        'INTERACT_WORD': __interact_word_callback,
-    }
-    """cmd -> 处理回调"""
-    # 忽略其他常见cmd
-    for cmd in IGNORED_CMDS:
-        _CMD_CALLBACK_DICT[cmd] = None
-    del cmd
+    ] = {}
+    """cmd -> 处理回调，None表示忽略"""
+
+    handled_cmds: FrozenSet[str] = frozenset()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        callback_dict = {}
+        for cmd, (method_name, model, data_key) in _CMD_MESSAGE_TYPES.items():
+            # 没有重写的方法不需要解析消息
+            if getattr(cls, method_name) is getattr(BaseHandler, method_name):
+                continue
+            fields = cls.message_fields.get(method_name)
+            if fields:
+                parse = models.lite_message_class(model, fields).from_command
+            else:
+                parse = model.from_command
+            callback_dict[cmd] = _make_callback(method_name, parse, data_key)
+        # 忽略其他常见cmd
+        for cmd in IGNORED_CMDS:
+            callback_dict[cmd] = None
+        cls._CMD_CALLBACK_DICT = callback_dict
+        cls.handled_cmds = frozenset(cmd for cmd, callback in callback_dict.items() if callback is not None)
 
     async def handle(self, client: client_.BLiveClient, command: dict):
         cmd = command.get('cmd', '')
@@ -127,16 +137,14 @@ class BaseHandler(HandlerInterface):
         if pos != -1:
             cmd = cmd[:pos]
 
-        if cmd not in self._CMD_CALLBACK_DICT:
+        callback = self._CMD_CALLBACK_DICT.get(cmd)
+        if callback is not None:
+            await callback(self, client, command)
+        elif cmd not in KNOWN_CMDS:
             # 只有第一次遇到未知cmd时打日志
             if cmd not in logged_unknown_cmds:
                 logger.warning('room=%d unknown cmd=%s, command=%s', client.room_id, cmd, command)
                 logged_unknown_cmds.add(cmd)
-            return
-
-        callback = self._CMD_CALLBACK_DICT[cmd]
-        if callback is not None:
-            await callback(self, client, command)
 
     async def _on_heartbeat(self, client: client_.BLiveClient, message: models.HeartbeatMessage):
         """
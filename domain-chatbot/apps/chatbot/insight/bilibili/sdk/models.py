@@ -10,9 +10,77 @@ __all__ = (
     'GuardBuyMessage',
     'SuperChatMessage',
     'SuperChatDeleteMessage',
+    'LiteMessage',
+    'lite_message_class',
 )
 
 
+def _path(*keys):
+    """
+    按路径取值的函数，例如_path(2, 1)取info[2][1]
+    """
+    def getter(data):
+        for key in keys:
+            data = data[key]
+        return data
+    return getter
+
+
+def _medal(index):
+    """
+    弹幕勋章信息，没有勋章时使用默认值
+    """
+    default = '' if index in (1, 2) else 0
+
+    def getter(info):
+        return info[3][index] if len(info[3]) != 0 else default
+    return getter
+
+
+class LiteMessage:
+    """
+    轻量消息，只包含处理器声明需要的字段，用__slots__存储，字段含义同对应的完整消息类
+    """
+    __slots__ = ()
+
+    def __repr__(self):
+        fields = ', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)
+        return f'{type(self).__name__}({fields})'
+
+
+_lite_message_classes: Dict[Tuple[type, Tuple[str, ...]], type] = {}
+
+
+def lite_message_class(model: type, fields: Tuple[str, ...]) -> type:
+    """
+    创建只包含指定字段的轻量消息类，同样的字段只创建一次
+
+    :param model: 完整消息类，需要定义_FIELD_GETTERS
+    :param fields: 需要的字段
+    """
+    fields = tuple(fields)
+    key = (model, fields)
+    lite_class = _lite_message_classes.get(key)
+    if lite_class is None:
+        unknown_fields = [name for name in fields if name not in model._FIELD_GETTERS]
+        if unknown_fields:
+            raise ValueError(f'{model.__name__} has no fields {unknown_fields}')
+        getters = tuple(model._FIELD_GETTERS[name] for name in fields)
+
+        def from_command(cls, data):
+            message = object.__new__(cls)
+            for name, getter in zip(fields, getters):
+                setattr(message, name, getter(data))
+            return message
+
+        lite_class = type(f'Lite{model.__name__}', (LiteMessage,), {
+            '__slots__': fields,
+            'from_command': classmethod(from_command),
+        })
+        _lite_message_classes[key] = lite_class
+    return lite_class
+
+
 @dataclasses.dataclass
 class HeartbeatMessage:
     """
@@ -438,4 +506,104 @@ class InteractWordMessage:
         return cls(
             uid=data['uid'],
             uname=data['uname']
-        )
\ No newline at end of file
+        )
+
+
+# 各消息类的字段取值函数，用于创建轻量消息
+HeartbeatMessage._FIELD_GETTERS = {
+    'popularity': _path('popularity'),
+}
+
+DanmakuMessage._FIELD_GETTERS = {
+    'mode': _path(0, 1),
+    'font_size': _path(0, 2),
+    'color': _path(0, 3),
+    'timestamp': _path(0, 4),
+    'rnd': _path(0, 5),
+    'uid_crc32': _path(0, 7),
+    'msg_type': _path(0, 9),
+    'bubble': _path(0, 10),
+    'dm_type': _path(0, 12),
+    'emoticon_options': _path(0, 13),
+    'voice_config': _path(0, 14),
+    'mode_info': _path(0, 15),
+    'msg': _path(1),
+    'uid': _path(2, 0),
+    'uname': _path(2, 1),
+    'admin': _path(2, 2),
+    'vip': _path(2, 3),
+    'svip': _path(2, 4),
+    'urank': _path(2, 5),
+    'mobile_verify': _path(2, 6),
+    'uname_color': _path(2, 7),
+    'medal_level': _medal(0),
+    'medal_name': _medal(1),
+    'runame': _medal(2),
+    'medal_room_id': _medal(3),
+    'mcolor': _medal(4),
+    'special_medal': _medal(5),
+    'user_level': _path(4, 0),
+    'ulevel_color': _path(4, 2),
+    'ulevel_rank': _path(4, 3),
+    'old_title': _path(5, 0),
+    'title': _path(5, 1),
+    'privilege_type': _path(7),
+}
+
+GiftMessage._FIELD_GETTERS = {
+    'gift_name': _path('giftName'),
+    'num': _path('num'),
+    'uname': _path('uname'),
+    'face': _path('face'),
+    'guard_level': _path('guard_level'),
+    'uid': _path('uid'),
+    'timestamp': _path('timestamp'),
+    'gift_id': _path('giftId'),
+    'gift_type': _path('giftType'),
+    'action': _path('action'),
+    'price': _path('price'),
+    'rnd': _path('rnd'),
+    'coin_type': _path('coin_type'),
+    'total_coin': _path('total_coin'),
+    'tid': _path('tid'),
+}
+
+GuardBuyMessage._FIELD_GETTERS = {
+    name: _path(name) for name in (
+        'uid', 'username', 'guard_level', 'num', 'price', 'gift_id', 'gift_name', 'start_time', 'end_time'
+    )
+}
+
+SuperChatMessage._FIELD_GETTERS = {
+    **{name: _path(name) for name in (
+        'price', 'message', 'message_trans', 'start_time', 'end_time', 'time', 'id', 'uid',
+        'background_bottom_color', 'background_color', 'background_icon', 'background_image',
+        'background_price_color'
+    )},
+    'gift_id': _path('gift', 'gift_id'),
+    'gift_name': _path('gift', 'gift_name'),
+    'uname': _path('user_info', 'uname'),
+    'face': _path('user_info', 'face'),
+    'guard_level': _path('user_info', 'guard_level'),
+    'user_level': _path('user_info', 'user_level'),
+}
+
+SuperChatDeleteMessage._FIELD_GETTERS = {
+    'ids': _path('ids'),
+}
+
+LikeInfoV3ClickMessage._FIELD_GETTERS = {
+    'uid': _path('uid'),
+    'message': _path('like_text'),
+    'uname': _path('uname'),
+}
+
+EntryEffectMessage._FIELD_GETTERS = {
+    'uid': _path('uid'),
+    'copy_writing': _path('copy_writing'),
+}
+
+InteractWordMessage._FIELD_GETTERS = {
+    'uid': _path('uid'),
+    'uname': _path('uname'),
+}
@@ -0,0 +1,164 @@
+import os
+import re
+import time
+from collections import Counter, deque
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .insight_message_queue import InsightMessage
+
+
+# 连续重复的字符折叠成3个，"6666666"和"666"视为相同内容
+repeated_char_pattern = re.compile(r'(.)\1{3,}')
+blank_pattern = re.compile(r'\s+')
+
+# 可合并的消息类别和合并后的文案，names为最多3个用户名
+rollup_templates = {
+    "like": "{names}等{count}个人偷偷摸了摸爱莉的头",
+    "entry": "{names}等{count}个人进入了直播间，欢迎欢迎",
+}
+
+
+class InsightRollup():
+    '''一个时间窗口内合并的同类消息，不包括窗口内已经立即发出的第一条'''
+
+    def __init__(self, first_message: 'InsightMessage') -> None:
+        self.first_message = first_message
+        self.user_names = []
+        self.count = 0
+
+    def add(self, message: 'InsightMessage'):
+        self.count += 1
+        if message.user_name and message.user_name != "system" and message.user_name not in self.user_names:
+            self.user_names.append(message.user_name)
+
+
+class InsightAggregator():
+    '''直播消息聚合，在调用大语言模型前过滤刷屏消息
+
+    - 弹幕(chat)：相同内容在dedup_window秒内只保留第一条，每个用户在任意window秒内最多user_rate_limit条
+    - 点赞(like)、进场(entry)：每个窗口的第一条立即发出，其余的在窗口结束时合并成一条消息，只有一条时原样发出
+    - 礼物(gift)等其他类别：不过滤
+
+    每个直播间的处理线程独占一个实例，不需要加锁
+
+    window: 合并和限流的时间窗口（秒）
+    dedup_window: 重复弹幕的判断窗口（秒）
+    user_rate_limit: 每个用户在window秒内最多的弹幕数，0表示不限制
+    '''
+
+    window: float
+    dedup_window: float
+    user_rate_limit: int
+
+    def __init__(self, window: float = 10, dedup_window: float = 30, user_rate_limit: int = 2) -> None:
+        self.window = window
+        self.dedup_window = dedup_window
+        self.user_rate_limit = user_rate_limit
+        # 预先创建所有计数项，其他线程读取统计时字典大小不会变化
+        self.counters = Counter(received=0, dispatched=0, duplicated=0, rate_limited=0, rolled_up=0)
+        self._seen: dict[int, float] = {}
+        # 用户 => 最近window秒内发出的弹幕时间，按滑动窗口限流，不会在窗口交界处放行两倍的弹幕
+        self._user_times: dict[str, deque[float]] = {}
+        # 当前窗口已经立即发出第一条消息的类别，以及之后待合并的消息
+        self._emitted: set[str] = set()
+        self._rollups: dict[str, InsightRollup] = {}
+        self._window_end = time.monotonic() + window
+
+    @staticmethod
+    def content_hash(content: str) -> int:
+        normalized = blank_pattern.sub('', content or '').lower()
+        return hash(repeated_char_pattern.sub(r'\1\1\1', normalized))
+
+    def offer(self, message: 'InsightMessage') -> list['InsightMessage']:
+        '''收到一条消息，返回需要立即处理的消息'''
+        self.counters["received"] += 1
+        category = getattr(message, "category", None)
+
+        if category in rollup_templates:
+            if category not in self._emitted:
+                # 窗口内的第一条立即发出，之后的同类消息等到窗口结束时合并
+                self._emitted.add(category)
+                self.counters["dispatched"] += 1
+                return [message]
+            rollup = self._rollups.get(category)
+            if rollup is None:
+                rollup = self._rollups[category] = InsightRollup(message)
+            rollup.add(message)
+            return []
+
+        if category == "chat":
+            now = time.monotonic()
+            key = self.content_hash(message.content)
+            expires_at = self._seen.get(key)
+            if expires_at is not None and expires_at > now:
+                self.counters["duplicated"] += 1
+                return []
+            if self.user_rate_limit > 0:
+                times = self._user_times.setdefault(message.user_name, deque())
+                while len(times) > 0 and times[0] <= now - self.window:
+                    times.popleft()
+                if len(times) >= self.user_rate_limit:
+                    self.counters["rate_limited"] += 1
+                    return []
+                times.append(now)
+            self._seen[key] = now + self.dedup_window
+
+        self.counters["dispatched"] += 1
+        return [message]
+
+    def timeout(self) -> float:
+        '''距离当前窗口结束的秒数，处理线程等待新消息的最长时间'''
+        return max(self._window_end - time.monotonic(), 0)
+
+    def flush(self, force: bool = False) -> list['InsightMessage']:
+        '''窗口结束时返回合并后的消息，并开始新的窗口'''
+        now = time.monotonic()
+        if not force and now < self._window_end:
+            return []
+        self._window_end = now + self.window
+        # 清理最近window秒内没有弹幕的用户
+        self._user_times = {user_name: times for user_name, times in self._user_times.items()
+                            if len(times) > 0 and times[-1] > now - self.window}
+        self._seen = {key: expires_at for key, expires_at in self._seen.items() if expires_at > now}
+
+        messages = []
+        for category, rollup in self._rollups.items():
+            if rollup.count == 1:
+                messages.append(rollup.first_message)
+            else:
+                messages.append(self._rollup_message(category, rollup))
+                self.counters["rolled_up"] += rollup.count - 1
+        self._rollups = {}
+        self._emitted = set()
+        self.counters["dispatched"] += len(messages)
+        return messages
+
+    def stats(self) -> dict:
+        counters = dict(self.counters)
+        counters["suppressed"] = counters.get("duplicated", 0) + counters.get("rate_limited", 0) \
+            + counters.get("rolled_up", 0)
+        return counters
+
+    @staticmethod
+    def _rollup_message(category: str, rollup: InsightRollup) -> 'InsightMessage':
+        first_message = rollup.first_message
+        names = "、".join(rollup.user_names[:3]) if len(rollup.user_names) > 0 else "大家"
+        content = rollup_templates[category].format(names=names, count=rollup.count)
+        return type(first_message)(
+            type=first_message.type,
+            user_name="system",
+            content=content,
+            emote=first_message.emote,
+            action=first_message.action,
+            room_id=first_message.room_id,
+            category=category
+        )
+
+
+def create_insight_aggregator() -> InsightAggregator:
+    '''INSIGHT_AGGREGATE_WINDOW=0 时关闭聚合'''
+    return InsightAggregator(
+        window=float(os.environ.get("INSIGHT_AGGREGATE_WINDOW", "10")),
+        dedup_window=float(os.environ.get("INSIGHT_DEDUP_WINDOW", "30")),
+        user_rate_limit=int(os.environ.get("INSIGHT_USER_RATE_LIMIT", "2")))
@@ -5,9 +5,14 @@ import traceback
 from ..utils.chat_message_utils import format_user_chat_text
 from ..process import process_core
 from ..output import realtime_message_queue
+from ..output.channel_groups import room_group
+from .insight_aggregator import InsightAggregator, create_insight_aggregator
 
-# 创建一个线程安全的队列
-insight_message_queue = queue.SimpleQueue()
+# 每个直播间一个线程安全的队列和处理线程，room_id为空的消息使用默认队列
+insight_message_queues: dict[str, queue.SimpleQueue] = {}
+insight_message_queues_lock = threading.Lock()
+# 每个直播间的消息聚合器，用于查看被过滤的消息数
+insight_aggregators: dict[str, InsightAggregator] = {}
 logger = logging.getLogger(__name__)
 
 class InsightMessage():
@@ -18,14 +23,19 @@ class InsightMessage():
     emote: str
     action: str
     expand: str
+    room_id: str
+    # 消息类别：chat 弹幕、gift 礼物、like 点赞、entry 进场，为空时不参与聚合
+    category: str
 
-    def __init__(self, type: str, user_name: str, content: str, emote: str, action: str = None, expand: str = None) -> None:
+    def __init__(self, type: str, user_name: str, content: str, emote: str, action: str = None, expand: str = None, room_id: str = None, category: str = None) -> None:
         self.type = type
         self.user_name = user_name
         self.content = content
         self.emote = emote
         self.action = action
         self.expand = expand
+        self.room_id = room_id
+        self.category = category
 
     def to_dict(self):
         return {
@@ -34,31 +44,87 @@ class InsightMessage():
             "content": self.content,
             "emote": self.emote,
             "action": self.action,
-            "expand": self.expand
+            "expand": self.expand,
+            "room_id": self.room_id,
+            "category": self.category
         }
 
 
 def put_message(message: InsightMessage):
-    global insight_message_queue
-    insight_message_queue.put(message)
+    get_queue(message.room_id).put(message)
 
 
-def send_message():
+def get_queue(room_id: str = None) -> queue.SimpleQueue:
+    '''获取直播间的消息队列，第一次使用时创建队列并启动处理线程'''
+    message_queue = insight_message_queues.get(room_id)
+    if message_queue is None:
+        with insight_message_queues_lock:
+            message_queue = insight_message_queues.get(room_id)
+            if message_queue is None:
+                message_queue = queue.SimpleQueue()
+                insight_message_queues[room_id] = message_queue
+                aggregator = create_insight_aggregator()
+                if aggregator.window > 0:
+                    insight_aggregators[room_id] = aggregator
+                else:
+                    aggregator = None
+                background_thread = threading.Thread(
+                    target=send_message, args=(message_queue, aggregator), name=f"insight_message_{room_id}")
+                background_thread.daemon = True
+                background_thread.start()
+                logger.info(f"=> Start insight message worker # room_id:{room_id} #")
+    return message_queue
+
+
+def remove_queue(room_id: str):
+    '''直播间被移除后停止处理线程'''
+    with insight_message_queues_lock:
+        message_queue = insight_message_queues.pop(room_id, None)
+        insight_aggregators.pop(room_id, None)
+    if message_queue is not None:
+        message_queue.put(None)
+
+
+def get_aggregator_stats(room_id: str = None) -> dict:
+    aggregator = insight_aggregators.get(room_id)
+    return aggregator.stats() if aggregator is not None else {}
+
+
+def dispatch_message(message: InsightMessage):
+    if (message.type == "danmaku"):
+        content = format_user_chat_text(text=message.content)
+        # 弹幕和角色的回复都只发送给观看该直播间的客户端
+        realtime_message_queue.put_message(realtime_message_queue.RealtimeMessage(
+            type=message.type,
+            user_name=message.user_name,
+            content=content,
+            emote=message.emote,
+            action=message.action,
+            target=room_group(message.room_id) if message.room_id else None
+        ))
+        process_core.chat(
+            you_name=message.user_name, query=message.content, room_id=message.room_id)
+
+
+def send_message(message_queue: queue.SimpleQueue, aggregator: InsightAggregator = None):
     while True:
         try:
-            message = insight_message_queue.get()
-            if (message != None and message != ''):
-                if (message.type == "danmaku"):
-                    content = format_user_chat_text(text=message.content)
-                    realtime_message_queue.put_message(realtime_message_queue.RealtimeMessage(
-                        type=message.type,
-                        user_name=message.user_name,
-                        content=content,
-                        emote=message.emote,
-                        action=message.action
-                    ))
-                    process_core.chat(
-                        you_name=message.user_name, query=message.content)
+            if aggregator is None:
+                message = message_queue.get()
+            else:
+                # 等到窗口结束时发出合并的消息
+                try:
+                    message = message_queue.get(timeout=aggregator.timeout())
+                except queue.Empty:
+                    message = ''
+            if message is None:
+                return
+            messages = [message] if message != '' else []
+            if aggregator is not None:
+                messages = [item for message in messages for item in aggregator.offer(message)]
+                messages.extend(aggregator.flush())
+            for message in messages:
+                dispatch_message(message)
         except Exception as e:
             traceback.print_exc()
 
@@ -67,10 +133,6 @@ class InsightMessageQueryJobTask():
 
     @staticmethod
     def start():
-        # 创建后台线程
-        background_thread = threading.Thread(target=send_message)
-        background_thread.daemon = True
-        
-        # 启动后台线程
-        background_thread.start()
+        # 启动默认队列的处理线程，直播间的处理线程在收到第一条消息时启动
+        get_queue()
         logger.info("=> Start InsightMessageQueryJobTask Success")
@@ -2,8 +2,12 @@ from __future__ import annotations
 from abc import ABC, abstractmethod
 import threading
 import asyncio
+import logging
 from .openai.openai_chat_robot import OpenAIGeneration
 from .text_generation.text_generation_chat_robot import TextGeneration
+from .llm_response_cache import LlmResponseCache, singleton_llm_response_cache
+
+logger = logging.getLogger(__name__)
 
 
 class LlmModelStrategy(ABC):
@@ -29,9 +33,9 @@ class OpenAILlmModelStrategy(LlmModelStrategy):
 
     openai_generation: OpenAIGeneration
 
-    def __init__(self) -> None:
+    def __init__(self, api_key: str = None, base_url: str = None, proxy: str = None) -> None:
         super().__init__()
-        self.openai_generation = OpenAIGeneration()
+        self.openai_generation = OpenAIGeneration(api_key=api_key, base_url=base_url, proxy=proxy)
 
     def chat(self, prompt: str, role_name: str, you_name: str, query: str, short_history: list[dict[str, str]], long_history: str) -> str:
         return self.openai_generation.chat(prompt=prompt, role_name=role_name, you_name=you_name, query=query, short_history=short_history, long_history=long_history)
@@ -58,9 +62,9 @@ class TextGenerationLlmModelStrategy(LlmModelStrategy):
 
     generation: TextGeneration
 
-    def __init__(self) -> None:
+    def __init__(self, api_url: str = None, web_socket_url: str = None, proxies: dict[str, str] = None) -> None:
         super().__init__()
-        self.generation = TextGeneration()
+        self.generation = TextGeneration(api_url=api_url, web_socket_url=web_socket_url, proxies=proxies)
 
     def chat(self, prompt: str, role_name: str, you_name: str, query: str, short_history: list[dict[str, str]], long_history: str) -> str:
         return self.generation.chat(prompt=prompt, role_name=role_name, you_name=you_name, query=query, short_history=short_history, long_history=long_history)
@@ -84,16 +88,38 @@ class TextGenerationLlmModelStrategy(LlmModelStrategy):
 
 
 class LlmModelDriver:
-
-    def __init__(self):
-        self.openai = OpenAIGeneration()
-        self.textGeneration = TextGenerationLlmModelStrategy()
+    '''大语言模型驱动
+
+    language_model_config: 系统配置中的languageModelConfig，为空时各模型从环境变量读取配置
+    proxies: 代理配置 {"http": ..., "https": ..., "socks5": ...}，只作用于大语言模型的请求
+    '''
+
+    def __init__(self, language_model_config: dict = None, proxies: dict[str, str] = None,
+                 response_cache: LlmResponseCache = singleton_llm_response_cache):
+        self.language_model_config = language_model_config or {}
+        self.proxies = {scheme: url for scheme, url in (proxies or {}).items() if url}
+        # 响应缓存在配置重新加载后继续复用
+        self.response_cache = response_cache
+        # 大语言模型在第一次使用时才初始化，避免启动时加载langchain等依赖
+        self._strategies: dict[str, LlmModelStrategy] = {}
+        self._strategy_lock = threading.Lock()
         self.chat_stream_lock = threading.Lock()
 
-    def chat(self, prompt: str, type: str, role_name: str, you_name: str, query: str, short_history: list[dict[str, str]], long_history: str) -> str:
+    def chat(self, prompt: str, type: str, role_name: str, you_name: str, query: str, short_history: list[dict[str, str]], long_history: str, cache: bool = False) -> str:
+        '''cache=True 时相同输入直接返回缓存的结果，只适用于没有对话历史、结果可复用的调用'''
+        cache_key = None
+        if cache and not short_history:
+            cache_key = self.response_cache.build_key(
+                type, prompt, query, role_name=role_name, you_name=you_name, long_history=long_history)
+            result = self.response_cache.get(cache_key)
+            if result is not None:
+                logger.debug(f"=> llm response cache hit # type:{type} #")
+                return result
         strategy = self.get_strategy(type)
         result = strategy.chat(prompt=prompt, role_name=role_name,
                                you_name=you_name, query=query, short_history=short_history, long_history=long_history)
+        if cache_key is not None and result:
+            self.response_cache.put(cache_key, result)
         return result
 
     def chatStream(self,
@@ -115,9 +141,26 @@ class LlmModelDriver:
                                         conversation_end_callback=conversation_end_callback))
 
     def get_strategy(self, type: str) -> LlmModelStrategy:
+        strategy = self._strategies.get(type)
+        if strategy is None:
+            with self._strategy_lock:
+                strategy = self._strategies.get(type)
+                if strategy is None:
+                    strategy = self.create_strategy(type)
+                    self._strategies[type] = strategy
+        return strategy
+
+    def create_strategy(self, type: str) -> LlmModelStrategy:
         if type == "openai":
-            return self.openai
+            openai_config = self.language_model_config.get("openai", {})
+            return OpenAILlmModelStrategy(api_key=openai_config.get("OPENAI_API_KEY"),
+                                          base_url=openai_config.get("OPENAI_BASE_URL"),
+                                          proxy=self.proxies.get("https") or self.proxies.get("http"))
         elif type == "text_generation":
-            return self.textGeneration
+            text_generation_config = self.language_model_config.get("textGeneration", {})
+            return TextGenerationLlmModelStrategy(
+                api_url=text_generation_config.get("TEXT_GENERATION_API_URL"),
+                web_socket_url=text_generation_config.get("TEXT_GENERATION_WEB_SOCKET_URL"),
+                proxies=self.proxies)
         else:
             raise ValueError("Unknown type")
@@ -0,0 +1,118 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class LlmResponseCache():
+    '''大语言模型响应缓存，用于表情、情感识别、记忆摘要等输入相同则结果可复用的调用
+
+    内存中使用LRU缓存，配置disk_path时同时写入sqlite磁盘缓存，服务重启后仍然有效
+
+    max_entries: 内存缓存的最大条目数
+    ttl: 缓存有效期（秒）
+    disk_path: 磁盘缓存文件路径，为空时只使用内存缓存
+    '''
+
+    max_entries: int
+    ttl: float
+    disk_path: str
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 24 * 3600, disk_path: str = None) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_path = disk_path
+        self._memory: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = None
+        if disk_path:
+            try:
+                self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+                self._disk.execute("PRAGMA journal_mode=wal")
+                self._disk.execute(
+                    "CREATE TABLE IF NOT EXISTS llm_response_cache (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)")
+                self._disk.commit()
+            except Exception as e:
+                self._disk = None
+                logger.error("open llm response cache error: %s" % str(e))
+
+    @staticmethod
+    def build_key(type: str, prompt: str, query: str, **context) -> str:
+        '''缓存键：模型类型 + prompt摘要 + 输入，context中的其他参数也参与摘要'''
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8"))
+        for name in sorted(context):
+            prompt_hash.update(f"\0{name}={context[name]}".encode("utf-8"))
+        return hashlib.sha256(f"{type}\0{prompt_hash.hexdigest()}\0{query}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> str:
+        now = time.time()
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None:
+                if item[0] > now:
+                    self._memory.move_to_end(key)
+                    return item[1]
+                del self._memory[key]
+            if self._disk is None:
+                return None
+            row = self._disk.execute(
+                "SELECT value, expires_at FROM llm_response_cache WHERE key = ?", (key,)).fetchone()
+            if row is None or row[1] <= now:
+                return None
+            self._put_memory(key, row[0], row[1])
+            return row[0]
+
+    def put(self, key: str, value: str) -> None:
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._put_memory(key, value, expires_at)
+            if self._disk is not None:
+                self._disk.execute("INSERT OR REPLACE INTO llm_response_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                                   (key, value, expires_at))
+                self._disk.commit()
+
+    def evict_expired(self) -> int:
+        '''清理过期的缓存，返回清理的条目数'''
+        now = time.time()
+        with self._lock:
+            expired = [key for key, (expires_at, _) in self._memory.items() if expires_at <= now]
+            for key in expired:
+                del self._memory[key]
+            count = len(expired)
+            if self._disk is not None:
+                count += self._disk.execute(
+                    "DELETE FROM llm_response_cache WHERE expires_at <= ?", (now,)).rowcount
+                self._disk.commit()
+        return count
+
+    def _put_memory(self, key: str, value: str, expires_at: float) -> None:
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+
+# LLM_CACHE_DISK_PATH 为空时只使用内存缓存
+singleton_llm_response_cache = LlmResponseCache(
+    max_entries=int(os.environ.get("LLM_CACHE_SIZE", "1024")),
+    ttl=float(os.environ.get("LLM_CACHE_TTL", str(24 * 3600))),
+    disk_path=os.environ.get("LLM_CACHE_DISK_PATH"))
+
+
+class LlmCacheEvictionJobTask():
+
+    @staticmethod
+    def start(interval: float):
+        from ..schedule.scheduler import singleton_job_scheduler
+
+        def evict():
+            count = singleton_llm_response_cache.evict_expired()
+            logger.debug(f"=> evict llm response cache # count:{count} #")
+
+        singleton_job_scheduler.schedule("llm_cache_eviction", evict, interval=interval, jitter=interval * 0.1)
+        logger.info("=> Start LlmCacheEvictionJobTask Success")
@@ -1,40 +1,43 @@
 import logging
 import os
 
-from langchain.chat_models import ChatOpenAI
-from langchain.schema import (
-    HumanMessage,
-    SystemMessage,
-    AIMessage
-)
-
 from ...utils.chat_message_utils import format_chat_text
 from ...utils.str_utils import remove_spaces_and_tabs
+from ...utils.lazy_import import lazy_import
+
+# langchain 导入耗时较长，懒加载到第一次创建模型时
+chat_models = lazy_import("langchain.chat_models")
+schema = lazy_import("langchain.schema")
 
 logger = logging.getLogger(__name__)
 
 
 class OpenAIGeneration():
-    llm: ChatOpenAI
+    llm: 'chat_models.ChatOpenAI'
 
-    def __init__(self) -> None:
+    def __init__(self, api_key: str = None, base_url: str = None, proxy: str = None) -> None:
+        '''未传入的配置从环境变量读取'''
         from dotenv import load_dotenv
         load_dotenv()
-        OPENAI_API_KEY = os.environ['OPENAI_API_KEY']
-        OPENAI_BASE_URL = os.environ['OPENAI_BASE_URL']
+        OPENAI_API_KEY = api_key if api_key is not None else os.environ['OPENAI_API_KEY']
+        OPENAI_BASE_URL = base_url if base_url is not None else os.environ['OPENAI_BASE_URL']
+        # 代理只作用于当前模型，不修改进程的环境变量
+        openai_proxy = proxy or None
         if OPENAI_BASE_URL != None and OPENAI_BASE_URL != "":
-            self.llm = ChatOpenAI(temperature=0.7, model_name="gpt-3.5-turbo",
-                                  openai_api_key=OPENAI_API_KEY, openai_api_base=OPENAI_BASE_URL)
+            self.llm = chat_models.ChatOpenAI(temperature=0.7, model_name="gpt-3.5-turbo",
+                                  openai_api_key=OPENAI_API_KEY, openai_api_base=OPENAI_BASE_URL,
+                                  openai_proxy=openai_proxy)
         else:
-            self.llm = ChatOpenAI(
-                temperature=0.7, model_name="gpt-3.5-turbo", openai_api_key=OPENAI_API_KEY)
+            self.llm = chat_models.ChatOpenAI(
+                temperature=0.7, model_name="gpt-3.5-turbo", openai_api_key=OPENAI_API_KEY,
+                openai_proxy=openai_proxy)
 
     def chat(self, prompt: str, role_name: str, you_name: str, query: str, short_history: list[dict[str, str]],
              long_history: str) -> str:
         prompt = prompt + query
         logger.debug(f"prompt:{prompt}")
         llm_result = self.llm.generate(
-            messages=[[HumanMessage(content=prompt)]])
+            messages=[[schema.HumanMessage(content=prompt)]])
         llm_result_text = llm_result.generations[0][0].text
         return llm_result_text
 
@@ -48,13 +51,13 @@ class OpenAIGeneration():
                          conversation_end_callback=None):
         logger.debug(f"prompt:{prompt}")
         messages = []
-        messages.append(SystemMessage(content=prompt))
+        messages.append(schema.SystemMessage(content=prompt))
         for item in history:
-            message = HumanMessage(content=item["human"])
+            message = schema.HumanMessage(content=item["human"])
             messages.append(message)
-            message = AIMessage(content=item["ai"])
+            message = schema.AIMessage(content=item["ai"])
             messages.append(message)
-        messages.append(HumanMessage(content=you_name + "说" + query))
+        messages.append(schema.HumanMessage(content=you_name + "说" + query))
         answer = ''
         for chunk in self.llm.stream(messages):
             content = chunk.content
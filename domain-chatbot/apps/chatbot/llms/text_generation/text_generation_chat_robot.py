@@ -17,6 +17,8 @@ except ImportError:
 class TextGeneration():
 
     max_new_tokens: int = 2048
+    # 模型上下文长度，prompt按token预算组装后不应超过该长度
+    truncation_length: int = 2048
     temperature: float = 0.7
     top_p: float = 0.9
     max_retries: int = 3
@@ -24,12 +26,15 @@ class TextGeneration():
     text_generation_api_url: str
     text_generation_web_socket_url: str
     chat_api_url: str
+    proxies: dict[str, str]
 
-    def __init__(self):
-        self.text_generation_api_url = os.getenv("TEXT_GENERATION_API_URL")
+    def __init__(self, api_url: str = None, web_socket_url: str = None, proxies: dict[str, str] = None):
+        '''未传入的地址从环境变量读取，proxies只作用于当前模型的HTTP请求'''
+        self.text_generation_api_url = api_url if api_url is not None else os.getenv("TEXT_GENERATION_API_URL")
         self.chat_api_url = self.text_generation_api_url + '/api/v1/chat'
-        self.text_generation_web_socket_url = os.getenv(
+        self.text_generation_web_socket_url = web_socket_url if web_socket_url is not None else os.getenv(
             "TEXT_GENERATION_WEB_SOCKET_URL")
+        self.proxies = proxies or None
         logger.debug(
             "======================== Init TextGenerationWebUiApi ========================")
         logger.debug(
@@ -38,6 +43,7 @@ class TextGeneration():
             f'=> text_generation_web_socket_url:{self.text_generation_web_socket_url}')
         logger.debug(f'=> chat_api_url:{self.chat_api_url}')
         logger.debug(f'=> max_new_tokens:{self.max_new_tokens}')
+        logger.debug(f'=> truncation_length:{self.truncation_length}')
         logger.debug(f'=> temperature:{self.temperature}')
         logger.debug(f'=> top_p:{self.top_p}')
         logger.info('=> Init TextGenerationWebUiApi Success')
@@ -46,7 +52,7 @@ class TextGeneration():
         body = self.build_body(prompt=prompt, role_name=role_name, you_name=you_name,
                                query=query, short_history=short_history, long_history=long_history)
         for _ in range(self.max_retries + 1):
-            response = requests.post(self.chat_api_url, json=body)
+            response = requests.post(self.chat_api_url, json=body, proxies=self.proxies)
             if response.status_code == 200:
                 result = response.json()[
                     'results'][0]['history']['visible'][-1][1]
@@ -164,7 +170,7 @@ class TextGeneration():
             'negative_prompt': '',
             'seed': -1,
             'add_bos_token': True,
-            'truncation_length': 2048,
+            'truncation_length': self.truncation_length,
             'ban_eos_token': False,
             'custom_token_bans': '',
             'skip_special_tokens': True,
@@ -232,7 +238,7 @@ class TextGeneration():
 
             'seed': -1,
             'add_bos_token': True,
-            'truncation_length': 2048,
+            'truncation_length': self.truncation_length,
             'ban_eos_token': False,
             'custom_token_bans': '',
             'skip_special_tokens': True,
@@ -1,13 +1,17 @@
-import torch
-from transformers import AutoTokenizer, AutoModel
+from ..utils.lazy_import import lazy_import
+
+# torch、transformers 导入耗时很长，懒加载到第一次使用向量化模型时
+torch = lazy_import("torch")
+transformers = lazy_import("transformers")
+
 
 class Embedding:
 
     def __init__(self):
         # 初始化向量化模型
         self.model_name = 'hfl/chinese-roberta-wwm-ext'
-        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
-        self.model = AutoModel.from_pretrained(self.model_name)
+        self.tokenizer = transformers.AutoTokenizer.from_pretrained(self.model_name)
+        self.model = transformers.AutoModel.from_pretrained(self.model_name)
 
     def get_embedding_from_language_model(self, text: str):
         inputs = self.tokenizer(text, return_tensors="pt",
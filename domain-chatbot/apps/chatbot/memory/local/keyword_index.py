@@ -0,0 +1,148 @@
+import math
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable
+
+
+class KeywordDocument():
+    __slots__ = ("id", "text", "sender", "tags")
+
+    def __init__(self, id: int, text: str, sender: str, tags: list[str]) -> None:
+        self.id = id
+        self.text = text
+        self.sender = sender
+        self.tags = tags
+
+
+class OwnerKeywordIndex():
+    '''单个角色的倒排索引：关键词 => 记录id集合'''
+
+    def __init__(self) -> None:
+        self.documents: dict[int, KeywordDocument] = {}
+        self.postings: dict[str, set[int]] = {}
+        self.total_length = 0
+
+    def add(self, document: KeywordDocument) -> None:
+        if document.id in self.documents:
+            self.remove(document.id)
+        self.documents[document.id] = document
+        self.total_length += len(document.tags)
+        for tag in document.tags:
+            self.postings.setdefault(tag, set()).add(document.id)
+
+    def remove(self, id: int) -> None:
+        document = self.documents.pop(id, None)
+        if document is None:
+            return
+        self.total_length -= len(document.tags)
+        for tag in document.tags:
+            ids = self.postings.get(tag)
+            if ids is not None:
+                ids.discard(id)
+                if len(ids) == 0:
+                    del self.postings[tag]
+
+
+class KeywordIndex():
+    '''基于jieba标签的内存倒排索引，使用BM25打分
+
+    每个角色的索引在第一次检索时通过loader从数据库构建，之后随新写入的记忆增量更新。
+    构建在锁外进行，同一角色的并发检索等待同一次构建，不影响其他角色的检索和写入。
+    超过max_owners个角色时淘汰最久未检索的索引，淘汰后再次检索时重新构建。
+    标签由 jieba.analyse.extract_tags 提取且不重复，词频固定为1，BM25只需要考虑idf和文档长度
+
+    loader: 加载函数 owner => 该角色的全部记忆
+    max_owners: 最多缓存的角色索引数
+    k1, b: BM25参数
+    '''
+
+    k1: float
+    b: float
+    max_owners: int
+
+    def __init__(self, loader: Callable[[str], list[KeywordDocument]], max_owners: int = 64,
+                 k1: float = 1.2, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self.max_owners = max_owners
+        self._loader = loader
+        self._indexes: OrderedDict[str, OwnerKeywordIndex] = OrderedDict()
+        # 正在构建的角色 => (构建结果, 构建期间新增的记忆)
+        self._building: dict[str, tuple[Future, list[KeywordDocument]]] = {}
+        self._lock = threading.Lock()
+
+    def search(self, owner: str, query_tags: list[str], limit: int, sender: str = None) -> list[tuple[KeywordDocument, float]]:
+        '''检索与关键词最相关的记忆，按得分从高到低排列'''
+        index = self._get_index(owner)
+        with self._lock:
+            document_count = len(index.documents)
+            if document_count == 0:
+                return []
+            avg_length = index.total_length / document_count
+            scores: dict[int, float] = {}
+            for tag in set(query_tags):
+                ids = index.postings.get(tag)
+                if not ids:
+                    continue
+                idf = math.log(1 + (document_count - len(ids) + 0.5) / (len(ids) + 0.5))
+                for id in ids:
+                    document = index.documents[id]
+                    if sender is not None and document.sender != sender:
+                        continue
+                    length_norm = 1 - self.b + self.b * len(document.tags) / avg_length
+                    scores[id] = scores.get(id, 0.0) + idf * (self.k1 + 1) / (1 + self.k1 * length_norm)
+            ranked = sorted(scores.items(), key=lambda item: (item[1], item[0]), reverse=True)[:limit]
+            return [(index.documents[id], score) for id, score in ranked]
+
+    def add(self, owner: str, document: KeywordDocument) -> None:
+        '''新增记忆，未构建索引的角色等到第一次检索时再从数据库加载'''
+        with self._lock:
+            index = self._indexes.get(owner)
+            if index is not None:
+                index.add(document)
+            elif owner in self._building:
+                self._building[owner][1].append(document)
+
+    def clear(self, owner: str) -> None:
+        with self._lock:
+            self._indexes.pop(owner, None)
+            # 正在进行的构建完成后不再写入
+            self._building.pop(owner, None)
+
+    def _get_index(self, owner: str) -> OwnerKeywordIndex:
+        with self._lock:
+            index = self._indexes.get(owner)
+            if index is not None:
+                self._indexes.move_to_end(owner)
+                return index
+            building = self._building.get(owner)
+            builder = building is None
+            if builder:
+                building = self._building[owner] = (Future(), [])
+        future, added = building
+        if not builder:
+            # 其他线程正在构建同一个角色的索引
+            return future.result()
+
+        try:
+            index = OwnerKeywordIndex()
+            for document in self._loader(owner):
+                index.add(document)
+        except Exception as e:
+            with self._lock:
+                if self._building.get(owner) is building:
+                    del self._building[owner]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            # 构建期间新增的记忆
+            for document in added:
+                index.add(document)
+            if self._building.get(owner) is building:
+                del self._building[owner]
+                self._indexes[owner] = index
+                while len(self._indexes) > self.max_owners:
+                    self._indexes.popitem(last=False)
+        future.set_result(index)
+        return index
@@ -3,29 +3,36 @@ import logging
 import jieba
 import jieba.analyse
 import json
+from django.db import transaction
 from django.db.models import Q
 from ..base_storage import BaseStorage
 from ...models import LocalMemoryModel
+from .short_memory_buffer import ShortMemoryBuffer
+from .keyword_index import KeywordDocument, KeywordIndex
+from .tag_extraction_queue import TagExtractionMessage, put_message
 
-# TODO 搜索方式待整改
 logger = logging.getLogger(__name__)
 
 class LocalStorage(BaseStorage):
 
+    short_memory_buffer: ShortMemoryBuffer
+    keyword_index: KeywordIndex
+
     def __init__(self, memory_storage_config: dict[str, str]):
+        self.short_memory_buffer = ShortMemoryBuffer(loader=self.query_conversation)
+        self.keyword_index = KeywordIndex(loader=self.load_keyword_documents)
         logger.info("=> Load LocalStorage Success")
 
-    def search(self, query_text: str, limit: int, owner: str) -> list[str]:
-        # 使用 Q 对象组合查询条件，
-        query = Q(owner=owner)
+    def search(self, query_text: str, limit: int, owner: str, sender: str = None) -> list[str]:
+        '''按关键词检索记忆，使用BM25对jieba标签打分'''
+        query_tags = jieba.analyse.extract_tags(query_text, topK=10)
+        results = self.keyword_index.search(owner=owner, query_tags=query_tags, limit=limit, sender=sender)
+        return [document.text for document, _ in results]
 
-        # 查询结果，并限制数量
-        results = LocalMemoryModel.objects.filter(
-            query).order_by('-timestamp')[:limit]
-      
-        # 提取查询结果的 text 字段
-        result_texts = [result.text for result in results]
-        return result_texts
+    def load_keyword_documents(self, owner: str) -> list[KeywordDocument]:
+        results = LocalMemoryModel.objects.filter(owner=owner).values_list('id', 'text', 'sender', 'tags')
+        return [KeywordDocument(id=id, text=text, sender=sender, tags=list(filter(None, tags.split(","))))
+                for id, text, sender, tags in results.iterator()]
 
     def pageQuery(self, page_num: int, page_size: int, owner: str) -> list[str]:
         # 计算分页偏移量
@@ -37,21 +44,94 @@ class LocalStorage(BaseStorage):
         
         return list(results)
 
+    def recent_conversation(self, owner: str, sender: str = None, limit: int = 5, query_text: str = None) -> list[dict[str, str]]:
+        '''获取最近的对话，按时间倒序排列，优先从环形缓冲区读取
+
+        query_text不为空时按标签过滤：保留最近的一轮对话，更早的对话只保留与query_text有相同关键词的
+        '''
+        if query_text is None:
+            records = self.short_memory_buffer.recent(owner=owner, sender=sender, limit=limit)
+        else:
+            records = self.filter_relevant(
+                self.short_memory_buffer.recent(owner=owner, sender=sender, limit=self.short_memory_buffer.capacity),
+                query_text=query_text, limit=limit)
+        return [{"human": record["human"], "ai": record["ai"]} for record in records]
+
+    def filter_relevant(self, records: list[dict], query_text: str, limit: int) -> list[dict]:
+        query_tags = set(jieba.analyse.extract_tags(query_text, topK=10))
+        if len(query_tags) == 0:
+            return records[:limit]
+        relevant = records[:1]
+        for record in records[1:]:
+            if len(relevant) >= limit:
+                break
+            if query_tags & record["tags"]:
+                relevant.append(record)
+        return relevant
+
+    def query_conversation(self, owner: str, sender: str, limit: int) -> list[dict[str, str]]:
+        '''从数据库查询最近的对话，sender为空时查询该角色与所有人的对话'''
+        query = Q(owner=owner)
+        if sender is not None:
+            query &= Q(sender=sender)
+        results = LocalMemoryModel.objects.filter(query).order_by('-timestamp').values(
+            'id', 'human', 'ai', 'tags')[:limit]
+        return [{"id": result["id"], "human": result["human"], "ai": result["ai"],
+                 "tags": set(filter(None, result["tags"].split(",")))} for result in results]
+
     def save(self, pk: int,  query_text: str, sender: str, owner: str, importance_score: int) -> None:
-        query_words = jieba.cut(query_text, cut_all=False)
-        query_tags = list(query_words)
-        keywords = jieba.analyse.extract_tags(" ".join(query_tags), topK=20)
+        self.save_memory(pk=pk, query_text=query_text, sender=sender, owner=owner)
+
+    def save_conversation(self, pk: int, human: str, ai: str, sender: str, owner: str) -> None:
+        '''保存一轮对话，同时追加到环形缓冲区'''
+        self.save_conversations([{"pk": pk, "human": human, "ai": ai, "sender": sender, "owner": owner}])
+
+    def save_conversations(self, conversations: list[dict]) -> None:
+        '''在一个事务中批量写入多轮对话，conversations中每项包含 pk、human、ai、sender、owner'''
+        current_timestamp = datetime.datetime.now()
+        # 同一批对话按顺序递增时间戳，保证按时间排序时顺序不变
+        with transaction.atomic():
+            LocalMemoryModel.objects.bulk_create([LocalMemoryModel(
+                id=conversation["pk"],
+                text=f"{conversation['human']};{conversation['ai']}",
+                human=conversation["human"],
+                ai=conversation["ai"],
+                tags="",
+                sender=conversation["sender"],
+                owner=conversation["owner"],
+                timestamp=current_timestamp + datetime.timedelta(microseconds=i)
+            ) for i, conversation in enumerate(conversations)])
+        for conversation in conversations:
+            self.short_memory_buffer.append(owner=conversation["owner"], sender=conversation["sender"], record={
+                "id": conversation["pk"], "human": conversation["human"], "ai": conversation["ai"], "tags": set()})
+            put_message(TagExtractionMessage(pk=conversation["pk"], owner=conversation["owner"],
+                                             sender=conversation["sender"],
+                                             text=f"{conversation['human']};{conversation['ai']}"))
+
+    def save_memory(self, pk: int, query_text: str, sender: str, owner: str, human: str = "", ai: str = "") -> None:
+        '''写入记忆，标签由后台任务批量提取'''
         current_timestamp = datetime.datetime.now().isoformat()  #
         local_memory_model = LocalMemoryModel(
             id=pk,
             text=query_text,
-            tags=",".join(keywords),  # 设置标签
+            human=human,
+            ai=ai,
+            tags="",
             sender=sender,
             owner=owner,
             timestamp=current_timestamp
         )
-        local_memory_model.save()
+        # 主键由雪花算法生成，直接插入，不需要先查询记录是否存在
+        local_memory_model.save(force_insert=True)
+        put_message(TagExtractionMessage(pk=pk, owner=owner, sender=sender, text=query_text))
+
+    def on_tags_extracted(self, pk: int, owner: str, sender: str, text: str, tags: list[str]) -> None:
+        '''标签提取完成后同步到短期记忆缓冲区和关键词索引'''
+        self.short_memory_buffer.update(owner=owner, pk=pk, tags=set(tags))
+        self.keyword_index.add(owner, KeywordDocument(id=pk, text=text, sender=sender, tags=tags))
 
     def clear(self, owner: str) -> None:
         # 清除指定 owner 的记录
         LocalMemoryModel.objects.filter(owner=owner).delete()
+        self.short_memory_buffer.clear(owner)
+        self.keyword_index.clear(owner)
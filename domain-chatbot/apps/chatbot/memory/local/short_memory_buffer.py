@@ -0,0 +1,98 @@
+import threading
+from collections import OrderedDict, deque
+from typing import Callable
+
+
+class ShortMemoryBuffer():
+    '''短期记忆环形缓冲区
+
+    按 (owner, sender) 和 (owner, None) 分别缓存最近的对话，(owner, None) 表示该角色与所有人的对话。
+    某个键第一次访问时通过loader从数据库预热，之后新写入的对话直接追加到缓冲区，读取时不再访问数据库。
+    超过max_keys个键时淘汰最久未访问的键，淘汰后再次访问时重新预热
+
+    capacity: 每个键缓存的最大对话数
+    max_keys: 最多缓存的键数
+    loader: 预热函数 (owner, sender, limit) => 按时间倒序排列的对话记录
+    '''
+
+    capacity: int
+    max_keys: int
+
+    def __init__(self, loader: Callable[[str, str, int], list[dict[str, str]]], capacity: int = 20,
+                 max_keys: int = 256) -> None:
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self._loader = loader
+        self._buffers: OrderedDict[tuple[str, str], deque] = OrderedDict()
+        # 正在预热的键 => 预热期间追加的对话，预热完成后合并到缓冲区
+        self._warming: dict[tuple[str, str], list[dict[str, str]]] = {}
+        self._lock = threading.Lock()
+
+    def recent(self, owner: str, sender: str = None, limit: int = 5) -> list[dict[str, str]]:
+        '''获取最近的对话，按时间倒序排列'''
+        if limit > self.capacity:
+            return self._loader(owner, sender, limit)
+        key = (owner, sender)
+        with self._lock:
+            buffer = self._buffers.get(key)
+            if buffer is not None:
+                self._buffers.move_to_end(key)
+                items = list(buffer)
+        if buffer is None:
+            items = self._warm(key)
+        return items[::-1][:limit]
+
+    def append(self, owner: str, sender: str, record: dict[str, str]) -> None:
+        '''写入数据库后追加到缓冲区，未预热的键等到第一次读取时再从数据库加载'''
+        with self._lock:
+            for key in ((owner, sender), (owner, None)):
+                buffer = self._buffers.get(key)
+                if buffer is None:
+                    buffer = self._warming.get(key)
+                # 预热时已经从数据库加载到的记录不重复追加
+                if buffer is not None and all(item.get("id") != record.get("id") for item in buffer):
+                    buffer.append(record)
+
+    def update(self, owner: str, pk: int, **fields) -> None:
+        '''更新缓冲区中已有记录的字段，例如后台提取完成的标签'''
+        with self._lock:
+            for (buffer_owner, _), buffer in list(self._buffers.items()) + list(self._warming.items()):
+                if buffer_owner != owner:
+                    continue
+                for record in buffer:
+                    if record.get("id") == pk:
+                        record.update(fields)
+
+    def clear(self, owner: str) -> None:
+        with self._lock:
+            for key in [key for key in self._buffers if key[0] == owner]:
+                del self._buffers[key]
+            # 正在进行的预热取消，加载完成后不再写入清空前的记录
+            for key in [key for key in self._warming if key[0] == owner]:
+                del self._warming[key]
+
+    def _warm(self, key: tuple[str, str]) -> list[dict[str, str]]:
+        '''在锁外从数据库加载，加载期间追加的对话先记录下来，加载完成后合并，返回按时间正序排列的对话'''
+        with self._lock:
+            appended = self._warming.setdefault(key, [])
+        try:
+            records = self._loader(key[0], key[1], self.capacity)
+        except Exception:
+            with self._lock:
+                if self._warming.get(key) is appended:
+                    del self._warming[key]
+            raise
+        with self._lock:
+            buffer = deque(reversed(records), maxlen=self.capacity)
+            loaded_ids = {record.get("id") for record in buffer}
+            buffer.extend(record for record in appended if record.get("id") not in loaded_ids)
+            if self._warming.get(key) is not appended:
+                # 加载期间该键被清空，或者并发的预热已经完成，不写入缓冲区
+                return list(self._buffers.get(key, buffer))
+            # 同一个键被并发预热时只保留先完成的缓冲区
+            buffer = self._buffers.setdefault(key, buffer)
+            del self._warming[key]
+            self._buffers.move_to_end(key)
+            while len(self._buffers) > self.max_keys:
+                self._buffers.popitem(last=False)
+            return list(buffer)
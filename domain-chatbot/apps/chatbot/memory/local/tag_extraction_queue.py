@@ -0,0 +1,103 @@
+import logging
+import queue
+import threading
+import traceback
+import jieba
+import jieba.analyse
+from ...models import LocalMemoryModel
+
+logger = logging.getLogger(__name__)
+
+# 待提取标签的记忆队列
+tag_extraction_queue = queue.SimpleQueue()
+
+# 每批处理的最大记忆数
+BATCH_SIZE = 64
+# 每条记忆提取的最大关键词数
+TOP_K = 20
+# 没有提取到关键词时写入的标签，区别于尚未提取的空字符串，读取时按逗号拆分后为空
+NO_TAGS = ","
+
+
+class TagExtractionMessage():
+    '''待提取标签的记忆'''
+    pk: int
+    owner: str
+    sender: str
+    text: str
+
+    def __init__(self, pk: int, owner: str, sender: str, text: str) -> None:
+        self.pk = pk
+        self.owner = owner
+        self.sender = sender
+        self.text = text
+
+
+def put_message(message: TagExtractionMessage):
+    global tag_extraction_queue
+    tag_extraction_queue.put(message)
+
+
+def extract_batch(messages: list[TagExtractionMessage]) -> None:
+    '''批量提取标签，写回数据库后同步到短期记忆缓冲区和关键词索引'''
+    from ...config import singleton_sys_config
+    tags_list = [jieba.analyse.extract_tags(message.text, topK=TOP_K) for message in messages]
+    LocalMemoryModel.objects.bulk_update(
+        [LocalMemoryModel(id=message.pk, tags=",".join(tags) or NO_TAGS) for message, tags in zip(messages, tags_list)],
+        ['tags'])
+    local_storage = singleton_sys_config.runtime().memory_storage_driver.short_memory_storage
+    for message, tags in zip(messages, tags_list):
+        local_storage.on_tags_extracted(pk=message.pk, owner=message.owner,
+                                        sender=message.sender, text=message.text, tags=tags)
+    logger.debug(f"extract tags # size:{len(messages)} #")
+
+
+def extract_pending():
+    '''处理服务重启前尚未提取标签的记忆'''
+    last_id = None
+    while True:
+        rows = LocalMemoryModel.objects.filter(tags="").exclude(text="")
+        if last_id is not None:
+            rows = rows.filter(id__gt=last_id)
+        rows = list(rows.order_by('id').values_list('id', 'owner', 'sender', 'text')[:BATCH_SIZE])
+        if len(rows) == 0:
+            return
+        extract_batch([TagExtractionMessage(pk=pk, owner=owner, sender=sender, text=text)
+                       for pk, owner, sender, text in rows])
+        last_id = rows[-1][0]
+
+
+def extract_tags():
+    global tag_extraction_queue
+    try:
+        # 启动时加载词典，避免在对话过程中第一次分词时才加载
+        jieba.initialize()
+        extract_pending()
+    except Exception as e:
+        traceback.print_exc()
+        logger.error("extract pending tags error: %s" % str(e))
+    while True:
+        try:
+            messages = [tag_extraction_queue.get()]
+            # 取出队列中已有的记忆，合并为一批处理
+            while len(messages) < BATCH_SIZE:
+                try:
+                    messages.append(tag_extraction_queue.get_nowait())
+                except queue.Empty:
+                    break
+            extract_batch(messages)
+        except Exception as e:
+            traceback.print_exc()
+            logger.error("extract tags error: %s" % str(e))
+
+
+class TagExtractionJobTask():
+    @staticmethod
+    def start():
+        # 创建后台线程
+        background_thread = threading.Thread(target=extract_tags)
+        # 将后台线程设置为守护线程，以便在主线程结束时自动退出
+        background_thread.daemon = True
+        # 启动后台线程
+        background_thread.start()
+        logger.info("=> Start TagExtractionJobTask Success")
@@ -1,14 +1,14 @@
 import json
 import logging
+import threading
 import traceback
 from typing import Tuple
 
-from ..config.sys_config import SysConfig
+from ..config.sys_config import SysConfig, RuntimeConfig
 from typing import List
-from .milvus.milvus_storage_impl import MilvusStorage
 from .local.local_storage_impl import LocalStorage
 from .base_storage import BaseStorage
-from ..utils.snowflake_utils import SnowFlake
+from ..utils.snowflake_utils import SnowFlake, singleton_snow_flake
 from typing import Any, Dict, List
 
 logger = logging.getLogger(__name__)
@@ -17,26 +17,36 @@ class MemoryStorageDriver():
 
     sys_config: SysConfig
     short_memory_storage: LocalStorage
-    long_memory_storage: MilvusStorage
-    snow_flake: SnowFlake = SnowFlake(data_center_id=5, worker_id=5)
+    # 每个进程分配不同的机器编号，多进程部署时主键不会冲突
+    snow_flake: SnowFlake = singleton_snow_flake
 
     def __init__(self, memory_storage_config: dict[str, str], sys_config: SysConfig) -> None:
         self.sys_config = sys_config
+        self.memory_storage_config = memory_storage_config
         self.short_memory_storage = LocalStorage(memory_storage_config)
-        if sys_config.enable_longMemory:
-            self.long_memory_storage = MilvusStorage(memory_storage_config)
+        self._long_memory_storage = None
+        self._long_memory_lock = threading.Lock()
+
+    @property
+    def long_memory_storage(self):
+        '''长期记忆模块依赖pymilvus和向量化模型，第一次使用时才初始化'''
+        if self._long_memory_storage is None:
+            with self._long_memory_lock:
+                if self._long_memory_storage is None:
+                    from .milvus.milvus_storage_impl import MilvusStorage
+                    self._long_memory_storage = MilvusStorage(self.memory_storage_config)
+        return self._long_memory_storage
 
     def search_short_memory(self, query_text: str, you_name: str, role_name: str) -> list[Dict[str, str]]:
-        local_memory = self.short_memory_storage.pageQuery(
-            page_num=1, page_size=self.sys_config.local_memory_num, owner=role_name)
-        dict_list = []
-        for json_string in local_memory:
-            json_dict = json.loads(json_string)
-            dict_list.append(json_dict)
-        return dict_list
+        # 短期记忆按 (角色, 用户) 划分，直播间里不同观众的对话互不干扰
+        runtime_config = self.sys_config.runtime()
+        return self.short_memory_storage.recent_conversation(
+            owner=role_name, sender=you_name, limit=runtime_config.local_memory_num,
+            query_text=query_text if runtime_config.enable_short_memory_relevance else None)
 
     def search_lang_memory(self, query_text: str, you_name: str, role_name: str) -> str:
-        if self.sys_config.enable_longMemory:
+        runtime_config = self.sys_config.runtime()
+        if runtime_config.enable_longMemory:
             try:
                 # 获取长期记忆，按照角色划分
                 long_memory = self.long_memory_storage.search(
@@ -53,36 +63,77 @@ class MemoryStorageDriver():
                 traceback.print_exc()
                 logger.error("chat error: %s" % str(e))
             return ""
+        elif runtime_config.enable_keyword_memory:
+            # 未开启向量数据库时，使用本地关键词索引检索相关记忆
+            return ";".join(self.short_memory_storage.search(
+                query_text, 3, owner=role_name, sender=you_name))
         else:
             return ""
 
     def save(self,  you_name: str, query_text: str, role_name: str, answer_text: str) -> None:
+        self.save_batch([{"you_name": you_name, "query_text": query_text,
+                          "role_name": role_name, "answer_text": answer_text}])
 
-        # 存储短期记忆
-        pk = self.get_current_entity_id()
-        local_history = {
-            "ai": self.format_role_history(role_name=role_name, answer_text=answer_text),
-            "human": self.format_you_history(you_name=you_name, query_text=query_text)
-        }
-        self.short_memory_storage.save(
-            pk, json.dumps(local_history), you_name, role_name, importance_score=1)
-
-        # 是否开启长期记忆
-        if self.sys_config.enable_longMemory:
-            # 将当前对话语句生成摘要
-            history = self.format_history(
-                you_name=you_name, query_text=query_text, role_name=role_name, answer_text=answer_text)
-            importance_score = 3
-            if self.sys_config.enable_summary:
-                memory_summary = MemorySummary(self.sys_config)
-                history = memory_summary.summary(
-                    llm_model_type=self.sys_config.summary_llm_model_driver_type, input=history)
-                # 计算记忆的重要程度
-                memory_importance = MemoryImportance(self.sys_config)
-                importance_score = memory_importance.importance(
-                    self.sys_config.summary_llm_model_driver_type, input=history)
-            self.long_memory_storage.save(
-                pk, history, you_name, role_name, importance_score)
+    def save_batch(self, histories: list[dict[str, str]]) -> list[int]:
+        '''批量保存对话，histories中每项包含 you_name、query_text、role_name、answer_text
+
+        一条对话保存失败不影响同一批的其他对话，返回短期记忆或长期记忆保存失败的对话下标
+        '''
+
+        runtime_config = self.sys_config.runtime()
+        failed = []
+
+        # 存储短期记忆，一批对话在同一个事务中写入，事务失败时逐条写入，只丢弃写入失败的对话
+        pks = self.snow_flake.next_ids(len(histories))
+        conversations = [{
+            "pk": pk,
+            "human": self.format_you_history(you_name=history["you_name"], query_text=history["query_text"]),
+            "ai": self.format_role_history(role_name=history["role_name"], answer_text=history["answer_text"]),
+            "sender": history["you_name"],
+            "owner": history["role_name"]
+        } for pk, history in zip(pks, histories)]
+        try:
+            self.short_memory_storage.save_conversations(conversations)
+        except Exception as e:
+            logger.error("save short memory batch error, retry one by one: %s" % str(e))
+            for i, conversation in enumerate(conversations):
+                try:
+                    self.short_memory_storage.save_conversations([conversation])
+                except Exception as e:
+                    traceback.print_exc()
+                    logger.error(f"save short memory error # pk:{conversation['pk']} # %s" % str(e))
+                    failed.append(i)
+
+        # 是否开启长期记忆，每条对话单独生成摘要和写入
+        if runtime_config.enable_longMemory:
+            for i, (pk, history) in enumerate(zip(pks, histories)):
+                if i in failed:
+                    continue
+                try:
+                    self.save_long_memory(pk=pk, runtime_config=runtime_config, **history)
+                except Exception as e:
+                    traceback.print_exc()
+                    logger.error(f"save long memory error # pk:{pk} # %s" % str(e))
+                    failed.append(i)
+        return failed
+
+    def save_long_memory(self, pk: int, you_name: str, query_text: str, role_name: str, answer_text: str,
+                         runtime_config: RuntimeConfig = None) -> None:
+        runtime_config = runtime_config or self.sys_config.runtime()
+        # 将当前对话语句生成摘要
+        history = self.format_history(
+            you_name=you_name, query_text=query_text, role_name=role_name, answer_text=answer_text)
+        importance_score = 3
+        if runtime_config.enable_summary:
+            memory_summary = MemorySummary(runtime_config)
+            history = memory_summary.summary(
+                llm_model_type=runtime_config.summary_llm_model_driver_type, input=history)
+            # 计算记忆的重要程度
+            memory_importance = MemoryImportance(runtime_config)
+            importance_score = memory_importance.importance(
+                runtime_config.summary_llm_model_driver_type, input=history)
+        self.long_memory_storage.save(
+            pk, history, you_name, role_name, importance_score)
 
     def format_history(self, you_name: str, query_text: str, role_name: str, answer_text: str):
         you_history = self.format_you_history(
@@ -105,17 +156,18 @@ class MemoryStorageDriver():
         return self.snow_flake.task()
 
     def clear(self, owner: str) -> None:
-        self.long_memory_storage.clear(owner)
+        if self.sys_config.runtime().enable_longMemory:
+            self.long_memory_storage.clear(owner)
         self.short_memory_storage.clear(owner)
 
 
 class MemorySummary():
 
-    sys_config: SysConfig
+    runtime_config: RuntimeConfig
     prompt: str
 
-    def __init__(self, sys_config: SysConfig) -> None:
-        self.sys_config = sys_config
+    def __init__(self, runtime_config: RuntimeConfig) -> None:
+        self.runtime_config = runtime_config
         self.prompt = '''
                <s>[INST] <<SYS>>          
                 Please help me extract key information about the content of the conversation, here is an example of extracting key information:
@@ -128,8 +180,8 @@ class MemorySummary():
         '''
 
     def summary(self, llm_model_type: str, input: str) -> str:
-        result = self.sys_config.llm_model_driver.chat(prompt=self.prompt, type=llm_model_type, role_name="",
-                                                       you_name="", query=f"input:{input}", short_history=[], long_history="")
+        result = self.runtime_config.llm_model_driver.chat(prompt=self.prompt, type=llm_model_type, role_name="",
+                                                           you_name="", query=f"input:{input}", short_history=[], long_history="", cache=True)
         logger.debug("=> summary:", result)
         summary = input
         if result:
@@ -147,11 +199,11 @@ class MemorySummary():
 
 class MemoryImportance():
 
-    sys_config: SysConfig
+    runtime_config: RuntimeConfig
     prompt: str
 
-    def __init__(self, sys_config: SysConfig) -> None:
-        self.sys_config = sys_config
+    def __init__(self, runtime_config: RuntimeConfig) -> None:
+        self.runtime_config = runtime_config
         self.prompt = '''
                <s>[INST] <<SYS>>  
                 There is a scoring mechanism for the importance of memory, on a scale of 10, where 1 is a mundane task (eg, brushing your teeth, making your bed) and 10 is an impressive extremely and important task (eg, breaking up, college admissions), Please help me evaluate the importance score of the following memory.
@@ -162,8 +214,8 @@ class MemoryImportance():
         '''
 
     def importance(self, llm_model_type: str, input: str) -> int:
-        result = self.sys_config.llm_model_driver.chat(prompt=self.prompt, type=llm_model_type, role_name="",
-                                                       you_name="", query=f"memory:{input}", short_history=[], long_history="")
+        result = self.runtime_config.llm_model_driver.chat(prompt=self.prompt, type=llm_model_type, role_name="",
+                                                           you_name="", query=f"memory:{input}", short_history=[], long_history="", cache=True)
         logger.debug("=> score:", result)
         # 寻找 JSON 子串的开始和结束位置
         start_idx = result.find('{')
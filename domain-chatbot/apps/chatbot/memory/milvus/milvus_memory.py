@@ -4,7 +4,6 @@ import os
 from ...memory.embedding import Embedding
 from ...utils.snowflake_utils import SnowFlake
 from pymilvus import DataType, FieldSchema, CollectionSchema, Collection, connections
-from sentence_transformers import SentenceTransformer
 import time
 
 
@@ -64,6 +63,23 @@ class MilvusMemory():
                 [importance_score], [embedding]]
         self.collection.insert(data)
 
+    def insert_memories(self, memories: list[dict]):
+        '''批量插入记忆对象，一次写入向量数据库
+
+        memories中每项包含 pk、text、sender、owner、importance_score
+        '''
+        timestamp = time.time()
+        embeddings = [self.embedding.get_embedding_from_language_model(
+            memory["text"]) for memory in memories]
+        data = [[memory["pk"] for memory in memories],
+                [memory["text"] for memory in memories],
+                [memory["sender"] for memory in memories],
+                [memory["owner"] for memory in memories],
+                [timestamp] * len(memories),
+                [memory["importance_score"] for memory in memories],
+                embeddings]
+        self.collection.insert(data)
+
     def compute_relevance(self, query_text: str, limit: int, expr: str == None):
         '''定义计算相关性分数函数'''
 
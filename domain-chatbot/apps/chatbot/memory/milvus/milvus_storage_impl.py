@@ -1,6 +1,9 @@
 from .milvus_memory import MilvusMemory
 from ..base_storage import BaseStorage
 
+# Milvus单次查询 offset + limit 的上限
+MAX_QUERY_WINDOW = 16384
+
 
 class MilvusStorage(BaseStorage):
     '''Milvus向量存储记忆模块'''
@@ -18,7 +21,8 @@ class MilvusStorage(BaseStorage):
     def search(self, query_text: str, limit: int, sender: str, owner: str) -> list[str]:
 
         self.milvus_memory.loda()
-        expr = f"owner == '{owner}' and sender == '{sender}'"
+        # 反思生成的记忆以角色自己为sender，和当前用户的记忆一起检索
+        expr = f"owner == '{owner}' and sender in ['{sender}', '{owner}']"
         # 查询记忆，并且使用 关联性 + 重要性 + 最近性 算法进行评分
         memories = self.milvus_memory.compute_relevance(
             query_text, limit, expr=expr)
@@ -44,7 +48,7 @@ class MilvusStorage(BaseStorage):
         offset = (page_num - 1) * page_size
         limit = page_size
         result = self.milvus_memory.pageQuery(
-            offset=offset, limit=limit, expr=f"owner={owner}")
+            offset=offset, limit=limit, expr=f"owner == '{owner}'")
         self.milvus_memory.release()
         return result
 
@@ -54,6 +58,49 @@ class MilvusStorage(BaseStorage):
             pk=pk, text=query_text, owner=owner, sender=sender, importance_score=importance_score)
         self.milvus_memory.release()
 
+    def query_after(self, owner: str, timestamp: float, page_size: int, exclude_sender: str = None) -> list[dict]:
+        '''查询时间戳之后的全部记忆，按时间从早到晚排序
+
+        Milvus的query不保证返回顺序，先分页取完再排序，截断后排序会跳过较早的记忆。
+        超过单次查询窗口时只返回较早的一段时间内的全部记忆，其余留到下一次
+        '''
+        expr = f"owner == '{owner}' and timestamp > {timestamp}"
+        if exclude_sender is not None:
+            expr += f" and sender != '{exclude_sender}'"
+        self.milvus_memory.loda()
+        try:
+            result = self._query_all(expr, page_size)
+        finally:
+            self.milvus_memory.release()
+        return sorted(result, key=lambda item: item["timestamp"])
+
+    def _query_all(self, expr: str, page_size: int, until: float = None) -> list[dict]:
+        range_expr = expr if until is None else f"{expr} and timestamp <= {until}"
+        result = []
+        while True:
+            limit = min(page_size, MAX_QUERY_WINDOW - len(result))
+            page = self.milvus_memory.pageQuery(offset=len(result), limit=limit, expr=range_expr)
+            result.extend(page)
+            if len(page) < limit:
+                return result
+            if len(result) >= MAX_QUERY_WINDOW:
+                break
+        # 超过查询窗口，缩小到已取到的记忆中较早一半的时间范围重新查询
+        timestamps = sorted(item["timestamp"] for item in result)
+        cut = timestamps[len(timestamps) // 2]
+        if until is not None and cut >= until:
+            # 同一时间戳的记忆超过查询窗口，无法再缩小
+            return [item for item in result if item["timestamp"] <= cut]
+        return self._query_all(expr, page_size, until=cut)
+
+    def save_batch(self, memories: list[dict]) -> None:
+        '''批量保存记忆，memories中每项包含 pk、text、sender、owner、importance_score'''
+        if len(memories) == 0:
+            return
+        self.milvus_memory.loda()
+        self.milvus_memory.insert_memories(memories)
+        self.milvus_memory.release()
+
     def clear(self, owner: str) -> None:
         self.milvus_memory.loda()
         self.milvus_memory.clear(owner)
@@ -41,17 +41,27 @@ class LocalMemoryModel(models.Model):
     '''记忆数据存储数据结构
     id: 主键ID
     text: 记忆文本
+    human: 用户说的话
+    ai: 角色的回复
     sender: 发送者
     owner: 记忆的所有人
     timestamp: 创建时间
     '''
     id = models.AutoField
     text = models.TextField()
+    human = models.TextField(default="")
+    ai = models.TextField(default="")
     tags = models.TextField()
     sender = models.CharField(max_length=50,default="null")
     owner = models.CharField(max_length=50)
     timestamp = models.DateTimeField()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["owner", "sender", "timestamp"], name="local_memory_owner_sender_ts"),
+            models.Index(fields=["owner", "timestamp"], name="local_memory_owner_ts"),
+        ]
+
     def __str__(self):
         return self.id
     
@@ -0,0 +1,35 @@
+import re
+
+# 聊天消息通道，所有客户端都会加入，用于广播消息
+chat_channel = "chat_channel"
+
+# 没有携带room_id的客户端加入，接收所有直播间的消息，与按直播间划分之前的行为一致
+all_rooms_channel = "chat_channel.rooms"
+
+ROOM_GROUP_PREFIX = "room."
+
+# channels的分组名只能包含字母、数字、下划线、连字符和点，长度小于100
+GROUP_NAME_INVALID_PATTERN = re.compile(r'[^0-9A-Za-z_\-]')
+
+
+def session_group(session_id: str) -> str:
+    '''单个会话的分组，用于只发送给发起对话的客户端'''
+    return "session." + GROUP_NAME_INVALID_PATTERN.sub("", str(session_id))[:64]
+
+
+def room_group(room_id: str) -> str:
+    '''直播间分组，用于只发送给观看同一个直播间的客户端'''
+    return ROOM_GROUP_PREFIX + GROUP_NAME_INVALID_PATTERN.sub("", str(room_id))[:64]
+
+
+def delivery_groups(target: str) -> list[str]:
+    '''消息实际发送的分组
+
+    没有指定分组时广播到chat_channel；直播间的消息同时发送到all_rooms_channel，
+    没有携带room_id的客户端仍然能收到所有直播间的回复，每个客户端只会收到一次
+    '''
+    if target is None:
+        return [chat_channel]
+    if target.startswith(ROOM_GROUP_PREFIX):
+        return [target, all_rooms_channel]
+    return [target]
@@ -1,37 +1,56 @@
 import json
 import logging
-from channels.generic.websocket import WebsocketConsumer
-from asgiref.sync import async_to_sync
+import os
+import random
+from urllib.parse import parse_qs
+from channels.generic.websocket import AsyncWebsocketConsumer
+from .channel_groups import chat_channel, all_rooms_channel, session_group, room_group
 
-chat_channel = "chat_channel"
 logger = logging.getLogger(__name__)
 
+# 消息内容只在DEBUG级别按采样率输出，避免高并发时日志量过大
+WS_LOG_SAMPLE_RATE = float(os.environ.get("WS_LOG_SAMPLE_RATE", "0.01"))
 
-class ChatConsumer(WebsocketConsumer):
 
-    def connect(self):
-        self.accept()
-        # 将连接的客户端添加到特定频道
-        async_to_sync(self.channel_layer.group_add)(
-            chat_channel,  # 设置频道名称
-            self.channel_name
-        )
-        logger.info(f'=> ws connect group : {chat_channel}')
+class ChatConsumer(AsyncWebsocketConsumer):
+    '''聊天消息推送
 
-    def disconnect(self, close_code):
+    所有客户端都会加入chat_channel接收广播消息，按会话或直播间接收消息是可选的：
+    - session_id: 发起对话时携带同一个session_id，回复只发送给该会话，例如 ws/?session_id=xxx
+    - room_id: 只接收该直播间的回复，例如 ws/?room_id=xxx；
+      不携带room_id的客户端（例如现有的前端）加入all_rooms_channel，接收所有直播间的回复
+    '''
+
+    async def connect(self):
+        await self.accept()
+        query = parse_qs(self.scope.get("query_string", b"").decode("utf-8"))
+        self.groups_joined = [chat_channel]
+        if query.get("session_id"):
+            self.groups_joined.append(session_group(query["session_id"][0]))
+        if query.get("room_id"):
+            self.groups_joined.append(room_group(query["room_id"][0]))
+        else:
+            self.groups_joined.append(all_rooms_channel)
+        # 将连接的客户端添加到频道
+        for group in self.groups_joined:
+            await self.channel_layer.group_add(group, self.channel_name)
+        logger.debug(f'=> ws connect groups : {self.groups_joined}')
+
+    async def disconnect(self, close_code):
         # 在客户端断开连接时从频道中移除
-        async_to_sync(self.channel_layer.group_discard)(
-            chat_channel,  # 设置频道名称
-            self.channel_name
-        )
-
-    def receive(self, text_data):
-        logger.info(f"=> run receive:{text_data}")
-        # self.send(text_data=json.dumps({"message": text_data}))
-
-      # Receive message from room group
-    def chat_message(self, event):
-        message = event["message"]
-        logger.info(f"=> run chat_message :{message}")
-        text_data = json.dumps({"message": message})
-        self.send(text_data=text_data)
+        for group in getattr(self, "groups_joined", []):
+            await self.channel_layer.group_discard(group, self.channel_name)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        if logger.isEnabledFor(logging.DEBUG) and random.random() < WS_LOG_SAMPLE_RATE:
+            logger.debug(f"=> run receive:{text_data}")
+
+    # Receive message from room group
+    async def chat_message(self, event):
+        # 消息在发送到分组前已经序列化，每个连接直接转发
+        text_data = event.get("text")
+        if text_data is None:
+            text_data = json.dumps({"message": event["message"]})
+        if logger.isEnabledFor(logging.DEBUG) and random.random() < WS_LOG_SAMPLE_RATE:
+            logger.debug(f"=> run chat_message :{text_data}")
+        await self.send(text_data=text_data)
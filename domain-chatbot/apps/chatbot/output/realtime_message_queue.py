@@ -1,25 +1,39 @@
+import contextvars
 import logging
 import queue
 import re
 import threading
+import time
 import traceback
 import json
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-from ..utils.chat_message_utils import format_chat_text
-from ..utils.str_utils import remove_special_characters, remove_emojis
+from ..utils.chat_message_utils import sanitize_chat_text
 from ..config import singleton_sys_config
 from ..emotion.emotion_manage import GenerationEmote
-import threading
+from ..utils.tracing import singleton_tracer
+from .channel_groups import session_group, room_group, delivery_groups
 
-# 聊天消息通道
-chat_channel = "chat_channel"
 # 创建一个线程安全的队列
 chat_queue = queue.SimpleQueue()
 logger = logging.getLogger(__name__)
 
+# 当前对话的会话id，设置后realtime_callback生成的消息只发送给该会话
+delivery_session_id: contextvars.ContextVar[str] = contextvars.ContextVar("delivery_session_id", default=None)
+# 当前对话所属的直播间id，设置后消息只发送给观看该直播间的客户端
+delivery_room_id: contextvars.ContextVar[str] = contextvars.ContextVar("delivery_room_id", default=None)
+
+
+def delivery_target() -> str:
+    '''当前对话消息发送的分组，会话优先于直播间，都为空时返回None表示广播'''
+    session_id = delivery_session_id.get()
+    if session_id:
+        return session_group(session_id)
+    room_id = delivery_room_id.get()
+    if room_id:
+        return room_group(room_id)
+    return None
+
 
 class RealtimeMessage():
     type: str
@@ -28,14 +42,23 @@ class RealtimeMessage():
     emote: str
     action: str
     expand: str
+    # 发送的分组，为空时广播到chat_channel，见 delivery_groups
+    target: str
+    # 所属对话的追踪id和对话开始的时间，在put_message时记录
+    turn_id: str
+    turn_start_time: float
 
-    def __init__(self, type: str, user_name: str, content: str, emote: str, expand: str = None, action: str = None) -> None:
+    def __init__(self, type: str, user_name: str, content: str, emote: str, expand: str = None, action: str = None, target: str = None) -> None:
         self.type = type
         self.user_name = user_name
         self.content = content
         self.emote = emote
         self.action = action
         self.expand = expand
+        self.target = target
+        self.turn_id = None
+        self.turn_start_time = None
+        self.enqueue_time = None
 
     def to_dict(self):
         return {
@@ -50,6 +73,10 @@ class RealtimeMessage():
 
 def put_message(message: RealtimeMessage):
     global chat_queue
+    if message.turn_id is None:
+        message.turn_id = singleton_tracer.current_turn_id()
+        message.turn_start_time = singleton_tracer.current_turn_start_time()
+    message.enqueue_time = time.perf_counter()
     chat_queue.put(message)
 
 
@@ -62,38 +89,51 @@ def send_message():
         try:
             message = chat_queue.get()
             if (message is not None and message != ''):
-                chat_message = {"type": "chat_message",
-                                "message":  message.to_dict()}
-                send_message_exe(chat_channel, chat_message)
+                with singleton_tracer.use_turn(message.turn_id, message.turn_start_time):
+                    if message.enqueue_time is not None:
+                        singleton_tracer.record("realtime.queue_wait", time.perf_counter() - message.enqueue_time)
+                    with singleton_tracer.span("ws.send", type=message.type):
+                        # 只序列化一次，分组内的每个连接直接转发
+                        chat_message = {"type": "chat_message",
+                                        "text": json.dumps({"message": message.to_dict()})}
+                        for group in delivery_groups(message.target):
+                            send_message_exe(group, chat_message)
         except Exception as e:
             traceback.print_exc()
 
 
+# 缓冲区以结束标点结尾，或者超过10个字符后以逗号结尾时发送
+sentence_end_pattern = re.compile(r"^(.+[。．！？\n]|.{10,}[、,])")
+
+
 def realtime_callback(role_name: str, you_name: str, content: str, end_bool: bool):
     if not hasattr(realtime_callback, "message_buffer"):
-        realtime_callback.message_buffer = ""
+        realtime_callback.message_buffer = {}
 
-    realtime_callback.message_buffer += content
+    # 按会话或直播间分别缓冲，不同对话的流式输出互不干扰
+    target = delivery_target()
+    singleton_tracer.mark_once("llm.first_token")
+    message_buffer = realtime_callback.message_buffer.get(target, "") + content
+    realtime_callback.message_buffer[target] = message_buffer
     # 如果 content 以结束标点符号或空结尾，打印并清空缓冲区
-    if re.match(r"^(.+[。．！？\n]|.{10,}[、,])", realtime_callback.message_buffer) or end_bool:
-        realtime_callback.message_buffer = format_chat_text(
-            role_name, you_name, realtime_callback.message_buffer)
-
-        # 删除表情符号和一些特定的特殊符号，防止语音合成失败
-        message_text = realtime_callback.message_buffer
-        message_text = remove_emojis(message_text)
-        message_text = remove_special_characters(message_text)
+    if sentence_end_pattern.match(message_buffer) or end_bool:
+        singleton_tracer.mark_once("output.first_sentence")
+        # 一次扫描去除角色前缀，并删除表情符号和一些特定的特殊符号，防止语音合成失败
+        message_text = sanitize_chat_text(role_name, you_name, message_buffer)
 
         # 生成人物表情
-        generation_emote = GenerationEmote(llm_model_driver=singleton_sys_config.llm_model_driver,
-                                           llm_model_driver_type=singleton_sys_config.conversation_llm_model_driver_type)
-        emote = generation_emote.generation_emote(
-            query=message_text)
+        with singleton_tracer.span("emote.generation"):
+            # 流式回调中取到的是本轮对话开始时固定的运行时配置
+            runtime_config = singleton_sys_config.runtime()
+            generation_emote = GenerationEmote(llm_model_driver=runtime_config.llm_model_driver,
+                                               llm_model_driver_type=runtime_config.conversation_llm_model_driver_type)
+            emote = generation_emote.generation_emote(
+                query=message_text)
 
         # 发送文本消息
         put_message(RealtimeMessage(
-            type="user", user_name=you_name, content=message_text, emote=emote))
-        realtime_callback.message_buffer = ""
+            type="user", user_name=you_name, content=message_text, emote=emote, target=target))
+        realtime_callback.message_buffer.pop(target, None)
 
 
 class RealtimeMessageQueryJobTask():
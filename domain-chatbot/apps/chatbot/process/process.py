@@ -1,12 +1,15 @@
 
 import logging
 import traceback
-from ..character.character_generation import singleton_character_generation
+from ..character.character_generation import singleton_character_generation, format_examples_of_dialogue
 from ..config import singleton_sys_config
-from ..output.realtime_message_queue import realtime_callback
+from ..output.realtime_message_queue import realtime_callback, delivery_session_id, delivery_room_id
 from ..chat.chat_history_queue import conversation_end_callback
 from ..emotion.emotion_manage import EmotionRecognition, EmotionRespond, GenerationEmotionRespondChatPropmt
 from ..utils.datatime_utils import get_current_time_str
+from ..schedule.scheduler import singleton_job_scheduler
+from ..utils.tracing import singleton_tracer
+from .prompt_assembler import PromptAssembler
 
 logger = logging.getLogger(__name__)
 
@@ -20,38 +23,73 @@ class ProcessCore():
         # 加载自定义角色生成模块
         self.singleton_character_generation = singleton_character_generation
         self.generation_emotion_respond_chat_propmt = GenerationEmotionRespondChatPropmt()
+        self.prompt_assembler = PromptAssembler()
 
-    def chat(self, you_name: str, query: str):
+    def chat(self, you_name: str, query: str, session_id: str = None, room_id: str = None):
+        '''session_id不为空时，本轮对话的消息只发送给该会话的客户端，
+        否则room_id不为空时发送给该直播间和未指定直播间的客户端
+        '''
+        token = delivery_session_id.set(session_id)
+        room_token = delivery_room_id.set(room_id)
+        try:
+            # 对话进行中暂停闲置动作等任务
+            with singleton_job_scheduler.conversation(), singleton_sys_config.use_runtime(), \
+                    singleton_tracer.turn(), singleton_tracer.span("chat.turn"):
+                self._chat(you_name=you_name, query=query)
+        finally:
+            delivery_room_id.reset(room_token)
+            delivery_session_id.reset(token)
+
+    def _chat(self, you_name: str, query: str):
+
+        # 本轮对话开始时固定的运行时配置，对话过程中配置被重新加载也不影响本轮对话
+        runtime_config = singleton_sys_config.runtime()
+        memory_storage_driver = runtime_config.memory_storage_driver
+        llm_model_driver = runtime_config.llm_model_driver
+        llm_model_driver_type = runtime_config.conversation_llm_model_driver_type
+        prompt_token_budget = runtime_config.prompt_token_budget
 
         # 生成角色prompt
-        character = self.singleton_character_generation.get_character(
-            singleton_sys_config.character)
+        character, compiled_prompt = self.singleton_character_generation.get_character_prompt(
+            runtime_config.character)
         role_name = character.role_name
 
         try:
 
-            prompt = self.singleton_character_generation.output_prompt(
-                character)
-
             # 检索关联的短期记忆和长期记忆
-            short_history = singleton_sys_config.memory_storage_driver.search_short_memory(
-                query_text=query, you_name=you_name, role_name=role_name)
-            long_history = singleton_sys_config.memory_storage_driver.search_lang_memory(
-                query_text=query, you_name=you_name, role_name=role_name)
+            with singleton_tracer.span("memory.short"):
+                short_history = memory_storage_driver.search_short_memory(
+                    query_text=query, you_name=you_name, role_name=role_name)
+            with singleton_tracer.span("memory.long"):
+                long_history = memory_storage_driver.search_lang_memory(
+                    query_text=query, you_name=you_name, role_name=role_name)
 
+            # 按token预算组装prompt，超出预算时裁剪对话样例和较早的短期记忆
             current_time = get_current_time_str()
-            prompt = prompt.format(
-                you_name=you_name, long_history=long_history, current_time=current_time)
+            assembled_prompt = self.prompt_assembler.assemble(
+                compiled_prompt=compiled_prompt,
+                budget=prompt_token_budget,
+                you_name=you_name,
+                query=query,
+                current_time=current_time,
+                # 对话样例先替换角色名和用户名，再按token预算裁剪
+                examples_of_dialogue=format_examples_of_dialogue(
+                    character.examples_of_dialogue, role_name=role_name, you_name=you_name),
+                long_history=long_history or "",
+                # 短期记忆按时间倒序返回，转换为从旧到新的对话顺序
+                short_history=short_history[::-1])
+            prompt = assembled_prompt.prompt
 
             # 调用大语言模型流式生成对话
-            singleton_sys_config.llm_model_driver.chatStream(prompt=prompt,
-                                                             type=singleton_sys_config.conversation_llm_model_driver_type,
-                                                             role_name=role_name,
-                                                             you_name=you_name,
-                                                             query=query,
-                                                             history=short_history,
-                                                             realtime_callback=realtime_callback,
-                                                             conversation_end_callback=conversation_end_callback)
+            with singleton_tracer.span("llm.stream", model=llm_model_driver_type):
+                llm_model_driver.chatStream(prompt=prompt,
+                                            type=llm_model_driver_type,
+                                            role_name=role_name,
+                                            you_name=you_name,
+                                            query=query,
+                                            history=assembled_prompt.history,
+                                            realtime_callback=realtime_callback,
+                                            conversation_end_callback=conversation_end_callback)
         except Exception as e:
             error_message = "小蜜蜂告诉我,她刚刚在路上遇到一团奇怪的迷雾,导致消息晚点到达,请耐心等待!"
             traceback.print_exc()
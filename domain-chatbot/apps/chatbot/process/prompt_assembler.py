@@ -0,0 +1,108 @@
+import logging
+from ..character.character_generation import CompiledPrompt
+from ..utils.token_utils import TokenCounter, singleton_token_counter
+
+logger = logging.getLogger(__name__)
+
+
+class AssembledPrompt():
+    '''按token预算组装后的prompt
+
+    prompt: 系统prompt（角色设定、对话样例、长期记忆）
+    history: 保留的短期记忆，按时间从旧到新排列
+    token_breakdown: 各部分的token数
+    '''
+    prompt: str
+    history: list[dict[str, str]]
+    token_breakdown: dict[str, int]
+
+    def __init__(self, prompt: str, history: list[dict[str, str]], token_breakdown: dict[str, int]) -> None:
+        self.prompt = prompt
+        self.history = history
+        self.token_breakdown = token_breakdown
+
+
+class PromptAssembler():
+    '''按token预算组装对话prompt
+
+    优先级从高到低：角色设定和用户输入（必须保留）> 长期记忆 > 最近的短期记忆 > 对话样例 > 更早的短期记忆，
+    预算不足时优先裁剪对话样例和较早的对话历史
+    '''
+
+    token_counter: TokenCounter
+    # 优先保留的最近对话轮数
+    recent_history_num: int = 2
+
+    def __init__(self, token_counter: TokenCounter = singleton_token_counter) -> None:
+        self.token_counter = token_counter
+
+    def assemble(self, compiled_prompt: CompiledPrompt, budget: int, you_name: str, query: str,
+                 current_time: str, examples_of_dialogue: str, long_history: str,
+                 short_history: list[dict[str, str]]) -> AssembledPrompt:
+        count = self.token_counter.count
+        base_tokens = count(compiled_prompt.format(
+            you_name=you_name, long_history="", current_time=current_time, examples_of_dialogue=""))
+        query_tokens = count(query)
+        remaining = budget - base_tokens - query_tokens
+
+        # 长期记忆，按条目裁剪
+        long_history, long_history_tokens = self._fit_items(
+            long_history.split(";") if long_history else [], ";", remaining)
+        remaining -= long_history_tokens
+
+        # 最近的短期记忆，从新到旧
+        history_tokens = [count(item["human"]) + count(item["ai"]) for item in short_history]
+        kept = len(short_history)
+        history_used = 0
+        for i in range(len(short_history) - 1, max(len(short_history) - self.recent_history_num, 0) - 1, -1):
+            if history_tokens[i] > remaining:
+                break
+            remaining -= history_tokens[i]
+            history_used += history_tokens[i]
+            kept = i
+
+        # 对话样例，按行裁剪
+        examples_of_dialogue, examples_tokens = self._fit_items(
+            examples_of_dialogue.split("\n") if examples_of_dialogue else [], "\n", remaining)
+        remaining -= examples_tokens
+
+        # 更早的短期记忆，从新到旧
+        if kept == len(short_history) - min(self.recent_history_num, len(short_history)):
+            for i in range(kept - 1, -1, -1):
+                if history_tokens[i] > remaining:
+                    break
+                remaining -= history_tokens[i]
+                history_used += history_tokens[i]
+                kept = i
+        history = short_history[kept:]
+
+        prompt = compiled_prompt.format(you_name=you_name, long_history=long_history,
+                                        current_time=current_time, examples_of_dialogue=examples_of_dialogue)
+        token_breakdown = {
+            "persona": base_tokens,
+            "examples": examples_tokens,
+            "long_history": long_history_tokens,
+            "short_history": history_used,
+            "query": query_tokens,
+            "total": base_tokens + examples_tokens + long_history_tokens + history_used + query_tokens,
+            "budget": budget,
+            "dropped_history": len(short_history) - len(history),
+        }
+        logger.info(f"prompt tokens # {token_breakdown} #")
+        return AssembledPrompt(prompt=prompt, history=history, token_breakdown=token_breakdown)
+
+    def _fit_items(self, items: list[str], separator: str, remaining: int) -> tuple[str, int]:
+        '''按顺序保留能放进预算的条目'''
+        text = separator.join(items)
+        tokens = self.token_counter.count(text)
+        if tokens <= remaining:
+            return text, tokens
+        kept = []
+        used = 0
+        for item in items:
+            item_tokens = self.token_counter.count(item + separator)
+            if used + item_tokens > remaining:
+                break
+            kept.append(item)
+            used += item_tokens
+        return separator.join(kept), used
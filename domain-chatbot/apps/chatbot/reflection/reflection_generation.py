@@ -1,32 +1,175 @@
-
+import json
+import logging
+import os
+import threading
 import time
+import traceback
+from django.db import connection
 from .reflection_template import ReflectionTemplate
 from ..config import singleton_sys_config
+from ..models import SysConfigModel
+from ..utils.token_utils import singleton_token_counter
+
+logger = logging.getLogger(__name__)
+
+# 每个角色已经反思过的最新记忆时间戳，保存在系统配置表中
+watermark_code = "reflectionWatermark"
+# 反思生成的记忆的重要程度
+reflection_importance_score = 3
+
+
+def load_watermark(role_name: str) -> float:
+    sys_config_obj = SysConfigModel.objects.filter(code=watermark_code).first()
+    if sys_config_obj is None:
+        return 0
+    return float(json.loads(sys_config_obj.config).get(role_name, 0))
+
+
+def save_watermark(role_name: str, timestamp: float) -> None:
+    sys_config_obj = SysConfigModel.objects.filter(code=watermark_code).first()
+    if sys_config_obj is None:
+        sys_config_obj = SysConfigModel(code=watermark_code, config="{}")
+    watermarks = json.loads(sys_config_obj.config)
+    watermarks[role_name] = timestamp
+    sys_config_obj.config = json.dumps(watermarks)
+    sys_config_obj.save()
+
 
 class ReflectionGeneration():
+    '''根据新增的记忆生成反思，只处理水位线之后的记忆
+
+    新记忆按token预算分批，每批调用一次大语言模型，批次之间至少间隔min_interval秒，
+    每次最多处理max_batches批，剩下的记忆留到下一次
+    '''
 
     reflection_template: ReflectionTemplate
+    min_interval: float
+    max_batches: int
+    query_page_size: int
+
+    # 视图和定时任务可能同时触发反思，同一时间只运行一个
+    _lock = threading.Lock()
+    _last_call_time = 0
 
     def __init__(self) -> None:
         self.reflection_template = ReflectionTemplate()
+        self.min_interval = float(os.environ.get("REFLECTION_MIN_INTERVAL", "10"))
+        self.max_batches = int(os.environ.get("REFLECTION_MAX_BATCHES", "3"))
+        self.query_page_size = int(os.environ.get("REFLECTION_QUERY_PAGE_SIZE", "1000"))
+
+    def generation(self, role_name: str) -> list[str]:
+        '''运行一次反思，返回生成的反思内容，已有反思在运行时直接返回'''
+        if not ReflectionGeneration._lock.acquire(blocking=False):
+            logger.info("=> reflection is running, skip")
+            return []
+        try:
+            return self._generation(role_name)
+        finally:
+            ReflectionGeneration._lock.release()
+
+    def _generation(self, role_name: str) -> list[str]:
+        # 整次反思使用同一份运行时配置
+        runtime_config = singleton_sys_config.runtime()
+        memory_storage_driver = runtime_config.memory_storage_driver
+        long_memory_storage = memory_storage_driver.long_memory_storage
+        llm_model_driver = runtime_config.llm_model_driver
+        llm_model_driver_type = runtime_config.reflection_llm_model_driver_type \
+            or runtime_config.conversation_llm_model_driver_type
+
+        # 反思生成的记忆sender为角色自己，不再参与反思。
+        # 取出水位线之后的全部记忆再按时间分批，剩下的批次都在水位线之后，下一次继续处理
+        watermark = load_watermark(role_name)
+        memories = long_memory_storage.query_after(
+            owner=role_name, timestamp=watermark, page_size=self.query_page_size, exclude_sender=role_name)
+        if len(memories) == 0:
+            return []
+
+        insights = []
+        for batch in self.split_batches(memories, runtime_config.prompt_token_budget)[:self.max_batches]:
+            self._wait_rate_limit()
+            prompt = self.reflection_template.format([item['text'] for item in batch])
+            reflection_result = llm_model_driver.chat(prompt=prompt, type=llm_model_driver_type,
+                                                      role_name=role_name, you_name="", query="", short_history=[], long_history="")
+            batch_insights = [item.strip() for item in self.reflection_template.output_format(reflection_result)]
+            batch_insights = [item for item in batch_insights if item]
+
+            # 一批反思一次写入到向量数据库中
+            pks = memory_storage_driver.snow_flake.next_ids(len(batch_insights))
+            long_memory_storage.save_batch([{
+                "pk": pk,
+                "text": insight,
+                "sender": role_name,
+                "owner": role_name,
+                "importance_score": reflection_importance_score
+            } for pk, insight in zip(pks, batch_insights)])
+            save_watermark(role_name, batch[-1]["timestamp"])
+            insights.extend(batch_insights)
+
+        logger.info(f"=> reflection # role_name:{role_name} memories:{len(memories)} insights:{len(insights)} #")
+        return insights
+
+    def split_batches(self, memories: list[dict], token_budget: int) -> list[list[dict]]:
+        '''按token预算把记忆分批，每批至少一条，时间戳相同的记忆放在同一批，保证水位线不会跳过记忆'''
+        budget = token_budget - singleton_token_counter.count(self.reflection_template.get_prompt())
+        batches = []
+        batch = []
+        batch_tokens = 0
+        for memory in memories:
+            tokens = singleton_token_counter.count(memory['text'])
+            if len(batch) > 0 and batch_tokens + tokens > budget and memory['timestamp'] != batch[-1]['timestamp']:
+                batches.append(batch)
+                batch = []
+                batch_tokens = 0
+            batch.append(memory)
+            batch_tokens += tokens
+        if len(batch) > 0:
+            batches.append(batch)
+        return batches
+
+    def _wait_rate_limit(self):
+        wait_time = ReflectionGeneration._last_call_time + self.min_interval - time.monotonic()
+        if wait_time > 0:
+            time.sleep(wait_time)
+        ReflectionGeneration._last_call_time = time.monotonic()
+
+
+def current_role_name() -> str:
+    from ..character.character_generation import singleton_character_generation
+    character, _ = singleton_character_generation.get_character_prompt(singleton_sys_config.runtime().character)
+    return character.role_name
+
+
+def reflection_enabled(runtime_config) -> bool:
+    '''反思基于长期记忆，两个开关都打开时才执行'''
+    return runtime_config.enable_reflection and runtime_config.enable_longMemory
+
 
-    def generation(self, role_name: str) -> None:
+def reflection_job():
+    try:
+        # 开关检查和反思过程使用任务开始时的同一份运行时配置
+        with singleton_sys_config.use_runtime() as runtime_config:
+            if not reflection_enabled(runtime_config):
+                return
+            ReflectionGeneration().generation(role_name=current_role_name())
+    except Exception as e:
+        traceback.print_exc()
+        logger.error("reflection error: %s" % str(e))
+    finally:
+        connection.close()
 
-        timestamp = time.time()
-        expr = f'timestamp <= {timestamp}'
-        result = singleton_sys_config.memory_storage_driver.pageQuery(
-            1, 100, expr)
 
-        result = [item['text'] for item in result]
-        prompt = self.reflection_template.format(result)
+class ReflectionJobTask():
 
-        reflection_result = singleton_sys_config.memory_storage_driver.chat(prompt=prompt, type=singleton_sys_config.reflection_llm_model_driver_type,
-                                                            role_name=role_name, you_name="", query="", short_history="", long_history="")
-        reflection_result_arr = self.reflection_template.output_format(
-            reflection_result)
+    @staticmethod
+    def trigger() -> bool:
+        '''在调度器的线程池中立即执行一次反思，任务未启动时返回False'''
+        from ..schedule.scheduler import singleton_job_scheduler
+        return singleton_job_scheduler.trigger("reflection")
 
-        # 批量写入到向量数据库中
-        for i in range(len(reflection_result_arr)):
-            item = reflection_result_arr[i].strip()
-            pk = singleton_sys_config.memory_storage_driver.get_current_entity_id()
-            singleton_sys_config.memory_storage_driver.save(pk, item, role_name)
+    @staticmethod
+    def start(interval: float):
+        from ..schedule.scheduler import singleton_job_scheduler
+        # 反思需要调用大语言模型，在对话间隙执行
+        singleton_job_scheduler.schedule("reflection", reflection_job, interval=interval,
+                                         jitter=interval * 0.1, quiet_period=60)
+        logger.info("=> Start ReflectionJobTask Success")
@@ -0,0 +1,63 @@
+import logging
+import traceback
+from django.db import connection
+from django.db.models import Count
+from ..models import LocalMemoryModel
+from .scheduler import singleton_job_scheduler
+
+logger = logging.getLogger(__name__)
+
+
+def prune_short_memory(max_rows: int) -> int:
+    '''每个 (角色, 用户) 只保留最近的max_rows条短期记忆，返回删除的记录数'''
+    deleted_total = 0
+    pruned_owners = set()
+    groups = LocalMemoryModel.objects.values('owner', 'sender').annotate(
+        count=Count('id')).filter(count__gt=max_rows)
+    for group in groups:
+        rows = LocalMemoryModel.objects.filter(owner=group['owner'], sender=group['sender'])
+        # 第max_rows条记录的时间戳，更早的记录全部删除
+        boundary = rows.order_by('-timestamp').values_list('timestamp', flat=True)[max_rows - 1:max_rows]
+        if len(boundary) == 0:
+            continue
+        deleted, _ = rows.filter(timestamp__lt=boundary[0]).delete()
+        deleted_total += deleted
+        pruned_owners.add(group['owner'])
+
+    if len(pruned_owners) > 0:
+        # 关键词索引在下次检索时重新从数据库构建
+        from ..config import singleton_sys_config
+        local_storage = singleton_sys_config.runtime().memory_storage_driver.short_memory_storage
+        for owner in pruned_owners:
+            local_storage.keyword_index.clear(owner)
+    return deleted_total
+
+
+def compact_database():
+    '''合并WAL文件并更新查询优化器的统计信息'''
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        cursor.execute("PRAGMA optimize")
+
+
+def memory_retention(max_rows: int):
+    try:
+        deleted = prune_short_memory(max_rows) if max_rows > 0 else 0
+        compact_database()
+        logger.info(f"=> memory retention # deleted:{deleted} #")
+    except Exception as e:
+        traceback.print_exc()
+        logger.error("memory retention error: %s" % str(e))
+    finally:
+        connection.close()
+
+
+class MemoryRetentionJobTask():
+
+    @staticmethod
+    def start(interval: float, max_rows: int):
+        singleton_job_scheduler.schedule("memory_retention", lambda: memory_retention(max_rows),
+                                         interval=interval, jitter=interval * 0.1)
+        logger.info("=> Start MemoryRetentionJobTask Success")
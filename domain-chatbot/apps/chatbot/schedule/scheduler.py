@@ -0,0 +1,239 @@
+import atexit
+import concurrent.futures
+import heapq
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduledJob():
+    '''定时任务
+
+    name: 任务名称，同名任务会被替换
+    func: 任务函数，无参数
+    interval: 执行间隔（秒）
+    jitter: 每次执行时间的随机偏移（秒），避免多个任务同时执行
+    quiet_period: 大于等于0时，对话进行中或对话结束不足quiet_period秒时跳过本次执行
+    '''
+
+    name: str
+    interval: float
+    jitter: float
+    quiet_period: float
+
+    def __init__(self, name: str, func, interval: float, jitter: float = 0, quiet_period: float = -1) -> None:
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.quiet_period = quiet_period
+        self.next_run = 0
+        self.cancelled = False
+        # trigger()手动触发时为True，本次执行不检查quiet_period
+        self.triggered = False
+        # 正在线程池中执行，执行完成后才重新放回堆中，同一个任务不会同时执行
+        self.running = False
+        self.run_count = 0
+        self.skip_count = 0
+        self.error_count = 0
+        self.last_duration = 0
+
+    def next_delay(self) -> float:
+        return max(self.interval + random.uniform(-self.jitter, self.jitter), 0)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "interval": self.interval,
+            "next_run_in": round(max(self.next_run - time.monotonic(), 0), 3),
+            "run_count": self.run_count,
+            "skip_count": self.skip_count,
+            "error_count": self.error_count,
+            "last_duration": round(self.last_duration, 3)
+        }
+
+
+class JobScheduler():
+    '''定时任务调度器，所有周期任务按下次执行时间放在最小堆中
+
+    调度线程只负责计时，到期的任务交给有界线程池执行，耗时较长的任务（例如反思）不会推迟其他任务。
+    同一个任务执行完成后才计算下一次执行时间，不会同时执行
+
+    max_workers: 同时执行的任务数，默认读取环境变量SCHEDULER_MAX_WORKERS
+    '''
+
+    def __init__(self, max_workers: int = None) -> None:
+        self.max_workers = max_workers if max_workers is not None \
+            else int(os.environ.get("SCHEDULER_MAX_WORKERS", "4"))
+        self._executor = None
+        self._heap: list[tuple[float, int, ScheduledJob]] = []
+        self._jobs: dict[str, ScheduledJob] = {}
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+        # 正在进行的对话数和最近一次对话结束的时间，用于跳过闲置任务
+        self._active_conversations = 0
+        self._last_conversation_time = 0
+
+    def schedule(self, name: str, func, interval: float, delay: float = None, jitter: float = 0,
+                 quiet_period: float = -1) -> ScheduledJob:
+        '''添加定时任务，delay为第一次执行前的等待时间，默认等待一个间隔'''
+        job = ScheduledJob(name=name, func=func, interval=interval, jitter=jitter, quiet_period=quiet_period)
+        with self._condition:
+            old_job = self._jobs.get(name)
+            if old_job is not None:
+                old_job.cancelled = True
+            self._jobs[name] = job
+            self._push(job, job.next_delay() if delay is None else delay)
+            self._condition.notify()
+        logger.info(f"=> Schedule job # name:{name} interval:{interval} #")
+        return job
+
+    def cancel(self, name: str) -> bool:
+        with self._condition:
+            job = self._jobs.pop(name, None)
+            if job is None:
+                return False
+            # 堆中的任务在到期时丢弃
+            job.cancelled = True
+            self._condition.notify()
+        return True
+
+    def trigger(self, name: str) -> bool:
+        '''立即执行一次任务，之后按原来的间隔继续执行，任务不存在时返回False'''
+        with self._condition:
+            job = self._jobs.get(name)
+            if job is None:
+                return False
+            job.triggered = True
+            # 正在执行时等执行完成后立即重新执行，否则堆中原来的执行时间在到期时丢弃
+            if not job.running:
+                self._push(job, 0)
+            self._condition.notify()
+        return True
+
+    def jobs(self) -> list[dict]:
+        with self._condition:
+            return [job.to_dict() for job in self._jobs.values()]
+
+    @contextmanager
+    def conversation(self):
+        '''标记一轮对话，对话进行中跳过设置了quiet_period的任务'''
+        with self._condition:
+            self._active_conversations += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._active_conversations -= 1
+                self._last_conversation_time = time.monotonic()
+
+    def is_quiet(self, quiet_period: float) -> bool:
+        with self._condition:
+            return self._active_conversations == 0 \
+                and time.monotonic() - self._last_conversation_time >= quiet_period
+
+    def start(self):
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="job_worker")
+            self._thread = threading.Thread(target=self._run, name="job_scheduler")
+            self._thread.daemon = True
+            self._thread.start()
+        atexit.register(self.shutdown)
+        logger.info("=> Start JobScheduler Success")
+
+    def shutdown(self, timeout: float = 5):
+        '''停止调度线程，正在执行的任务会执行完，未执行的任务全部取消'''
+        with self._condition:
+            if not self._running:
+                return
+            self._running = False
+            for job in self._jobs.values():
+                job.cancelled = True
+            self._jobs.clear()
+            self._heap.clear()
+            self._condition.notify()
+            thread = self._thread
+            executor = self._executor
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _push(self, job: ScheduledJob, delay: float):
+        job.next_run = time.monotonic() + delay
+        heapq.heappush(self._heap, (job.next_run, next(self._counter), job))
+
+    def _next_job(self) -> ScheduledJob:
+        '''等待到下一个任务的执行时间，停止时返回None'''
+        with self._condition:
+            while self._running:
+                if len(self._heap) == 0:
+                    self._condition.wait()
+                    continue
+                next_run, _, job = self._heap[0]
+                # 已取消的任务，或被trigger()提前的旧执行时间
+                if job.cancelled or next_run != job.next_run:
+                    heapq.heappop(self._heap)
+                    continue
+                timeout = next_run - time.monotonic()
+                if timeout > 0:
+                    self._condition.wait(timeout)
+                    continue
+                heapq.heappop(self._heap)
+                job.running = True
+                return job
+            return None
+
+    def _run(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            if job.quiet_period >= 0 and not job.triggered and not self.is_quiet(job.quiet_period):
+                job.skip_count += 1
+                self._reschedule(job)
+                continue
+            job.triggered = False
+            try:
+                self._executor.submit(self._execute, job)
+            except RuntimeError:
+                # 线程池已经关闭
+                return
+
+    def _execute(self, job: ScheduledJob):
+        '''在线程池中执行任务，完成后放回堆中'''
+        start_time = time.monotonic()
+        try:
+            job.func()
+        except Exception as e:
+            job.error_count += 1
+            traceback.print_exc()
+            logger.error(f"run job error # name:{job.name} # %s" % str(e))
+        job.run_count += 1
+        job.last_duration = time.monotonic() - start_time
+        self._reschedule(job)
+
+    def _reschedule(self, job: ScheduledJob):
+        with self._condition:
+            job.running = False
+            if not job.cancelled and self._running:
+                # 执行期间再次被触发时立即重新执行
+                self._push(job, 0 if job.triggered else job.next_delay())
+                self._condition.notify()
+
+
+# 单例 job_scheduler
+singleton_job_scheduler = JobScheduler()
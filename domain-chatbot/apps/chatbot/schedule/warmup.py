@@ -0,0 +1,40 @@
+import logging
+import threading
+import time
+import traceback
+from ..utils.startup_profiler import StartupProfiler
+
+logger = logging.getLogger(__name__)
+
+
+def warmup():
+    '''预热懒加载的重量级模块：大语言模型客户端、长期记忆（pymilvus + 向量化模型）'''
+    from ..config import singleton_sys_config
+    profiler = StartupProfiler()
+    runtime_config = singleton_sys_config.runtime()
+    try:
+        with profiler.phase("llm_model"):
+            runtime_config.llm_model_driver.get_strategy(
+                runtime_config.conversation_llm_model_driver_type)
+        if runtime_config.enable_longMemory:
+            with profiler.phase("long_memory"):
+                runtime_config.memory_storage_driver.long_memory_storage
+    except Exception as e:
+        traceback.print_exc()
+        logger.error("warmup error: %s" % str(e))
+    profiler.report()
+
+
+class WarmupJobTask():
+
+    @staticmethod
+    def start(delay: float):
+        # 延迟执行，等服务开始接收连接后再在后台预热
+        def run():
+            time.sleep(delay)
+            warmup()
+
+        background_thread = threading.Thread(target=run)
+        background_thread.daemon = True
+        background_thread.start()
+        logger.info("=> Start WarmupJobTask Success")
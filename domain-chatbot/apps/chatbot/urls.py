@@ -21,4 +21,8 @@ urlpatterns = [
     path('config/vrm/upload', views.upload_vrm_model, name='upload_vrm_model'),
     path('config/vrm/user/show', views.show_user_vrm_models, name='show_user_vrm_models'),
     path('config/vrm/system/show', views.show_system_vrm_models, name='show_system_vrm_models'),
+    path('live/rooms', views.live_room_list, name='live_room_list'),
+    path('live/rooms/add', views.add_live_room, name='add_live_room'),
+    path('live/rooms/remove', views.remove_live_room, name='remove_live_room'),
+    path('metrics', views.metrics, name='metrics'),
 ]
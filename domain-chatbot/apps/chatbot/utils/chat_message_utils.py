@@ -1,27 +1,105 @@
-
 import re
+from functools import lru_cache
+from .str_utils import SPECIAL_CHARACTERS
+
+# 动作描写，例如 *微笑*
+ACTION_PATTERN = r'\*.*?\*'
+# 用户消息中去除的字符
+USER_CHAT_TEXT_TABLE = str.maketrans('', '', '[]')
+
+
+class ChatTextSanitizer():
+    '''对话文本清洗，每个 (role_name, you_name) 编译一次
+
+    所有需要删除的内容合并成一个正则表达式，一次扫描完成：
+    format 去除动作描写、角色前缀、` 和 []，删除后新拼接出的前缀不会再次删除
+    sanitize 在format的基础上再删除表情符号和特殊符号，用于语音合成，表情符号不属于\w，已包含在特殊符号中
+    '''
+
+    role_name: str
+    you_name: str
+
+    def __init__(self, role_name: str, you_name: str) -> None:
+        self.role_name = role_name
+        self.you_name = you_name
+        prefixes = [f'{role_name}：', f'{you_name}：', f'{role_name}:', f'{you_name}:',
+                    'AI角色：', f'AI（{role_name}）：', 'AI:', 'ai：', 'Ai：', f'{role_name}说']
+        # 同一位置优先匹配更长的前缀
+        prefixes = sorted(set(prefixes), key=len, reverse=True)
+        format_alternatives = [ACTION_PATTERN] + [re.escape(prefix) for prefix in prefixes] + [r'[`\[\]]']
+        self._format_pattern = re.compile('|'.join(format_alternatives))
+        # 连续的特殊符号一次删除，但不能吞掉动作描写和前缀的第一个字符，这些字符单独匹配
+        stop_characters = ''.join(sorted({'*'} | {prefix[0] for prefix in prefixes if prefix}))
+        special_characters_run = SPECIAL_CHARACTERS[:-1] + re.escape(stop_characters) + ']+'
+        self._sanitize_pattern = re.compile('|'.join(
+            format_alternatives + [special_characters_run, SPECIAL_CHARACTERS]))
+
+    def format(self, text: str) -> str:
+        return self._format_pattern.sub('', text)
+
+    def sanitize(self, text: str) -> str:
+        return self._sanitize_pattern.sub('', text)
+
+
+@lru_cache(maxsize=64)
+def get_chat_text_sanitizer(role_name: str, you_name: str) -> ChatTextSanitizer:
+    return ChatTextSanitizer(role_name, you_name)
+
 
 def format_chat_text(role_name: str, you_name: str, text: str):
     # 去除特殊字符 * 、`role_name：`、`you_name:`
-    # text = text.replace(f'*', "")
-    pattern = r'\*.*?\*'
-    text = text.replace(f'`', "")
-    text = re.sub(pattern, '', text)
-    text = text.replace(f'{role_name}：', "")
-    text = text.replace(f'{you_name}：', "")
-    text = text.replace(f'{role_name}:', "")
-    text = text.replace(f'{you_name}:', "")
-    text = text.replace(f'AI角色：', "")
-    text = text.replace(f'AI（{role_name}）：', "")
-    text = text.replace(f'AI:', "")
-    text = text.replace(f'ai：', "")
-    text = text.replace(f'Ai：', "")
-    text = text.replace(f'{role_name}说', "")
-    text = text.replace('[', "")
-    text = text.replace(']', "")
-    return text
+    return get_chat_text_sanitizer(role_name, you_name).format(text)
+
+
+def sanitize_chat_text(role_name: str, you_name: str, text: str):
+    # 去除角色前缀，并删除表情符号和特殊符号，防止语音合成失败
+    return get_chat_text_sanitizer(role_name, you_name).sanitize(text)
+
 
 def format_user_chat_text(text: str):
-    text = text.replace('[', "")
-    text = text.replace(']', "")
-    return text
\ No newline at end of file
+    return text.translate(USER_CHAT_TEXT_TABLE)
+
+
+if __name__ == '__main__':
+    # 性能对比：python -m apps.chatbot.utils.chat_message_utils
+    import timeit
+    from .str_utils import EMOJI_CHARACTERS, remove_emojis, remove_special_characters
+
+    def legacy_format_chat_text(role_name: str, you_name: str, text: str):
+        text = text.replace(f'`', "")
+        text = re.sub(r'\*.*?\*', '', text)
+        for prefix in [f'{role_name}：', f'{you_name}：', f'{role_name}:', f'{you_name}:', 'AI角色：',
+                       f'AI（{role_name}）：', 'AI:', 'ai：', 'Ai：', f'{role_name}说', '[', ']']:
+            text = text.replace(prefix, "")
+        return text
+
+    def legacy_remove_emojis(text: str):
+        return re.compile(EMOJI_CHARACTERS, flags=re.UNICODE).sub('', text)
+
+    def legacy_remove_special_characters(text: str):
+        return re.sub(SPECIAL_CHARACTERS, '', text)
+
+    samples = ["爱莉：*歪头* 你好呀，alan！今天过得怎么样😊？",
+               "AI（爱莉）：[开心] 当然可以啦~ 我们一起去吃川菜吧！",
+               "嗯……让我想想，`代码`写完了吗？爱莉说不要熬夜哦。"]
+
+    def legacy():
+        for sample in samples:
+            text = legacy_format_chat_text("爱莉", "alan", sample)
+            legacy_remove_special_characters(legacy_remove_emojis(text))
+
+    def compiled():
+        for sample in samples:
+            sanitize_chat_text("爱莉", "alan", sample)
+
+    for sample in samples:
+        expected = remove_special_characters(remove_emojis(legacy_format_chat_text("爱莉", "alan", sample)))
+        assert sanitize_chat_text("爱莉", "alan", sample) == expected, sample
+        assert format_chat_text("爱莉", "alan", sample) == legacy_format_chat_text("爱莉", "alan", sample), sample
+
+    number = 20000
+    legacy_time = timeit.timeit(legacy, number=number)
+    compiled_time = timeit.timeit(compiled, number=number)
+    print(f"legacy:   {legacy_time / number / len(samples) * 1e6:.2f} us/text")
+    print(f"compiled: {compiled_time / number / len(samples) * 1e6:.2f} us/text")
+    print(f"speedup:  {legacy_time / compiled_time:.1f}x")
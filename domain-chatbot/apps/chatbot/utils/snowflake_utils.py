@@ -1,5 +1,16 @@
+import os
+import socket
+import tempfile
+import threading
 import time
 import logging
+import zlib
+
+# 编号由 时间戳 + 数据中心编号 + 机器编号 + 序号 组成，同时运行的进程必须使用不同的(数据中心编号, 机器编号)：
+# - 单机部署：不需要配置，同一台机器上的进程在临时目录中通过文件锁各自占用一个机器编号
+# - 多机或多容器部署：每个容器的临时目录相互独立，主机名哈希只有32种取值，必须配置以下环境变量之一
+#   - SNOWFLAKE_WORKER_ID 和 SNOWFLAKE_DATACENTER_ID：为每个进程指定不重复的编号（0-31）
+#   - SNOWFLAKE_LOCK_DIR：所有进程共享的目录（例如挂载的同一个卷），在其中申请机器编号
 
 # 分配位置
 WORKER_BITS = 5
@@ -18,6 +29,7 @@ TIMESTAMP_LEFT_SHIFT = SEQUENCE_BITS + WORKER_BITS + DATACENTER_BITS
 
 SEQUENCE_MASK = -1 ^ (-1 << SEQUENCE_BITS)  # 掩码
 EPOCH = 1577808001000  # 元时间戳 此处元设为 2020-01-01 00:00:01
+MAX_BACKWARD_MS = 5  # 可以等待的时钟回退毫秒数，超过则抛出异常
 
 
 class SnowFlake(object):
@@ -41,6 +53,7 @@ class SnowFlake(object):
         self.sequence = sequence
 
         self.last_timestamp = -1  # 最近一次生成编号的时间戳
+        self._lock = threading.Lock()  # 多个线程同时生成编号时保护sequence和last_timestamp
 
     @staticmethod
     def _timestamp(n=1e3) -> int:
@@ -50,20 +63,20 @@ class SnowFlake(object):
         """
         return int(time.time() * n)
 
-    def _check(self, timestamp):
+    def _check(self, timestamp) -> int:
         """
         超限检查
         :param timestamp:
-        :return:
+        :return: 生成编号使用的时间戳
         """
-        self._time_back_off_check(timestamp)
-        self._number_check(timestamp)
+        timestamp = self._time_back_off_check(timestamp)
+        return self._number_check(timestamp)
 
-    def _number_check(self, timestamp):
+    def _number_check(self, timestamp) -> int:
         """
         数超限检查，检查当前时间生成的编号是否超过上限，超过上限则的等到下一个时间生成
         :param timestamp:
-        :return:
+        :return: 生成编号使用的时间戳
         """
         if timestamp == self.last_timestamp:
             self.sequence = (self.sequence + 1) & SEQUENCE_MASK
@@ -71,19 +84,36 @@ class SnowFlake(object):
                 timestamp = self._wait_next_time(self.last_timestamp)
         else:
             self.sequence = 0
+        return timestamp
 
-    def _time_back_off_check(self, timestamp):
+    def _time_back_off_check(self, timestamp) -> int:
         if timestamp < self.last_timestamp:
+            if self.last_timestamp - timestamp <= MAX_BACKWARD_MS:
+                # 小幅回退（如NTP校时）等到上一次的时间戳，继续使用上一次的序号
+                return self._wait_until(self.last_timestamp)
             logging.error('发现时钟回退，记录到最近一次的时间戳为 {}'.format(self.last_timestamp))
             raise Exception("时钟回拨异常")
+        return timestamp
 
     def task(self) -> int:
         """
         获取一个编号
         :return:
         """
-        timestamp = self._timestamp()
-        self._check(timestamp)
+        with self._lock:
+            return self._next_id()
+
+    def next_ids(self, n: int) -> list[int]:
+        """
+        获取一批编号，批量写入时只加一次锁
+        :param n: 编号数量
+        :return:
+        """
+        with self._lock:
+            return [self._next_id() for _ in range(n)]
+
+    def _next_id(self) -> int:
+        timestamp = self._check(self._timestamp())
         self.last_timestamp = timestamp
         return self._generate(timestamp)
 
@@ -101,7 +131,85 @@ class SnowFlake(object):
         :param last_timestamp:
         :return:
         """
+        return self._wait_until(last_timestamp + 1)
+
+    def _wait_until(self, target_timestamp):
+        """休眠到指定的时间戳，不占用CPU空转
+        :param target_timestamp:
+        :return:
+        """
         timestamp = self._timestamp()
-        while timestamp <= last_timestamp:
+        while timestamp < target_timestamp:
+            time.sleep((target_timestamp - timestamp) / 1e3)
             timestamp = self._timestamp()
-        return timestamp
\ No newline at end of file
+        return timestamp
+
+
+# 持有租约文件，进程退出时操作系统自动释放文件锁
+_worker_lease_file = None
+
+
+def _lease_worker_id(lock_dir: str) -> int:
+    """
+    同一台机器上的多个进程通过文件锁各自占用一个机器编号
+    :param lock_dir: 锁文件目录
+    :return: 机器编号，没有空闲编号时返回None
+    """
+    global _worker_lease_file
+    import fcntl
+    for worker_id in range(WORKER_UPPER_LIMIT + 1):
+        lease_file = open(os.path.join(lock_dir, f"snowflake_worker_{worker_id}.lock"), "a")
+        try:
+            fcntl.flock(lease_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lease_file.close()
+            continue
+        _worker_lease_file = lease_file
+        return worker_id
+    return None
+
+
+def allocate_worker_id() -> int:
+    """
+    分配机器编号，优先使用环境变量SNOWFLAKE_WORKER_ID，否则在SNOWFLAKE_LOCK_DIR中申请文件锁租约
+    :return:
+    """
+    worker_id = os.environ.get("SNOWFLAKE_WORKER_ID")
+    if worker_id:
+        return int(worker_id)
+    try:
+        worker_id = _lease_worker_id(os.environ.get("SNOWFLAKE_LOCK_DIR", tempfile.gettempdir()))
+    except (ImportError, OSError) as e:
+        # 不支持fcntl的平台（Windows）使用进程号
+        logging.warning('申请机器编号失败，使用进程号分配: {}'.format(e))
+        worker_id = None
+    if worker_id is None:
+        worker_id = os.getpid() & WORKER_UPPER_LIMIT
+    return worker_id
+
+
+def allocate_data_center_id() -> int:
+    """
+    分配数据中心编号，优先使用环境变量SNOWFLAKE_DATACENTER_ID，否则使用主机名的哈希值
+    :return:
+    """
+    data_center_id = os.environ.get("SNOWFLAKE_DATACENTER_ID")
+    if data_center_id:
+        return int(data_center_id)
+    return zlib.crc32(socket.gethostname().encode("utf-8")) & DATACENTER_UPPER_TIMIT
+
+
+def warn_if_not_unique():
+    """
+    没有配置SNOWFLAKE_WORKER_ID或共享的SNOWFLAKE_LOCK_DIR时，编号只在单机内保证不重复，启动时提示
+    :return:
+    """
+    if os.environ.get("SNOWFLAKE_WORKER_ID") or os.environ.get("SNOWFLAKE_LOCK_DIR"):
+        return
+    logging.warning('未配置SNOWFLAKE_WORKER_ID或SNOWFLAKE_LOCK_DIR，机器编号只在本机内不重复，'
+                    '多机或多容器部署时可能生成重复的编号，请为每个进程配置不同的SNOWFLAKE_WORKER_ID'
+                    '和SNOWFLAKE_DATACENTER_ID，或者将SNOWFLAKE_LOCK_DIR指向共享目录')
+
+
+warn_if_not_unique()
+singleton_snow_flake = SnowFlake(data_center_id=allocate_data_center_id(), worker_id=allocate_worker_id())
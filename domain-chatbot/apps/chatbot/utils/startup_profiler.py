@@ -0,0 +1,33 @@
+import logging
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class StartupProfiler():
+    '''记录服务启动各阶段的耗时，启动完成后输出耗时报告'''
+
+    phases: list[tuple[str, float]]
+
+    def __init__(self) -> None:
+        self.phases = []
+        self.start_time = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    def report(self) -> str:
+        total = time.perf_counter() - self.start_time
+        lines = ["=> Startup time profile"]
+        for name, elapsed in self.phases:
+            lines.append(f"   {name:<24}{elapsed * 1000:>10.1f} ms")
+        lines.append(f"   {'total':<24}{total * 1000:>10.1f} ms")
+        report = "\n".join(lines)
+        logger.info(report)
+        return report
@@ -0,0 +1,52 @@
+import logging
+import re
+import threading
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# 未安装tiktoken时按字符估算：中日韩字符一个字算一个token，其他文本约4个字符一个token
+CJK_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]')
+
+
+class TokenCounter():
+    '''token计数器，分词器只加载一次，相同文本的计数结果会被缓存'''
+
+    encoding_name: str
+
+    def __init__(self, encoding_name: str = "cl100k_base") -> None:
+        self.encoding_name = encoding_name
+        self._encoding = None
+        self._encoding_failed = False
+        self._lock = threading.Lock()
+        # 角色设定、对话样例等每轮都会重复出现，缓存计数结果
+        self.count = lru_cache(maxsize=4096)(self._count)
+
+    def _get_encoding(self):
+        if self._encoding is None and tiktoken is not None and not self._encoding_failed:
+            with self._lock:
+                if self._encoding is None and not self._encoding_failed:
+                    try:
+                        self._encoding = tiktoken.get_encoding(self.encoding_name)
+                    except Exception as e:
+                        # 分词器文件下载失败时退化为估算
+                        self._encoding_failed = True
+                        logger.warning("load tiktoken encoding error: %s" % str(e))
+        return self._encoding
+
+    def _count(self, text: str) -> int:
+        if not text:
+            return 0
+        encoding = self._get_encoding()
+        if encoding is not None:
+            return len(encoding.encode(text))
+        cjk_count = len(CJK_PATTERN.findall(text))
+        return cjk_count + (len(text) - cjk_count + 3) // 4
+
+
+singleton_token_counter = TokenCounter()
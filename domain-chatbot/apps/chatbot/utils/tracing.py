@@ -0,0 +1,215 @@
+import contextvars
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class TurnContext():
+    '''一轮对话的追踪上下文
+
+    turn_id: 对话id，跨线程、跨队列传递时随消息一起传递
+    start_time: 对话开始的时间（time.perf_counter）
+    '''
+
+    turn_id: str
+    start_time: float
+
+    def __init__(self, turn_id: str = None, start_time: float = None) -> None:
+        self.turn_id = turn_id or uuid.uuid4().hex
+        self.start_time = time.perf_counter() if start_time is None else start_time
+        # 已经记录过的一次性事件，例如首个token
+        self.marks = set()
+
+
+# 当前线程（协程）正在处理的对话，asyncio.run会复制当前上下文，流式回调中也能取到
+current_turn: contextvars.ContextVar[TurnContext] = contextvars.ContextVar("current_turn", default=None)
+
+
+class SpanStats():
+    '''每个阶段最近window次耗时，用于计算分位数'''
+
+    def __init__(self, window: int = 1000) -> None:
+        self._durations: dict[str, deque] = {}
+        self._counts: dict[str, int] = {}
+        self._window = window
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, duration: float):
+        with self._lock:
+            durations = self._durations.get(stage)
+            if durations is None:
+                durations = self._durations[stage] = deque(maxlen=self._window)
+                self._counts[stage] = 0
+            durations.append(duration)
+            self._counts[stage] += 1
+
+    def summary(self) -> dict:
+        '''各阶段的耗时分位数，单位毫秒'''
+        with self._lock:
+            items = [(stage, sorted(durations), self._counts[stage])
+                     for stage, durations in self._durations.items()]
+        result = {}
+        for stage, durations, count in items:
+            def percentile(p: float) -> float:
+                return round(durations[min(int(len(durations) * p), len(durations) - 1)] * 1000, 3)
+            result[stage] = {
+                "count": count,
+                "p50": percentile(0.50),
+                "p95": percentile(0.95),
+                "p99": percentile(0.99),
+                "max": round(durations[-1] * 1000, 3),
+            }
+        return result
+
+
+class Tracer():
+    '''轻量的对话链路追踪
+
+    span按阶段记录耗时，写入内存中的统计，设置了trace_file时由后台线程追加写入JSONL文件，
+    文件超过max_bytes后重命名为 trace_file.1 并写入新文件，最多占用两个文件的空间
+
+    enabled: 是否开启
+    trace_file: JSONL文件路径，为空时只统计不写文件
+    max_bytes: 单个JSONL文件的最大字节数
+    '''
+
+    enabled: bool
+    trace_file: str
+    max_bytes: int
+
+    def __init__(self, enabled: bool = True, trace_file: str = None, max_bytes: int = 10 * 1024 * 1024) -> None:
+        self.enabled = enabled
+        self.trace_file = trace_file
+        self.max_bytes = max_bytes
+        self.stats = SpanStats()
+        self._export_queue = queue.SimpleQueue()
+        self._exporter_thread = None
+        self._exporter_lock = threading.Lock()
+
+    @contextmanager
+    def turn(self, turn_id: str = None):
+        '''开始一轮对话，已经在对话中时沿用当前的对话'''
+        turn_context = current_turn.get()
+        if turn_context is not None and turn_id in (None, turn_context.turn_id):
+            yield turn_context
+            return
+        token = current_turn.set(TurnContext(turn_id))
+        try:
+            yield current_turn.get()
+        finally:
+            current_turn.reset(token)
+
+    @contextmanager
+    def use_turn(self, turn_id: str, start_time: float = None):
+        '''在消费队列的线程中恢复消息所属的对话，start_time为对话开始的时间，随消息一起传递'''
+        if turn_id is None:
+            yield None
+            return
+        token = current_turn.set(TurnContext(turn_id, start_time))
+        try:
+            yield current_turn.get()
+        finally:
+            current_turn.reset(token)
+
+    @staticmethod
+    def current_turn_id() -> str:
+        turn_context = current_turn.get()
+        return turn_context.turn_id if turn_context is not None else None
+
+    @staticmethod
+    def current_turn_start_time() -> float:
+        turn_context = current_turn.get()
+        return turn_context.start_time if turn_context is not None else None
+
+    @contextmanager
+    def span(self, stage: str, **attributes):
+        '''记录一个阶段的耗时，异常时也会记录'''
+        if not self.enabled:
+            yield
+            return
+        start_time = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            if error is not None:
+                attributes["error"] = error
+            self.record(stage, time.perf_counter() - start_time, **attributes)
+
+    def mark_once(self, stage: str, **attributes):
+        '''记录从对话开始到现在的耗时，每轮对话只记录一次，例如首个token'''
+        turn_context = current_turn.get()
+        if not self.enabled or turn_context is None or stage in turn_context.marks:
+            return
+        turn_context.marks.add(stage)
+        self.record(stage, time.perf_counter() - turn_context.start_time, **attributes)
+
+    def record(self, stage: str, duration: float, turn_id: str = None, **attributes):
+        if not self.enabled:
+            return
+        self.stats.record(stage, duration)
+        if self.trace_file:
+            self._ensure_exporter()
+            self._export_queue.put({
+                "ts": time.time(),
+                "turn_id": turn_id or self.current_turn_id(),
+                "stage": stage,
+                "duration_ms": round(duration * 1000, 3),
+                "thread": threading.current_thread().name,
+                **attributes
+            })
+
+    def summary(self) -> dict:
+        return self.stats.summary()
+
+    def _ensure_exporter(self):
+        if self._exporter_thread is not None:
+            return
+        with self._exporter_lock:
+            if self._exporter_thread is None:
+                self._exporter_thread = threading.Thread(target=self._export, name="trace_exporter")
+                self._exporter_thread.daemon = True
+                self._exporter_thread.start()
+
+    def _export(self):
+        while True:
+            spans = [self._export_queue.get()]
+            # 取出队列中已有的span，一次写入
+            while True:
+                try:
+                    spans.append(self._export_queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._rotate()
+                with open(self.trace_file, "a", encoding="utf-8") as f:
+                    f.writelines(json.dumps(span, ensure_ascii=False) + "\n" for span in spans)
+            except Exception as e:
+                logger.error("export trace error: %s" % str(e))
+
+    def _rotate(self):
+        try:
+            size = os.path.getsize(self.trace_file)
+        except OSError:
+            return
+        if size >= self.max_bytes:
+            os.replace(self.trace_file, self.trace_file + ".1")
+
+
+# 单例 tracer，TRACE_ENABLED=false 关闭；默认只在内存中统计，设置 TRACE_FILE 时才写入JSONL文件，
+# 单个文件超过 TRACE_FILE_MAX_BYTES 后轮转
+singleton_tracer = Tracer(
+    enabled=os.environ.get("TRACE_ENABLED", "true").lower() == "true",
+    trace_file=os.environ.get("TRACE_FILE") or None,
+    max_bytes=int(os.environ.get("TRACE_FILE_MAX_BYTES", str(10 * 1024 * 1024))))
@@ -1,5 +1,4 @@
 import os
-import time
 from django.conf import settings
 from django.shortcuts import render, get_object_or_404
 import json
@@ -9,7 +8,9 @@ from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
 from .config import singleton_sys_config
-from .reflection.reflection_generation import ReflectionGeneration
+from .reflection.reflection_generation import ReflectionJobTask, reflection_enabled
+from .character.character_generation import singleton_character_generation
+from .utils.tracing import singleton_tracer
 from .models import CustomRoleModel, BackgroundImageModel, VrmModel
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
@@ -27,7 +28,10 @@ def chat(request):
     data = json.loads(request.body.decode('utf-8'))
     query = data["query"]
     you_name = data["you_name"]
-    process_core.chat(you_name=you_name, query=query)
+    # 可选：携带session_id时回复只推送给连接时携带同一session_id的客户端（ws/?session_id=xxx），否则广播给所有客户端
+    session_id = data.get("session_id")
+    with singleton_tracer.turn(), singleton_tracer.span("view.chat"):
+        process_core.chat(you_name=you_name, query=query, session_id=session_id)
     return Response({"response": "OK", "code": "200"})
 
 
@@ -52,21 +56,19 @@ def get_config(request):
     :param request:
     :return:
     '''
-    return Response({"response": singleton_sys_config.get(), "code": "200"})
+    return Response({"response": singleton_sys_config.snapshot(), "code": "200"})
 
 
 @api_view(['GET'])
 def reflection_generation(request):
     '''
-      生成新记忆
+      触发一次反思任务，反思在调度器的线程池中执行，不阻塞请求
+      未开启反思或长期记忆时返回disabled
     :return:
     '''
-    rg = ReflectionGeneration()
-    rg.generation(role_name="Maiko")
-    timestamp = time.time()
-    expr = f'timestamp <= {timestamp}'
-    result = singleton_sys_config.memory_storage_driver.pageQuery(
-        1, 100, expr=expr)
+    if not reflection_enabled(singleton_sys_config.runtime()):
+        return Response({"response": "disabled", "code": "200"})
+    result = ReflectionJobTask.trigger()
     return Response({"response": result, "code": "200"})
 
 
@@ -76,7 +78,7 @@ def clear_memory(request):
       删除测试记忆
     :return:
     '''
-    result = singleton_sys_config.memory_storage_driver.clear("alan")
+    result = singleton_sys_config.runtime().memory_storage_driver.clear("alan")
     return Response({"response": result, "code": "200"})
 
 
@@ -117,6 +119,7 @@ def create_custom_role(request):
         custom_role_template_type=custom_role_template_type
     )
     custom_role.save()
+    singleton_character_generation.invalidate(custom_role.id)
 
     return Response({"response": "Data added to database", "code": "200"})
 
@@ -145,6 +148,7 @@ def edit_custom_role(request, pk):
         custom_role_template_type=custom_role_template_type
     )
     custom_role.save()
+    singleton_character_generation.invalidate(custom_role.id)
     return Response({"response": "Data edit to database", "code": "200"})
 
 
@@ -152,6 +156,7 @@ def edit_custom_role(request, pk):
 def delete_custom_role(request, pk):
     role = get_object_or_404(CustomRoleModel, pk=pk)
     role.delete()
+    singleton_character_generation.invalidate(pk)
     return Response({"response": "ok", "code": "200"})
 
 
@@ -282,3 +287,50 @@ def show_system_vrm_models(request):
         }
     ]
     return Response({"response": vrm_models, "code": "200"})
+
+
+@api_view(['GET'])
+def live_room_list(request):
+    '''
+      获取正在监听的直播间列表
+    :param request:
+    :return:
+    '''
+    from .insight.bilibili.bili_live_client import bili_live_room_manager
+    return Response({"response": bili_live_room_manager.rooms(), "code": "200"})
+
+
+@api_view(['POST'])
+def add_live_room(request):
+    '''
+      添加直播间
+    :param request:
+    :return:
+    '''
+    from .insight.bilibili.bili_live_client import bili_live_room_manager
+    data = json.loads(request.body.decode('utf-8'))
+    result = bili_live_room_manager.add_room(int(data["room_id"]))
+    return Response({"response": result, "code": "200"})
+
+
+@api_view(['POST'])
+def remove_live_room(request):
+    '''
+      移除直播间
+    :param request:
+    :return:
+    '''
+    from .insight.bilibili.bili_live_client import bili_live_room_manager
+    data = json.loads(request.body.decode('utf-8'))
+    result = bili_live_room_manager.remove_room(int(data["room_id"]))
+    return Response({"response": result, "code": "200"})
+
+
+@api_view(['GET'])
+def metrics(request):
+    '''
+      对话链路各阶段的耗时统计（毫秒）
+    :param request:
+    :return:
+    '''
+    return Response({"response": singleton_tracer.summary(), "code": "200"})
@@ -0,0 +1,59 @@
+import json
+
+from django.db import migrations, models
+
+
+def split_text_to_columns(apps, schema_editor):
+    '''将历史记录中的json文本拆分到human、ai字段'''
+    LocalMemoryModel = apps.get_model('apps', 'LocalMemoryModel')
+    updated = []
+    for memory in LocalMemoryModel.objects.all().only('id', 'text').iterator():
+        try:
+            history = json.loads(memory.text)
+        except (TypeError, ValueError):
+            continue
+        if not isinstance(history, dict):
+            continue
+        memory.human = history.get('human', '')
+        memory.ai = history.get('ai', '')
+        memory.text = f"{memory.human};{memory.ai}"
+        updated.append(memory)
+    LocalMemoryModel.objects.bulk_update(updated, ['human', 'ai', 'text'], batch_size=500)
+
+
+def merge_columns_to_text(apps, schema_editor):
+    LocalMemoryModel = apps.get_model('apps', 'LocalMemoryModel')
+    updated = []
+    for memory in LocalMemoryModel.objects.exclude(human='', ai='').only('id', 'human', 'ai').iterator():
+        memory.text = json.dumps({"ai": memory.ai, "human": memory.human})
+        updated.append(memory)
+    LocalMemoryModel.objects.bulk_update(updated, ['text'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0006_alter_vrmmodel_vrm'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='localmemorymodel',
+            name='human',
+            field=models.TextField(default=''),
+        ),
+        migrations.AddField(
+            model_name='localmemorymodel',
+            name='ai',
+            field=models.TextField(default=''),
+        ),
+        migrations.AddIndex(
+            model_name='localmemorymodel',
+            index=models.Index(fields=['owner', 'sender', 'timestamp'], name='local_memory_owner_sender_ts'),
+        ),
+        migrations.AddIndex(
+            model_name='localmemorymodel',
+            index=models.Index(fields=['owner', 'timestamp'], name='local_memory_owner_ts'),
+        ),
+        migrations.RunPython(split_text_to_columns, merge_columns_to_text),
+    ]
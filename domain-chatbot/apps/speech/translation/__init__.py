@@ -1,3 +1,4 @@
-from .huoshan.huoshan_translation_client import HuoShanTranslationClient
+from .translation_registry import TranslationRegistry
 
-translationClient = HuoShanTranslationClient()
+# 翻译模块在第一次使用时才按系统配置初始化
+translation_registry = TranslationRegistry()
@@ -9,3 +9,7 @@ class BaseTranslationClient(ABC):
     def translation(self, text: str, target_language: str) -> str:
         '''翻译'''
         pass
+
+    def translation_batch(self, texts: list[str], target_language: str) -> list[str]:
+        '''批量翻译，返回结果与texts一一对应，支持批量接口的翻译模块应重写该方法'''
+        return [self.translation(text=text, target_language=target_language) for text in texts]
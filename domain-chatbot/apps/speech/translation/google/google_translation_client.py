@@ -1,11 +1,16 @@
 from easygoogletranslate import EasyGoogleTranslate
+from ..base_translation_client import BaseTranslationClient
 
-translator = EasyGoogleTranslate(
-    source_language='en',
-    target_language='de',
-    timeout=10
-)
-result = translator.translate('This is an example.')
 
-print(result) 
-# Output: Dies ist ein Beispiel.
\ No newline at end of file
+class GoogleTranslationClient(BaseTranslationClient):
+
+    source_language: str = 'auto'
+    timeout: int = 10
+
+    def translation(self, text: str, target_language: str) -> str:
+        translator = EasyGoogleTranslate(
+            source_language=self.source_language,
+            target_language=target_language,
+            timeout=self.timeout
+        )
+        return translator.translate(text)
@@ -36,11 +36,13 @@ class HuoShanTranslationClient(BaseTranslationClient):
         self.service = Service(self.service_info, self.api_info)
 
     def translation(self, text: str, target_language: str) -> str:
+        return self.translation_batch(texts=[text], target_language=target_language)[0]
+
+    def translation_batch(self, texts: list[str], target_language: str) -> list[str]:
         body = {
             'TargetLanguage': target_language,
-            'TextList': [text],
+            'TextList': texts,
         }
         res = self.service.json('translate', {}, json.dumps(body))
         res = json.loads(res)
-        translation = res["TranslationList"][0]["Translation"]
-        return translation
+        return [item["Translation"] for item in res["TranslationList"]]
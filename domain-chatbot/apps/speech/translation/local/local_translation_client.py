@@ -0,0 +1,20 @@
+from ..base_translation_client import BaseTranslationClient
+
+
+class LocalTranslationClient(BaseTranslationClient):
+
+    '''本地翻译模块，不依赖任何外部服务，用于测试或者关闭翻译
+
+    dictionary: 本地词典，键可以是 (text, target_language) 或者 text，未命中时原样返回
+    '''
+
+    dictionary: dict
+
+    def __init__(self, dictionary: dict = None) -> None:
+        self.dictionary = dictionary if dictionary is not None else {}
+
+    def translation(self, text: str, target_language: str) -> str:
+        translation = self.dictionary.get((text, target_language))
+        if translation is None:
+            translation = self.dictionary.get(text, text)
+        return translation
@@ -0,0 +1,80 @@
+import importlib
+import logging
+import threading
+from .base_translation_client import BaseTranslationClient
+from .translation_service import TranslationService
+
+logger = logging.getLogger(__name__)
+
+# 翻译模块注册表：类型 => (模块路径, 类名)，只有在第一次使用时才导入对应的SDK
+TRANSLATION_BACKENDS = {
+    "huoshan": (".huoshan.huoshan_translation_client", "HuoShanTranslationClient"),
+    "youdao": (".youdao.youdao_translation_client", "YoudaoTranslationClient"),
+    "google": (".google.google_translation_client", "GoogleTranslationClient"),
+    "local": (".local.local_translation_client", "LocalTranslationClient"),
+}
+
+# 各翻译模块允许的最大并发请求数，由TranslationService限制同时进行的批量翻译数
+DEFAULT_MAX_CONCURRENCY = {
+    "huoshan": 4,
+    "youdao": 2,
+    "google": 2,
+    "local": 64,
+}
+
+DEFAULT_TRANSLATION_TYPE = "huoshan"
+
+
+def load_translation_config() -> dict:
+    '''从系统配置中读取翻译配置'''
+    from ...chatbot.config import singleton_sys_config
+    return singleton_sys_config.snapshot().get("translationConfig", {})
+
+
+class TranslationRegistry():
+    '''翻译模块注册表，按系统配置懒加载翻译服务
+
+    服务按 (类型, 最大并发数) 缓存，修改maxConcurrency后下一次请求会按新的并发数重新创建
+    '''
+
+    def __init__(self) -> None:
+        self._services: dict[tuple[str, int], TranslationService] = {}
+        self._registered: dict[str, TranslationService] = {}
+        self._lock = threading.Lock()
+
+    def create_client(self, type: str) -> BaseTranslationClient:
+        if type not in TRANSLATION_BACKENDS:
+            raise ValueError(f"Unknown translation type: {type}")
+        module_name, class_name = TRANSLATION_BACKENDS[type]
+        module = importlib.import_module(module_name, package=__package__)
+        return getattr(module, class_name)()
+
+    def get(self, type: str = None) -> TranslationService:
+        '''获取翻译服务，type为空时使用系统配置中的翻译类型'''
+        max_concurrency = None
+        if type is None:
+            translation_config = load_translation_config()
+            type = translation_config.get("translationType", DEFAULT_TRANSLATION_TYPE)
+            max_concurrency = translation_config.get("maxConcurrency")
+        service = self._registered.get(type)
+        if service is not None:
+            return service
+        if max_concurrency is None:
+            max_concurrency = DEFAULT_MAX_CONCURRENCY.get(type, 1)
+        key = (type, max_concurrency)
+        service = self._services.get(key)
+        if service is None:
+            with self._lock:
+                service = self._services.get(key)
+                if service is None:
+                    service = TranslationService(self.create_client(type), max_concurrency=int(max_concurrency))
+                    logger.info(f"=> Load TranslationClient Success # type:{type} max_concurrency:{max_concurrency} #")
+                    # 同一类型只保留当前并发数的服务，旧服务上进行中的请求不受影响
+                    self._services = {k: v for k, v in self._services.items() if k[0] != type}
+                    self._services[key] = service
+        return service
+
+    def register(self, type: str, client: BaseTranslationClient) -> None:
+        '''直接注册翻译模块实例，例如在测试中替换为本地翻译'''
+        with self._lock:
+            self._registered[type] = TranslationService(client)
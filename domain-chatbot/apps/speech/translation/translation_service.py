@@ -0,0 +1,135 @@
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from .base_translation_client import BaseTranslationClient
+
+logger = logging.getLogger(__name__)
+
+
+class TranslationService():
+    '''翻译服务层，在翻译模块之上提供结果缓存和请求合并
+
+    请求先进入待翻译队列，同时进行的批量翻译少于max_concurrency时，调用方直接取出一批发起翻译，不额外等待；
+    并发数已满时排队的请求在有空位后合并为一次批量翻译。每个调用方自己的文本翻译完成后立即返回，
+    不会替其他请求一直处理队列
+
+    cache_size: LRU缓存的条目数，缓存键为 (text, target_language)
+    max_batch_size: 单次批量翻译的最大条数
+    max_concurrency: 同时进行的批量翻译请求数上限
+    '''
+
+    client: BaseTranslationClient
+    cache_size: int
+    max_batch_size: int
+    max_concurrency: int
+
+    def __init__(self, client: BaseTranslationClient, cache_size: int = 1024, max_batch_size: int = 16,
+                 max_concurrency: int = 4) -> None:
+        self.client = client
+        self.cache_size = cache_size
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self._cache: OrderedDict[tuple[str, str], str] = OrderedDict()
+        self._inflight: dict[tuple[str, str], Future] = {}
+        # 待翻译的文本，按目标语言分组，先到先翻译
+        self._pending: OrderedDict[str, list[str]] = OrderedDict()
+        self._active = 0
+        self._lock = threading.Lock()
+        # 批量翻译完成或有空位时唤醒等待的调用方
+        self._condition = threading.Condition(self._lock)
+        # 请求的文本数、实际发起的批量翻译次数和最大并发数，文本数与批次数之差即为合并掉的请求
+        self._text_count = 0
+        self._batch_count = 0
+        self._peak_active = 0
+
+    def translation(self, text: str, target_language: str) -> str:
+        return self.translation_batch(texts=[text], target_language=target_language)[0]
+
+    def translation_batch(self, texts: list[str], target_language: str) -> list[str]:
+        results: list = [None] * len(texts)
+        futures: list[tuple[int, Future]] = []
+        with self._condition:
+            for i, text in enumerate(texts):
+                key = (text, target_language)
+                cached = self._cache.get(key)
+                if cached is not None:
+                    self._cache.move_to_end(key)
+                    results[i] = cached
+                    continue
+                # 相同文本正在翻译中则复用同一个结果
+                future = self._inflight.get(key)
+                if future is None:
+                    future = Future()
+                    self._inflight[key] = future
+                    self._pending.setdefault(target_language, []).append(text)
+                    self._text_count += 1
+                futures.append((i, future))
+
+        # 自己的文本还没有翻译完成时，有空位就取出一批翻译，否则等待
+        while True:
+            with self._condition:
+                while not self._done(futures) and not (self._pending and self._active < self.max_concurrency):
+                    self._condition.wait()
+                if self._done(futures):
+                    break
+                batch_texts, batch_language = self._take_batch()
+                self._active += 1
+                self._peak_active = max(self._peak_active, self._active)
+            try:
+                self._translate_batch(batch_texts, batch_language)
+            finally:
+                with self._condition:
+                    self._active -= 1
+                    self._condition.notify_all()
+
+        for i, future in futures:
+            results[i] = future.result()
+        return results
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"texts": self._text_count, "batches": self._batch_count,
+                    "merged": self._text_count - self._batch_count, "peak_concurrency": self._peak_active}
+
+    @staticmethod
+    def _done(futures: list[tuple[int, Future]]) -> bool:
+        return all(future.done() for _, future in futures)
+
+    def _take_batch(self) -> tuple[list[str], str]:
+        '''取出最早排队的目标语言的一批文本，调用方需持有锁'''
+        target_language, texts = next(iter(self._pending.items()))
+        batch_texts = texts[:self.max_batch_size]
+        if len(texts) > self.max_batch_size:
+            self._pending[target_language] = texts[self.max_batch_size:]
+        else:
+            del self._pending[target_language]
+        return batch_texts, target_language
+
+    def _translate_batch(self, texts: list[str], target_language: str) -> None:
+        with self._lock:
+            self._batch_count += 1
+        try:
+            translations = self.client.translation_batch(texts=texts, target_language=target_language)
+            if len(translations) != len(texts):
+                raise ValueError(f"translation batch size mismatch: {len(translations)} != {len(texts)}")
+            logger.debug(f"translation batch # size:{len(texts)} target_language:{target_language} #")
+        except Exception as e:
+            with self._lock:
+                futures = [self._inflight.pop((text, target_language)) for text in texts]
+            for future in futures:
+                future.set_exception(e)
+            return
+
+        with self._lock:
+            futures = []
+            for text, translation in zip(texts, translations):
+                key = (text, target_language)
+                self._cache[key] = translation
+                self._cache.move_to_end(key)
+                futures.append((self._inflight.pop(key), translation))
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        for future, translation in futures:
+            future.set_result(translation)
+
@@ -1,7 +1,8 @@
 import requests
 import os
 import json
-from ..utils.AuthV3Util import addAuthParams
+from ..base_translation_client import BaseTranslationClient
+from .AuthV3Util import addAuthParams
 
 # 您的应用ID
 APP_KEY = os.getenv("YOUDAO_APP_KEY")
@@ -9,16 +10,14 @@ APP_KEY = os.getenv("YOUDAO_APP_KEY")
 APP_SECRET = os.getenv("YOUDAO_SECRET_KEY")
 
 
-class TranslationClient:
+class YoudaoTranslationClient(BaseTranslationClient):
 
-    @staticmethod
-    def translation(query:str) -> str:
-        q = query
-        lang_from = 'zh-CHS'
-        lang_to = 'ja'
-        data = {'q': q, 'from': lang_from, 'to': lang_to}
+    lang_from: str = 'auto'
+
+    def translation(self, text: str, target_language: str) -> str:
+        data = {'q': text, 'from': self.lang_from, 'to': target_language}
         addAuthParams(APP_KEY, APP_SECRET, data)
         header = {'Content-Type': 'application/x-www-form-urlencoded'}
         res = requests.post('https://openapi.youdao.com/api', data, header)
         content = str(res.content, 'utf-8')
-        return json.loads(content)
\ No newline at end of file
+        return json.loads(content)["translation"][0]
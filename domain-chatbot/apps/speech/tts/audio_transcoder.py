@@ -0,0 +1,130 @@
+import logging
+import re
+import shutil
+import subprocess
+import threading
+from typing import Iterator
+
+logger = logging.getLogger(__name__)
+
+# 支持输出的音频格式 => (ffmpeg封装格式, ffmpeg编码器, Content-Type)
+AUDIO_FORMATS = {
+    "mp3": ("mp3", "libmp3lame", "audio/mpeg"),
+    "wav": ("wav", "pcm_s16le", "audio/wav"),
+    "opus": ("ogg", "libopus", "audio/ogg"),
+}
+
+# 每次从转码进程读取的数据块大小
+CHUNK_SIZE = 16 * 1024
+
+# 码率格式，例如 64000、64k
+BITRATE_PATTERN = re.compile(r'^[1-9][0-9]*k?$')
+
+
+class UnsupportedFormatError(Exception):
+    '''请求的音频输出格式不支持或参数不合法'''
+
+
+class AudioFormat():
+    '''音频输出格式
+
+    format: 音频格式 opus/mp3/wav
+    sample_rate: 采样率，None表示保持原始采样率
+    bitrate: 码率，例如 "64k"，None表示使用编码器默认码率
+    '''
+    format: str
+    sample_rate: int
+    bitrate: str
+
+    def __init__(self, format: str, sample_rate: int = None, bitrate: str = None) -> None:
+        if format not in AUDIO_FORMATS:
+            raise UnsupportedFormatError(f"Unknown audio format: {format}")
+        self.format = format
+        try:
+            self.sample_rate = int(sample_rate) if sample_rate else None
+        except (TypeError, ValueError):
+            raise UnsupportedFormatError(f"Invalid sample rate: {sample_rate}")
+        self.bitrate = str(bitrate) if bitrate else None
+        # 参数在开始转码前校验，避免ffmpeg在响应已经开始后才失败
+        if self.sample_rate is not None and not 8000 <= self.sample_rate <= 192000:
+            raise UnsupportedFormatError(f"Invalid sample rate: {sample_rate}")
+        if self.bitrate is not None and not BITRATE_PATTERN.match(self.bitrate):
+            raise UnsupportedFormatError(f"Invalid bitrate: {bitrate}")
+
+    @property
+    def content_type(self) -> str:
+        return AUDIO_FORMATS[self.format][2]
+
+    @property
+    def extension(self) -> str:
+        return AUDIO_FORMATS[self.format][0]
+
+    def is_source(self, source_format: str) -> bool:
+        '''是否与合成结果的原始格式一致，一致则不需要转码'''
+        return self.format == source_format and self.sample_rate is None and self.bitrate is None
+
+    def key(self) -> tuple:
+        return (self.format, self.sample_rate, self.bitrate)
+
+
+class AudioTranscoder():
+    '''基于ffmpeg管道的流式音频转码'''
+
+    ffmpeg_path: str
+
+    def __init__(self) -> None:
+        self.ffmpeg_path = shutil.which("ffmpeg")
+        if self.ffmpeg_path is None:
+            logger.warning("=> ffmpeg not found, audio transcoding is disabled")
+
+    def available(self) -> bool:
+        return self.ffmpeg_path is not None
+
+    def build_command(self, source_format: str, target: AudioFormat) -> list[str]:
+        muxer, codec, _ = AUDIO_FORMATS[target.format]
+        command = [self.ffmpeg_path, "-hide_banner", "-loglevel", "error",
+                   "-f", AUDIO_FORMATS[source_format][0], "-i", "pipe:0",
+                   "-vn", "-c:a", codec]
+        if target.sample_rate:
+            command += ["-ar", str(target.sample_rate)]
+        if target.bitrate:
+            command += ["-b:a", target.bitrate]
+        command += ["-f", muxer, "pipe:1"]
+        return command
+
+    def stream(self, audio: bytes, source_format: str, target: AudioFormat) -> Iterator[bytes]:
+        '''将音频数据转码为目标格式，边转码边输出数据块'''
+        process = subprocess.Popen(self.build_command(source_format, target),
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+        # 单独的线程写入输入数据，避免管道缓冲区写满导致死锁
+        def write_input():
+            try:
+                process.stdin.write(audio)
+            except BrokenPipeError:
+                pass
+            finally:
+                process.stdin.close()
+
+        writer = threading.Thread(target=write_input)
+        writer.daemon = True
+        writer.start()
+        completed = False
+        try:
+            while True:
+                chunk = process.stdout.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+            completed = True
+        finally:
+            # 调用方提前停止读取（例如客户端断开）时直接结束转码进程
+            if not completed:
+                process.kill()
+            writer.join()
+            process.stdout.close()
+            return_code = process.wait()
+            stderr = process.stderr.read()
+            process.stderr.close()
+        if return_code != 0:
+            raise RuntimeError(f"ffmpeg transcode failed: {stderr.decode('utf-8', 'ignore')}")
@@ -1,9 +1,13 @@
 import json
-import os
+import logging
 import uuid
 
-import requests
-from ..utils.uuid_generator import generate
+from ..utils.async_http_client import AsyncHttpClient
+
+logger = logging.getLogger(__name__)
+
+# Bert-VITS2 共享的连接池客户端
+default_http_client = AsyncHttpClient()
 
 url = "https://v2.genshinvoice.top/run/predict"
 
@@ -619,32 +623,28 @@ bert_vits2_voices = [{
 
 
 class BertVits2API:
-    def request(self, params: dict[str, str]) -> str:
+
+    http_client: AsyncHttpClient
+
+    def __init__(self, http_client: AsyncHttpClient = None) -> None:
+        self.http_client = http_client if http_client is not None else default_http_client
+
+    def request(self, params: dict[str, str]) -> bytes:
+        return self.http_client.run(self.async_request(params=params))
+
+    async def async_request(self, params: dict[str, str]) -> bytes:
+        session = await self.http_client.get_session()
         # 合成语音
         body = json.dumps(params, ensure_ascii=False).encode('utf-8')
-        response = requests.post(url, headers=headers, data=body)
-        print(url)
-        print(params)
-        print(response.text)
-        voice_result = json.loads(response.text)["data"]
+        async with session.post(url, headers=headers, data=body) as response:
+            response.raise_for_status()
+            voice_result = json.loads(await response.text())["data"]
+        logger.debug(f"bert-vits2 synthesis # params:{params} => result:{voice_result}")
         file_path = voice_result[1]["name"]
-        # 下载文件
-        response = requests.get(file_url + file_path, headers=headers)
-        # 初始化文件夹
-        file_name = generate() + ".wav"
-        file_path = os.getcwd() + "/tmp/" + file_name
-        dirPath = os.path.dirname(file_path)
-        if not os.path.exists(dirPath):
-            os.makedirs(dirPath)
-        if not os.path.exists(file_path):
-            # 用open创建文件 兼容mac
-            open(file_path, 'a').close()
-
-        # 写入语音文件
-        with open(file_path, 'wb') as file:
-            file.write(response.content)
-
-        return file_name
+        # 下载语音文件，直接返回内存中的字节数据
+        async with session.get(file_url + file_path, headers=headers) as response:
+            response.raise_for_status()
+            return await response.read()
 
 
 class BertVits2:
@@ -653,7 +653,7 @@ class BertVits2:
     def __init__(self):
         self.client = BertVits2API()
 
-    def synthesis(self, text: str, speaker: str, noise: str, noisew: str, sdp_ratio: str) -> str:
+    def synthesis(self, text: str, speaker: str, noise: str, noisew: str, sdp_ratio: str) -> bytes:
         params = {
             "data": [text, speaker, sdp_ratio, noise, noisew, 1, "ZH", None, "Happy", "Text prompt", "", 0.7],
             "event_data": None,
@@ -32,7 +32,7 @@ class Edge():
         new_text = new_text.replace(']', "")
         return new_text
 
-    def create_audio(self, text: str, voiceId: str):
+    def create_audio(self, text: str, voiceId: str) -> bytes:
         new_text = self.remove_html(text)
         pwdPath = os.getcwd()
         file_name = generate() + ".mp3"
@@ -40,11 +40,13 @@ class Edge():
         dirPath = os.path.dirname(filePath)
         if not os.path.exists(dirPath):
             os.makedirs(dirPath)
-        if not os.path.exists(filePath):
-            # 用open创建文件 兼容mac
-            open(filePath, 'a').close()
 
-        subprocess.run(["edge-tts", "--voice", voiceId, "--text", new_text,
-                        "--write-media", str(filePath)])
-
-        return file_name
+        # edge-tts 命令行只能写文件，读取后立即删除，避免残留临时文件
+        try:
+            subprocess.run(["edge-tts", "--voice", voiceId, "--text", new_text,
+                            "--write-media", str(filePath)])
+            with open(filePath, 'rb') as file:
+                return file.read()
+        finally:
+            if os.path.exists(filePath):
+                os.remove(filePath)
@@ -1,17 +1,28 @@
 from abc import ABC, abstractmethod
+import itertools
 import logging
+import os
+from typing import Iterator
 from .edge_tts import Edge, edge_voices
 from .bert_vits2 import BertVits2
+from .audio_cache import AudioCache
+from .audio_transcoder import AudioFormat, AudioTranscoder
 
 logger = logging.getLogger(__name__)
 
+# 音频缓存容量（MB）
+TTS_AUDIO_CACHE_MB = int(os.environ.get("TTS_AUDIO_CACHE_MB", "64"))
+
 
 class BaseTTS(ABC):
     '''合成语音统一抽象类'''
 
+    # 合成结果的音频格式
+    audio_format: str
+
     @abstractmethod
-    def synthesis(self, text: str, voice_id: str, **kwargs) -> str:
-        '''合成语音'''
+    def synthesis(self, text: str, voice_id: str, **kwargs) -> bytes:
+        '''合成语音，返回音频字节数据'''
         pass
 
     @abstractmethod
@@ -23,11 +34,12 @@ class BaseTTS(ABC):
 class EdgeTTS(BaseTTS):
     '''Edge 微软语音合成类'''
     client: Edge
+    audio_format: str = "mp3"
 
     def __init__(self):
         self.client = Edge()
 
-    def synthesis(self, text: str, voice_id: str, **kwargs) -> str:
+    def synthesis(self, text: str, voice_id: str, **kwargs) -> bytes:
         return self.client.create_audio(text=text, voiceId=voice_id)
 
     def get_voices(self) -> list[dict[str, str]]:
@@ -37,11 +49,12 @@ class EdgeTTS(BaseTTS):
 class BertVITS2TTS(BaseTTS):
     '''Bert-VITS2 语音合成类'''
     client: BertVits2
+    audio_format: str = "wav"
 
     def __init__(self):
         self.client = BertVits2()
 
-    def synthesis(self, text: str, voice_id: str, **kwargs) -> str:
+    def synthesis(self, text: str, voice_id: str, **kwargs) -> bytes:
         noise = kwargs.get("noise", 0.6)
         noisew = kwargs.get("noisew", 0.9)
         sdp_ratio = kwargs.get("sdp_ratio", 0.5)
@@ -54,11 +67,59 @@ class BertVITS2TTS(BaseTTS):
 class TTSDriver:
     '''TTS驱动类'''
 
-    def synthesis(self, type: str, text: str, voice_id: str, **kwargs) -> str:
+    audio_cache: AudioCache
+    transcoder: AudioTranscoder
+
+    def __init__(self) -> None:
+        self.audio_cache = AudioCache(max_bytes=TTS_AUDIO_CACHE_MB * 1024 * 1024)
+        self.transcoder = AudioTranscoder()
+
+    def synthesis(self, type: str, text: str, voice_id: str, **kwargs) -> bytes:
+        tts = self.get_strategy(type)
+        audio = tts.synthesis(text=text, voice_id=voice_id, kwargs=kwargs)
+        logger.info(f"TTS synthesis # type:{type} text:{text} => {tts.audio_format} bytes: {len(audio)} #")
+        return audio
+
+    def synthesis_stream(self, type: str, text: str, voice_id: str, audio_format: AudioFormat = None,
+                         **kwargs) -> tuple[AudioFormat, Iterator[bytes]]:
+        '''合成语音并按请求的格式流式输出，结果按最终格式缓存'''
         tts = self.get_strategy(type)
-        file_name = tts.synthesis(text=text, voice_id=voice_id, kwargs=kwargs)
-        logger.info(f"TTS synthesis # type:{type} text:{text} => file_name: {file_name} #")
-        return file_name;
+        source_format = tts.audio_format
+        if audio_format is None:
+            audio_format = AudioFormat(source_format)
+        elif not audio_format.is_source(source_format) and not self.transcoder.available():
+            logger.warning(f"TTS transcode unavailable, fallback to {source_format}")
+            audio_format = AudioFormat(source_format)
+
+        cache_key = (type, voice_id, text, tuple(sorted(kwargs.items())), audio_format.key())
+        audio = self.audio_cache.get(cache_key)
+        if audio is not None:
+            logger.debug(f"TTS cache hit # type:{type} text:{text} #")
+            return audio_format, iter([audio])
+
+        audio = self.synthesis(type=type, text=text, voice_id=voice_id, **kwargs)
+        if audio_format.is_source(source_format):
+            self.audio_cache.put(cache_key, audio)
+            return audio_format, iter([audio])
+        # 先取出第一个数据块，ffmpeg启动失败时在返回响应之前抛出异常
+        return audio_format, self._start(self._transcode(cache_key, audio, source_format, audio_format))
+
+    @staticmethod
+    def _start(chunks: Iterator[bytes]) -> Iterator[bytes]:
+        try:
+            first_chunk = next(chunks)
+        except StopIteration:
+            return iter(())
+        return itertools.chain((first_chunk,), chunks)
+
+    def _transcode(self, cache_key: tuple, audio: bytes, source_format: str,
+                   audio_format: AudioFormat) -> Iterator[bytes]:
+        chunks = []
+        for chunk in self.transcoder.stream(audio, source_format, audio_format):
+            chunks.append(chunk)
+            yield chunk
+        # 完整转码后才写入缓存，中途断开的结果不缓存
+        self.audio_cache.put(cache_key, b"".join(chunks))
 
     def get_voices(self, type: str) -> list[dict[str, str]]:
         tts = self.get_strategy(type)
@@ -0,0 +1,60 @@
+import asyncio
+import logging
+import threading
+from typing import Any, Coroutine, Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncHttpClient():
+    '''基于aiohttp的连接池客户端
+
+    所有请求都运行在一个独立的后台事件循环线程上，复用同一个ClientSession，
+    同步代码（例如Django视图）通过 run 方法提交协程并等待结果
+    '''
+
+    limit: int
+    timeout: float
+
+    def __init__(self, limit: int = 16, timeout: float = 60) -> None:
+        self.limit = limit
+        self.timeout = timeout
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                background_thread = threading.Thread(
+                    target=loop.run_forever, name="async-http-client")
+                background_thread.daemon = True
+                background_thread.start()
+                self._loop = loop
+                logger.debug("=> Start AsyncHttpClient event loop")
+            return self._loop
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        '''获取连接池会话，只能在后台事件循环中调用'''
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit)
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    def run(self, coroutine: Coroutine[Any, Any, Any]) -> Any:
+        '''在后台事件循环中执行协程，并同步等待结果'''
+        loop = self._ensure_loop()
+        future = asyncio.run_coroutine_threadsafe(coroutine, loop)
+        return future.result()
+
+    def close(self) -> None:
+        if self._loop is None:
+            return
+        if self._session is not None and not self._session.closed:
+            self.run(self._session.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop = None
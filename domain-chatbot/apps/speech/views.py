@@ -1,14 +1,13 @@
-from io import BytesIO
-
 from django.shortcuts import render
-import os
 import json
 import logging
 from django.http import FileResponse
-from .translation import translationClient
+from .translation import translation_registry
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from .tts import single_tts_driver
+from .tts.audio_transcoder import AudioFormat, UnsupportedFormatError
+from .utils import uuid_generator
 from django.http import HttpResponse, StreamingHttpResponse
 
 logger = logging.getLogger(__name__)
@@ -17,6 +16,7 @@ logger = logging.getLogger(__name__)
 def generate(request):
     """
     Generate audio from text.
+    可选参数 format(opus/mp3/wav)、sample_rate、bitrate 指定输出的音频格式，默认保持合成原始格式
     """
     try:
         data = json.loads(request.body.decode('utf-8'))
@@ -24,32 +24,27 @@ def generate(request):
         voice_id = data["voice_id"]
         type = data["type"]
 
-        file_name = single_tts_driver.synthesis(
-            type=type, text=text, voice_id=voice_id)
-        file_path = os.path.join("tmp", file_name)
-
-        audio_file = BytesIO()
-        with open(file_path, 'rb') as file:
-            audio_file.write(file.read())
-
-        delete_file(file_path)
-        logger.debug(f"delete file :{file_path}")
+        audio_format = None
+        if data.get("format"):
+            audio_format = AudioFormat(format=data["format"],
+                                       sample_rate=data.get("sample_rate"),
+                                       bitrate=data.get("bitrate"))
 
-        audio_file.seek(0)
+        audio_format, audio_stream = single_tts_driver.synthesis_stream(
+            type=type, text=text, voice_id=voice_id, audio_format=audio_format)
+        file_name = uuid_generator.generate() + "." + audio_format.extension
 
         # Create the response object.
-        response = HttpResponse(content_type='audio/mpeg')
+        response = StreamingHttpResponse(audio_stream, content_type=audio_format.content_type)
         response['Content-Disposition'] = f'attachment; filename="{file_name}"'
-        response.write(audio_file.getvalue())
         return response
+    except UnsupportedFormatError as e:
+        logger.error(f"generate_audio invalid params: {e}")
+        return HttpResponse(status=400, content=f"Invalid params: {e}")
     except Exception as e:
         logger.error(f"generate_audio error: {e}")
         return HttpResponse(status=500, content="Failed to generate audio.")
 
-
-def delete_file(file_path):
-    os.remove(file_path)
-
 @api_view(['POST'])
 def get_voices(request):
     data = json.loads(request.body.decode('utf-8'))
@@ -60,13 +55,17 @@ def get_voices(request):
 def translation(request):
     """
     translation
+    传入 texts 列表时一次翻译多条文本，合并为一次批量翻译请求
     """
     try:
         data = json.loads(request.body.decode('utf-8'))
-        text = data["text"]
         target_language = data["target_language"]
-        target_result = translationClient.translation(
-            text=text, target_language=target_language)
+        if "texts" in data:
+            target_result = translation_registry.get().translation_batch(
+                texts=data["texts"], target_language=target_language)
+        else:
+            target_result = translation_registry.get().translation(
+                text=data["text"], target_language=target_language)
         return Response({"response": target_result, "code": "200"})
     except Exception as e:
         logger.error(f"translation error: {e}")